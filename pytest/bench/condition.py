@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+This script measures the latency from notifying a condition to the waiting
+thread running again, and the CPU time a thread spends waiting on a condition
+that is never notified. It compares :func:`~pytest.globals.Condition` with the
+condition that polled its waiter with sleeps of up to 50 ms, which
+:func:`~pytest.globals.Condition` returned before, and with the plain
+:class:`threading.Condition`, whose waits cannot be interrupted by signals
+and poll the same way when they have a timeout.
+
+Usage::
+
+    python pytest/bench/condition.py [rounds]
+"""
+
+import os
+import sys
+import time
+import types
+import random
+import thread
+import threading
+
+
+bench_dir = os.path.dirname(os.path.realpath(__file__))
+lib_dir = os.path.abspath(os.path.join(bench_dir, os.pardir, 'lib'))
+sys.path.insert(0, lib_dir)
+from pytest.globals import Condition, cpu_time, monotonic
+ROUNDS = 100
+#: The most seconds a waiter blocks before it is notified.
+PAUSE = 0.1
+IDLE = 2
+
+
+def PollingCondition(*args, **kwargs):
+    def wait(self, timeout=None):
+        waiter = thread.allocate_lock()
+        waiter.acquire()
+        self._Condition__waiters.append(waiter)
+        saved_state = self._release_save()
+        try:
+            delay = 0.0005
+            if timeout is not None:
+                endtime = time.time() + timeout
+            while True:
+                if waiter.acquire(0):
+                    return True
+                if timeout is None:
+                    delay = min(delay * 2, .05)
+                else:
+                    remaining = endtime - time.time()
+                    if remaining <= 0:
+                        try:
+                            self._Condition__waiters.remove(waiter)
+                        except ValueError:
+                            pass
+                        return False
+                    delay = min(delay * 2, remaining, .05)
+                time.sleep(delay)
+        finally:
+            self._acquire_restore(saved_state)
+    condition = threading.Condition(*args, **kwargs)
+    setattr(condition, 'wait', types.MethodType(wait, condition))
+    return condition
+
+
+def latency(factory, rounds):
+    """Notifies a waiting thread and measures when it runs again.
+
+    :param function factory: The function that creates the condition.
+    :param int rounds: The number of notifications.
+    :returns: The sorted latencies in seconds.
+    :rtype: list
+    """
+    condition = factory()
+    state = {'notified': None, 'latencies': [], 'waiting': False}
+
+    def wait():
+        with condition:
+            for i in range(rounds):
+                state['waiting'] = True
+                while state['notified'] is None:
+                    condition.wait()
+                state['latencies'].append(monotonic() - state['notified'])
+                state['notified'] = None
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    for i in range(rounds):
+        while True:
+            with condition:
+                if state['waiting'] and state['notified'] is None:
+                    state['waiting'] = False
+                    break
+            time.sleep(0.001)
+        # Let the waiter block for a while before it is notified
+        time.sleep(random.uniform(0, PAUSE))
+        with condition:
+            state['notified'] = monotonic()
+            condition.notify()
+    waiter.join()
+    return sorted(state['latencies'])
+
+
+def idle_cpu(factory, seconds):
+    """Measures the CPU time of a thread waiting with a timeout.
+
+    :param function factory: The function that creates the condition.
+    :param float seconds: The seconds to wait.
+    :returns: The CPU seconds of the process while waiting.
+    :rtype: float
+    """
+    condition = factory()
+    start = cpu_time()
+    with condition:
+        condition.wait(seconds)
+    return cpu_time() - start
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+    factories = [('polling', PollingCondition), ('pipe', Condition),
+                 ('threading', threading.Condition)]
+    for name, factory in factories:
+        times = latency(factory, rounds)
+        print('{0:<10}wake median {1:8.3f} ms   p99 {2:8.3f} ms   '
+              'max {3:8.3f} ms'.format(name, times[len(times) // 2] * 1000,
+                                       times[len(times) * 99 // 100] * 1000,
+                                       times[-1] * 1000))
+    for name, factory in factories:
+        print('{0:<10}idle CPU for {1} s: {2:.1f} ms'.format(
+            name, IDLE, idle_cpu(factory, IDLE) * 1000))
+
+
+if __name__ == '__main__':
+    main()
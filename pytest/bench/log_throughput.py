@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+This script measures how many lines per second :func:`~pytest.globals.log_empty`
+writes, the way boot transcripts are logged, against a stream handler and a
+file handler set up like a run. Lines are logged by one thread and then by
+several threads at once, and every line written is checked for its layout.
+
+Usage::
+
+    python pytest/bench/log_throughput.py [lines] [threads]
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+
+
+bench_dir = os.path.dirname(os.path.realpath(__file__))
+lib_dir = os.path.abspath(os.path.join(bench_dir, os.pardir, 'lib'))
+sys.path.insert(0, lib_dir)
+from pytest.globals import Formatter, add_log_setting, remove_log_setting
+from pytest.globals import log_empty
+LINES = 100000
+THREADS = 4
+FORMAT = '%(asctime)s - [%(levelname)s] %(message)s'
+MESSAGE = 'ok boot transcript line {0}'
+
+
+def log_lines(count, name):
+    """Logs lines, alternating bare and formatted lines.
+
+    :param int count: The number of lines.
+    :param str name: The name that marks the lines of this thread.
+    """
+    message = MESSAGE.format(name)
+    for i in xrange(count):
+        if i % 2:
+            logging.info(message)
+        else:
+            log_empty(message, level=logging.INFO)
+
+
+def measure(path, lines, threads):
+    """Logs lines to a file and checks the file.
+
+    :param str path: The path of the log file.
+    :param int lines: The number of lines of each thread.
+    :param int threads: The number of threads.
+    :returns: The lines per second.
+    :rtype: float
+    """
+    handler = logging.FileHandler(path, 'w')
+    handler.setLevel(logging.INFO)
+    stream = logging.StreamHandler(open(os.devnull, 'w'))
+    stream.setLevel(logging.INFO)
+    add_log_setting(handler, Formatter(FORMAT))
+    add_log_setting(stream, Formatter(FORMAT))
+    workers = [threading.Thread(target=log_lines, args=(lines, str(i)))
+               for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.time() - start
+    remove_log_setting(handler)
+    remove_log_setting(stream)
+    handler.close()
+    bare = formatted = 0
+    with open(path) as log_file:
+        for line in log_file:
+            if line.startswith('ok '):
+                bare += 1
+            elif ' - [INFO] ok ' in line:
+                formatted += 1
+    expected = lines * threads // 2
+    if bare != lines * threads - expected or formatted != expected:
+        print('Garbled layout: {0} bare and {1} formatted lines'
+              .format(bare, formatted))
+    return lines * threads / seconds
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else LINES
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else THREADS
+    logging.root.setLevel(logging.DEBUG)
+    path = tempfile.mktemp(prefix='pytest_log_', suffix='.log')
+    try:
+        for count in [1, threads]:
+            rate = measure(path, lines // count, count)
+            print('{0} thread(s): {1:10.0f} lines/s'.format(count, rate))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+This script measures the launch time of the pytest command line. A cold
+launch starts with an empty bytecode cache, a warm launch reuses the cache of
+the previous launch and an uncached launch compiles every module like the
+command line did before the bytecode cache.
+
+Usage::
+
+    python pytest/bench/startup.py [runs] [args]
+
+The args default to `--version`, which imports the framework and exits.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+
+bench_dir = os.path.dirname(os.path.realpath(__file__))
+pytest_dir = os.path.abspath(os.path.join(bench_dir, os.pardir))
+PYTEST = os.path.join(pytest_dir, 'bin', 'pytest')
+RUNS = 10
+
+
+def launch(args, path):
+    """Launches the command line once.
+
+    :param list args: The args of the command line.
+    :param str path: The bytecode cache directory or '' for no cache.
+    :returns: The seconds until the command line exited.
+    :rtype: float
+    """
+    env = dict(os.environ, PYTEST_BYTECODE_PATH=path)
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        subprocess.call([sys.executable, PYTEST] + args, env=env,
+                        stdout=devnull, stderr=devnull)
+        return time.time() - start
+
+
+def report(name, times):
+    times = sorted(times)
+    print('{0:<10}min {1:7.1f} ms   median {2:7.1f} ms   max {3:7.1f} ms'
+          .format(name, times[0] * 1000, times[len(times) // 2] * 1000,
+                  times[-1] * 1000))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    args = sys.argv[2:] or ['--version']
+    path = tempfile.mkdtemp(prefix='pytest_bytecode_')
+    try:
+        uncached = [launch(args, '') for i in range(runs)]
+        cold = []
+        for i in range(runs):
+            shutil.rmtree(path)
+            cold.append(launch(args, path))
+        warm = [launch(args, path) for i in range(runs)]
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    report('uncached', uncached)
+    report('cold', cold)
+    report('warm', warm)
+
+
+if __name__ == '__main__':
+    main()
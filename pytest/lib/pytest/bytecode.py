@@ -0,0 +1,148 @@
+"""
+This module caches the bytecode of the framework and the tests outside of the
+source tree.
+"""
+
+import os
+import sys
+import imp
+import struct
+import marshal
+import hashlib
+
+
+#: The directory of the bytecode cache. If the environment variable is set to
+#: an empty string, the cache is disabled.
+BYTECODE_PATH = os.environ.get('PYTEST_BYTECODE_PATH',
+                               os.path.join(os.path.expanduser('~'),
+                                            'pytest_cache', 'bytecode'))
+
+
+class BytecodeImporter(object):
+    """Imports the modules below the root directories from source and keeps
+    their code objects in the cache directory, so that a launch only compiles
+    the modules that changed since the last launch. A cache file is named
+    after the path of its source file and holds the magic number, the mtime
+    and the size of the source file before the marshalled code object. Modules
+    outside of the roots are left to the default import.
+
+    :param list roots: The directories of the modules to cache.
+    :param str path: The directory of the cache files.
+    """
+
+    def __init__(self, roots, path=BYTECODE_PATH):
+        self.roots = [os.path.join(os.path.realpath(root), '')
+                      for root in roots]
+        self.path = path
+        self.magic = imp.get_magic()
+
+    def find_module(self, fullname, path=None):
+        """Finds the source of a module below the roots.
+
+        :param str fullname: The full name of the module.
+        :param list path: The `__path__` of the parent package or `None` for
+            a top-level module.
+        :returns: The importer or `None` if the module is not cached.
+        """
+        name = fullname.rpartition('.')[2]
+        for directory in (path if path is not None else sys.path):
+            directory = os.path.realpath(directory or os.curdir)
+            if not any(os.path.join(directory, '').startswith(root)
+                       for root in self.roots):
+                continue
+            package = os.path.join(directory, name)
+            if os.path.isfile(os.path.join(package, '__init__.py')):
+                return _Loader(self, fullname,
+                               os.path.join(package, '__init__.py'), package)
+            if os.path.isdir(package):
+                continue
+            source = package + '.py'
+            if os.path.isfile(source):
+                return _Loader(self, fullname, source)
+        return None
+
+    def cache_path(self, source):
+        return os.path.join(self.path,
+                            hashlib.sha1(source).hexdigest() + '.pyc')
+
+    def get_code(self, source):
+        """Reads the code object of a source file from the cache or compiles
+        it and writes the cache file.
+
+        :param str source: The path of the source file.
+        :returns: The code object.
+        """
+        stat = os.stat(source)
+        header = self.magic + struct.pack('<II', int(stat.st_mtime) &
+                                          0xFFFFFFFF, stat.st_size &
+                                          0xFFFFFFFF)
+        cache = self.cache_path(source)
+        try:
+            with open(cache, 'rb') as cache_file:
+                data = cache_file.read()
+            if data.startswith(header):
+                return marshal.loads(data[len(header):])
+        except (IOError, ValueError, EOFError, TypeError):
+            pass
+        with open(source, 'rU') as source_file:
+            code = compile(source_file.read() + '\n', source, 'exec',
+                           dont_inherit=True)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            temp = '{0}.{1}'.format(cache, os.getpid())
+            with open(temp, 'wb') as cache_file:
+                cache_file.write(header + marshal.dumps(code))
+            os.rename(temp, cache)
+        except (IOError, OSError):
+            pass
+        return code
+
+
+class _Loader(object):
+    """Loads a module found by :class:`BytecodeImporter`.
+    """
+
+    def __init__(self, importer, fullname, source, package=None):
+        self.importer = importer
+        self.fullname = fullname
+        self.source = source
+        self.package = package
+
+    def load_module(self, fullname):
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+        code = self.importer.get_code(self.source)
+        module = imp.new_module(fullname)
+        module.__file__ = self.source
+        module.__loader__ = self
+        if self.package is not None:
+            module.__path__ = [self.package]
+            module.__package__ = fullname
+        else:
+            module.__package__ = fullname.rpartition('.')[0]
+        sys.modules[fullname] = module
+        try:
+            exec(code, module.__dict__)
+        except BaseException:
+            sys.modules.pop(fullname, None)
+            raise
+        return sys.modules[fullname]
+
+
+def install(roots, path=BYTECODE_PATH):
+    """Caches the bytecode of the modules below the roots in a directory
+    outside of the source tree. Python 3.8 and later write their bytecode to
+    `sys.pycache_prefix` instead.
+
+    :param list roots: The directories of the modules to cache.
+    :param str path: The directory of the cache files. If this is empty, the
+        bytecode is not cached.
+    """
+    if not path:
+        return
+    if hasattr(sys, 'pycache_prefix'):
+        sys.pycache_prefix = path
+        sys.dont_write_bytecode = False
+        return
+    sys.meta_path.insert(0, BytecodeImporter(roots, path))
@@ -0,0 +1,163 @@
+"""
+This module provides the result cache of incremental runs.
+"""
+
+import os
+import time
+import hashlib
+import inspect
+import logging
+from pytest import environment
+from pytest.globals import (Lock, LockError, PYTEST_CACHE_PATH, check_make_dir,
+                            str_error)
+
+
+RESULTS = 'results'
+#: The (subsystem, user type, command) tuples whose output identifies the
+#: firmware and software of a system.
+FINGERPRINT = [('SP', 'ilom', 'version'),
+               ('SP', 'sunservice', 'fpga version'),
+               ('HOST', 'solaris', 'uname -a')]
+
+
+class ResultCache(object):
+    """Cache of passed testcases shared by every run of the user. A testcase
+    is keyed by the content of its module, its class and testcase arguments
+    and the fingerprint of the systems. If any of them change, the testcase
+    is run again.
+
+    :param str path: The path of the cache file.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(PYTEST_CACHE_PATH, RESULTS)
+        check_make_dir(os.path.dirname(path), error=True)
+        self.lock = Lock(path, 'a')
+        self.fingerprint = None
+        self.modules = {}
+
+    def load(self, acquire=True, release=True):
+        data = self.lock.download(acquire=acquire, release=release,
+                                  exit=False)
+        if type(data) is not dict:
+            data = {}
+        data.setdefault('results', {})
+        return data
+
+    def get_fingerprint(self):
+        """Gets the fingerprint of the systems in the environment. The outputs
+        of the :data:`FINGERPRINT` commands are read once per run. If an
+        output cannot be read, for example `uname -a` while the host is down,
+        the systems are not fingerprinted and the result cache is not used.
+
+        :returns: The fingerprint or `None` if a system could not be
+            fingerprinted.
+        :rtype: str
+        """
+        if self.fingerprint is not None:
+            return self.fingerprint or None
+        self.fingerprint = ''
+        strings = []
+        for system in environment.SYSTEMS:
+            outputs = read_fingerprint(system)
+            if None in outputs:
+                logging.warning('Could not fingerprint ' + system.name +
+                                '. Not using the result cache...')
+                return None
+            strings.append(system.name + '\n' + '\n'.join(outputs))
+        self.fingerprint = hashlib.sha1('\n'.join(strings)).hexdigest()
+        return self.fingerprint
+
+    def key(self, module, class_name, class_args, class_kwargs, method_name,
+            method_args, method_kwargs):
+        """Gets the key of a testcase.
+
+        :returns: The key or `None` if the systems could not be fingerprinted.
+        :rtype: str
+        """
+        fingerprint = self.get_fingerprint()
+        if fingerprint is None:
+            return None
+        if module.__name__ not in self.modules:
+            source_file = open(inspect.getsourcefile(module), 'rb')
+            try:
+                source = source_file.read()
+            finally:
+                source_file.close()
+            self.modules[module.__name__] = hashlib.sha1(source).hexdigest()
+        strings = [self.modules[module.__name__], fingerprint, class_name,
+                   repr(class_args), repr(sorted(class_kwargs.items())),
+                   method_name, repr(method_args),
+                   repr(sorted(method_kwargs.items()))]
+        return hashlib.sha1('\n'.join(strings)).hexdigest()
+
+    def passed(self, key):
+        """Gets the time the testcase last passed.
+
+        :param str key: The key of the testcase.
+        :returns: The time or `None` if the testcase has not passed.
+        :rtype: float
+        """
+        if key is None:
+            return None
+        try:
+            return self.load()['results'].get(key)
+        except LockError:
+            return None
+
+    def record(self, key, passed):
+        """Records the result of a testcase. A testcase that did not pass is
+        removed from the cache.
+
+        :param str key: The key of the testcase.
+        :param bool passed: The flag for passing.
+        """
+        if key is None:
+            return
+        try:
+            data = self.load(release=False)
+        except LockError as e:
+            logging.warning('Could not record result\n' + str_error(e))
+            return
+        if passed:
+            data['results'][key] = time.time()
+        else:
+            data['results'].pop(key, None)
+        self.lock.upload(data, exit=False)
+
+
+def read_fingerprint(system):
+    """Reads the outputs of the :data:`FINGERPRINT` commands on a system.
+
+    :param System system: The system.
+    :returns: The list of outputs. An output is '' if the system has no such
+        user and `None` if it could not be read.
+    :rtype: list
+    """
+    outputs = []
+    for subsystem, user_type, command in FINGERPRINT:
+        try:
+            users = system.subsystems[subsystem].users
+        except KeyError:
+            outputs.append('')
+            continue
+        names = [name for name in sorted(users)
+                 if users[name].type == user_type]
+        if not names:
+            outputs.append('')
+            continue
+        output = None
+        try:
+            connection = system.get_connection('SSH', subsystem, names[0],
+                                               log=False)
+            try:
+                output = connection.sendcmd(command, debug=False).strip()
+            finally:
+                connection.close(log=False)
+        except Exception as e:
+            logging.debug('Could not run {0} on {1}\n'.format(command,
+                                                              system.name) +
+                          str_error(e))
+        outputs.append(output)
+    return outputs
@@ -0,0 +1,245 @@
+"""
+This module provides console captures that are spilled to disk.
+"""
+
+import os
+import gzip
+import shutil
+import tempfile
+import logging
+from pytest.globals import check_make_dir, log_empty
+
+
+#: The markers that are indexed while a capture is written. A line is indexed
+#: under every marker that is in the line with its spaces removed, since the
+#: console sometimes breaks up words.
+MARKERS = ['ERROR:', 'WARNING:', 'NOTICE:', 'TPM', 'panic']
+SEGMENT_LINES = 10000
+CAPTURE_PATH = os.path.join(tempfile.gettempdir(), 'pytest_captures')
+#: The captures whose segment files were not removed, in the order they were
+#: created.
+CAPTURES = []
+
+
+class Capture(object):
+    """Console output written line by line to gzip segment files. Only the
+    lines of the current segment and the line numbers of the markers are kept
+    in memory, and lines are read back from the segments when they are needed.
+    The segment files are removed when a `with` block of the capture ends, or
+    by :func:`remove_captures` when the testcase ends.
+
+    For example::
+
+        prompts = ['(?i)Console Login:', TimeoutError]
+        with connection.capture(prompts) as capture:
+            for line in capture.find('ERROR:'):
+                logging.info(line)
+
+    :ivar str path: The directory of the segment files.
+    :ivar int lines: The number of lines written.
+    :ivar dict index: The sorted line numbers of each marker.
+    :param str name: The prefix of the directory of the segment files.
+    :param str path: The directory to create the capture directory in.
+    :param int segment: The number of lines in a segment file.
+    """
+
+    def __init__(self, name='capture', path=CAPTURE_PATH,
+                 segment=SEGMENT_LINES):
+        check_make_dir(path, error=True)
+        self.path = tempfile.mkdtemp(prefix=name + '_', dir=path)
+        self.segment = segment
+        self.segments = 0
+        self.lines = 0
+        self.index = dict((marker, []) for marker in MARKERS)
+        self.current = []
+        self.partial = ''
+        self.blank = True
+        CAPTURES.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.remove()
+
+    def __contains__(self, string):
+        """Checks if a string is in the output like :meth:`str.__contains__`.
+        A string without a newline is searched line by line.
+        """
+        if '\n' in string:
+            return string in str(self)
+        return any(string in line for line in self.slice())
+
+    def __len__(self):
+        return self.lines + (1 if self.partial else 0)
+
+    def __nonzero__(self):
+        return not self.blank
+
+    def __iter__(self):
+        return self.slice()
+
+    def __str__(self):
+        return '\n'.join(self.slice())
+
+    def write(self, data):
+        """Writes output to the capture. Output after the last newline is kept
+        until the next write or :meth:`close`.
+
+        :param str data: The output.
+        """
+        lines = (self.partial + data.replace('\r', '')).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.add(line)
+
+    def add(self, line):
+        """Adds a complete line, indexes its markers and writes the segment
+        file once the segment is full.
+
+        :param str line: The line without the newline.
+        """
+        if self.blank and line.strip():
+            self.blank = False
+        stripped = line.replace(' ', '')
+        for marker in MARKERS:
+            if marker in stripped:
+                self.index[marker].append(self.lines)
+        self.current.append(line)
+        self.lines += 1
+        if len(self.current) >= self.segment:
+            self.spill()
+
+    def spill(self):
+        """Writes the lines of the current segment to its segment file.
+        """
+        segment_file = gzip.open(self.segment_path(self.segments), 'wb')
+        try:
+            segment_file.write('\n'.join(self.current) + '\n')
+        finally:
+            segment_file.close()
+        self.segments += 1
+        self.current = []
+
+    def close(self):
+        """Ends the last line and writes the current segment to disk.
+        """
+        if self.partial:
+            self.add(self.partial)
+            self.partial = ''
+        if self.current:
+            self.spill()
+
+    def remove(self):
+        """Removes the segment files of the capture.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self in CAPTURES:
+            CAPTURES.remove(self)
+
+    def segment_path(self, segment):
+        return os.path.join(self.path, '{0:05d}.gz'.format(segment))
+
+    def read_segment(self, segment):
+        """Reads the lines of a segment.
+
+        :param int segment: The number of the segment.
+        :returns: The list of lines.
+        :rtype: list
+        """
+        if segment == self.segments:
+            return self.current[:]
+        segment_file = gzip.open(self.segment_path(segment), 'rb')
+        try:
+            return segment_file.read().split('\n')[:-1]
+        finally:
+            segment_file.close()
+
+    def slice(self, start=0, stop=None):
+        """Reads a range of lines. Only the segments in the range are read.
+
+        :param int start: The number of the first line.
+        :param int stop: The number of the line after the last line. If this
+            is `None`, the lines are read until the end.
+        :returns: The generator of the lines.
+        :rtype: generator
+        """
+        partial = self.partial and (stop is None or stop > self.lines)
+        if stop is None or stop > self.lines:
+            stop = self.lines
+        line = start
+        while line < stop:
+            segment = line // self.segment
+            lines = self.read_segment(segment)
+            first = segment * self.segment
+            for string in lines[line - first:stop - first]:
+                yield string
+            line = first + len(lines)
+        if partial:
+            yield self.partial
+
+    def splitlines(self):
+        """Reads all lines lazily like :meth:`str.splitlines`.
+
+        :returns: The generator of the lines.
+        :rtype: generator
+        """
+        return self.slice()
+
+    def find(self, *markers):
+        """Reads the lines of markers from the index. Each segment is read at
+        most once.
+
+        :param markers: The markers from :data:`MARKERS`.
+        :returns: The list of lines in order.
+        :rtype: list
+        """
+        numbers = set()
+        for marker in markers:
+            numbers.update(self.index[marker])
+        lines = []
+        segment = None
+        for number in sorted(numbers):
+            if number // self.segment != segment:
+                segment = number // self.segment
+                segment_lines = self.read_segment(segment)
+            lines.append(segment_lines[number - segment * self.segment])
+        return lines
+
+    def log(self, level=logging.INFO, logger=logging):
+        """Logs the capture one segment at a time without the prefix.
+
+        :param int level: The level to log.
+        :param logger: The logger or list of loggers.
+        """
+        for segment in range(self.segments + 1):
+            lines = self.read_segment(segment)
+            if segment == self.segments and self.partial:
+                lines.append(self.partial)
+            if lines:
+                log_empty('\n'.join(lines), level=level, logger=logger)
+
+
+def text_capture(name, text):
+    """Creates a closed capture of a text, so that functions that capture
+    output can return a capture when there is no output.
+
+    :param str name: The prefix of the directory of the segment files.
+    :param str text: The text.
+    :returns: The capture.
+    :rtype: Capture
+    """
+    capture = Capture(name)
+    capture.write(text)
+    capture.close()
+    return capture
+
+
+def remove_captures(keep=()):
+    """Removes the segment files of the captures that were not removed.
+
+    :param set keep: The captures to keep, like the captures in
+        :data:`CAPTURES` when a testcase started.
+    """
+    for capture in [capture for capture in CAPTURES if capture not in keep]:
+        capture.remove()
@@ -0,0 +1,84 @@
+"""
+This module provides the checkpoints of a run, which let a run that died be
+resumed.
+"""
+
+import os
+import json
+import time
+import errno
+import threading
+
+
+class Checkpoint(object):
+    """Checkpoints of the finished testcases appended to a file as JSON lines.
+    A line is written with a single write to a file opened for appending, so a
+    run that dies keeps every testcase it finished and forked workers can
+    share the file. When a run is resumed from a checkpoint file, the
+    finished testcases are read back and new checkpoints are appended to the
+    same file.
+
+    :ivar dict completed: The checkpoints by key read from the file. A
+        testcase run twice by the same run is not skipped the second time, so
+        checkpoints recorded by this run are not added.
+    :param str path: The path of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}
+        ended = True
+        try:
+            with open(path) as checkpoint_file:
+                for line in checkpoint_file:
+                    ended = line.endswith('\n')
+                    try:
+                        checkpoint = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.completed[checkpoint['key']] = checkpoint
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        self.lock = threading.Lock()
+        if not ended:
+            # The last line was cut off when the run died
+            os.write(self.fd, '\n')
+
+    def get(self, key):
+        """Gets the checkpoint of a finished testcase.
+
+        :param str key: The key of :func:`get_key`.
+        :returns: The checkpoint or `None` if the testcase did not finish.
+        :rtype: dict
+        """
+        return self.completed.get(key)
+
+    def record(self, key, **fields):
+        """Appends the checkpoint of a finished testcase.
+
+        :param str key: The key of :func:`get_key`.
+        :param fields: The outcome, like the counts `passed`, `failed`,
+            `issues` and `aborted`.
+        """
+        checkpoint = dict(fields, key=key, time=time.time())
+        line = json.dumps(checkpoint, sort_keys=True) + '\n'
+        with self.lock:
+            os.write(self.fd, line)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_key(systems, module_name, class_name, class_args, class_kwargs,
+            method_name, method_args, method_kwargs):
+    """Gets the key of a testcase run against systems.
+
+    :param list systems: The names of the systems.
+    :returns: The key.
+    :rtype: str
+    """
+    return json.dumps([systems, module_name, class_name, class_args,
+                       class_kwargs, method_name, method_args, method_kwargs],
+                      sort_keys=True)
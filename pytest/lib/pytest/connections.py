@@ -2,15 +2,24 @@
 This module provides connection classes.
 """
 
+import os
 import time
 import logging
 import traceback
 from pexpect import spawn, EOF
 from pexpect import TIMEOUT as TimeoutError
-from pytest.globals import log_empty, str_error
+from pytest import events, transcript
+from pytest.globals import (log_empty, str_error, monotonic, timed, Timing,
+                            REMOTE_WAIT, CONNECTION_SETUP)
+from pytest.capture import Capture
+from pytest.timeline import Timeline, POWER_ON
 
 
 TIMEOUT = 10
+#: The command of the simulator in :mod:`~pytest.simulator`. If this is set,
+#: SSH and Console connections spawn the simulator instead of `ssh` and
+#: `ltconsole`.
+SIMULATOR = os.environ.get('PYTEST_SIMULATOR')
 
 
 class ConnectionError(Exception):
@@ -27,26 +36,48 @@ class Connection(spawn):
     :ivar str address: The address for the connection.
     :ivar str password: The password of the user.
     :ivar str prompt: The prompt of the user.
+    :ivar Timeline timeline: The timeline the output is fed to or `None`.
+    :ivar Timeline last_timeline: The last finished timeline or `None`.
+    :ivar Transcript transcript: The transcript the bytes sent and read are
+        recorded to or `None`.
+    :ivar Player player: The player of the transcript that is served instead
+        of spawning the command, or `None`.
     :param str command: The connection command to spawn.
     :param str user: The user for the connection.
     :param str address: The address for the connection.
     :param str password: The password of the user.
     :param str prompt: The prompt of the user.
     :param str name: The printable name of the connection.
+    :param Player player: The player to serve. If this is `None` and
+        transcripts are replayed, the next transcript of the name is served.
     :param kwargs: The keyword arguments of :class:`~pexpect.spawn`.
     """
     CONNECTIONS = []
 
     def __init__(self, command, user, address, password, prompt,
-                 name=None, log=True, **kwargs):
+                 name=None, log=True, player=None, **kwargs):
+        self.timeline = None
+        self.last_timeline = None
+        self.transcript = None
+        if name is None:
+            name = '{0}@{1}'.format(user, address)
+        if player is None:
+            player = transcript.open_player(name)
+        self.player = player
+        if player is not None:
+            command = None
         super(Connection, self).__init__(command, **kwargs)
+        if player is not None:
+            self.closed = False
         self.user = user
         self.address = address
         self.password = password
         self.prompt = prompt
-        if name is None:
-            name = '{0}@{1}'.format(user, address)
         self.name = name
+        self.opened = monotonic()
+        self.transcript = transcript.open_transcript(name)
+        events.emit('connection open', connection=name,
+                    type=type(self).__name__, user=user, address=address)
         self.__class__.CONNECTIONS.append(self)
         if type(self) is not Connection:
             Connection.CONNECTIONS.append(self)
@@ -61,7 +92,14 @@ class Connection(spawn):
         """Closes the connection.
         """
         if not self.closed:
-            super(Connection, self).close()
+            if self.player is not None:
+                self.closed = True
+                self.player.finish()
+            else:
+                super(Connection, self).close()
+            if self.transcript is not None:
+                self.transcript.close()
+                self.transcript = None
             self.__class__.CONNECTIONS.remove(self)
             if type(self) is not Connection:
                 Connection.CONNECTIONS.remove(self)
@@ -71,6 +109,13 @@ class Connection(spawn):
                     system.connections.remove(self)
                 except Exception:
                     pass
+            try:
+                system = self.current[0].name
+            except AttributeError:
+                system = None
+            events.emit('connection close', connection=self.name,
+                        type=type(self).__name__, system=system,
+                        duration=monotonic() - self.opened)
             if type(self) is Connection:
                 message = 'Closed connection ' + self.name
             else:
@@ -85,6 +130,99 @@ class Connection(spawn):
         if log:
             logging.info(message)
 
+    def expect_loop(self, searcher, timeout=-1, searchwindowsize=-1):
+        """Expects like :meth:`~pexpect.spawn.expect_loop` and counts the
+        wait in the remote wait timing bucket.
+        """
+        with Timing(REMOTE_WAIT):
+            return super(Connection, self).expect_loop(searcher, timeout,
+                                                       searchwindowsize)
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """Reads the output like :meth:`~pexpect.spawn.read_nonblocking` and
+        feeds it to the timeline if one is started and the transcript if one
+        is open. If a player is served, the output is read from its
+        transcript.
+        """
+        if self.player is not None:
+            if timeout == -1:
+                timeout = self.timeout
+            data = self.player.read(size, timeout)
+            if data is None:
+                raise TimeoutError('Timeout exceeded in the transcript of ' +
+                                   self.name)
+        else:
+            data = super(Connection, self).read_nonblocking(size, timeout)
+        if self.timeline is not None:
+            self.timeline.feed(data)
+        if self.transcript is not None:
+            self.transcript.write(transcript.READ, data)
+        return data
+
+    def send(self, s):
+        """Sends the string like :meth:`~pexpect.spawn.send` and records the
+        bytes written in the transcript if one is open. The password is
+        recorded as :data:`~pytest.transcript.REDACTED`. If a player is
+        served, the string is compared with its transcript instead.
+        """
+        data = s
+        if self.password and s == self.password:
+            data = transcript.REDACTED
+        if self.player is not None:
+            count = len(s)
+            self.player.send(data)
+        else:
+            count = super(Connection, self).send(s)
+            if count < len(s):
+                data = s[:count]
+        if self.transcript is not None:
+            self.transcript.write(transcript.SEND, data)
+        return count
+
+    def isalive(self):
+        if self.player is not None:
+            return not self.closed
+        return super(Connection, self).isalive()
+
+    def start_timeline(self, name=POWER_ON, start=None):
+        """Starts timestamping the output in a
+        :class:`~pytest.timeline.Timeline`. If a timeline is already started,
+        it is kept.
+
+        :param str name: The name of the first milestone.
+        :param float start: The monotonic time of the first milestone. If this
+            is `None`, the current time is used.
+        :returns: The started timeline.
+        :rtype: Timeline
+        """
+        if self.timeline is None:
+            self.timeline = Timeline(name, start=start)
+        return self.timeline
+
+    def stop_timeline(self, system=None, log=True):
+        """Stops the timeline and records its phases in the run metrics.
+
+        :param str system: The name of the system. If this is `None`, the name
+            of the current system is used.
+        :param bool log: The flag for allowing info messages.
+        :returns: The stopped timeline or `None` if none was started.
+        :rtype: Timeline
+        """
+        timeline = self.timeline
+        if timeline is None:
+            return None
+        self.timeline = None
+        if system is None:
+            try:
+                system = self.current[0].name
+            except AttributeError:
+                system = self.name
+        timeline.record(system)
+        self.last_timeline = timeline
+        if log:
+            log_empty(str(timeline), level=logging.INFO)
+        return timeline
+
     @classmethod
     def close_all(cls, log=True):
         """Closes all connections currently open. If this method is called from
@@ -139,6 +277,43 @@ class Connection(spawn):
                 logging.debug('\n' + string)
         return string
 
+    def capture(self, prompt=None, timeout=-1, capture=None):
+        """Syncs with the prompt like :meth:`sync`, but the output is written
+        line by line to a :class:`~pytest.capture.Capture` instead of being
+        kept in the buffer. The memory used does not grow with the output.
+
+        :param prompt: The prompt or list of prompts to expect. If this is
+            `None`, the connection's default prompt is used.
+        :param int timeout: The timeout value of expecting the prompt.
+        :param Capture capture: The capture to write to. If this is `None`, a
+            new capture is created.
+        :returns: The closed capture of the output until the prompt.
+        :rtype: Capture
+        """
+        if prompt is None:
+            prompt = self.prompt
+        if type(prompt) is not list:
+            prompt = [prompt]
+        if timeout == -1:
+            timeout = self.timeout
+        if capture is None:
+            capture = Capture()
+        patterns = self.compile_pattern_list(prompt + ['\n'])
+        end_time = None
+        if timeout is not None:
+            end_time = monotonic() + timeout
+        while True:
+            if end_time is not None:
+                # A negative timeout still matches what is buffered
+                timeout = end_time - monotonic()
+            index = self.expect_list(patterns, timeout=timeout)
+            if index != len(prompt):
+                break
+            capture.write(self.before + '\n')
+        capture.write(self.before)
+        capture.close()
+        return capture
+
     def sendcmd(self, command='', prompt=None, index=1, timeout=-1, log=False,
                 output=True, debug=True, after=False):
         """Sends the command and returns the output.
@@ -187,11 +362,14 @@ class SSH(Connection):
 
     CONNECTIONS = []
 
+    @timed(CONNECTION_SETUP)
     def __init__(self, user, address, password, prompt, name=None, log=True,
                  **kwargs):
         command = ('/usr/bin/ssh -o UserKnownHostsFile=/dev/null ' +
                    '-o StrictHostKeyChecking=no ' +
                    '-l {0} {1}'.format(user, address))
+        if SIMULATOR is not None:
+            command = SIMULATOR + ' ' + command[len('/usr/bin/'):]
         super(SSH, self).__init__(command, user, address, password, prompt,
                                   name=name, log=log, **kwargs)
         if log:
@@ -282,10 +460,13 @@ class SSH(Connection):
 class Console(Connection):
     CONNECTIONS = []
 
+    @timed(CONNECTION_SETUP)
     def __init__(self, user, address, password, prompt, name=None, force=True,
                  login=True, log=True, **kwargs):
         # TODO: Allow connecting from the west coast
         command = '/net/aegis/export/ltconsole/bin/ltconsole ' + address
+        if SIMULATOR is not None:
+            command = SIMULATOR + ' ltconsole ' + address
         super(Console, self).__init__(command, user, address, password, prompt,
                                       name=name, log=log, **kwargs)
         if log:
@@ -366,9 +547,54 @@ class Console(Connection):
             raise ConnectionError('Login incorrect')
 
 
+class Replay(Connection):
+    """Connection that serves a transcript of :mod:`~pytest.transcript`
+    instead of connecting to a system, so code that parses the output of
+    :meth:`~Connection.sendcmd`, :meth:`~Connection.sync` and
+    :meth:`~pexpect.spawn.expect` can be run again without the system. A
+    command sent that differs from the transcript raises
+    :class:`~pytest.transcript.DivergenceError`.
+
+    For example::
+
+        connection = Replay(path, 'root@host:~# ')
+        output = connection.sendcmd('tpmadm status')
+
+    :param str path: The path of the transcript.
+    :param str prompt: The prompt of the user.
+    :param str user: The user for the connection.
+    :param str address: The address for the connection.
+    :param str password: The password of the user.
+    :param str name: The printable name of the connection. If this is `None`,
+        the name recorded in the transcript is used.
+    :param bool delay: The flag for returning output no sooner than it was
+        recorded.
+    :param bool strict: The flag for raising divergences. Otherwise they are
+        logged and kept in :attr:`Player.divergences
+        <pytest.transcript.Player.divergences>`.
+    :param kwargs: The keyword arguments of :class:`~pexpect.spawn`.
+    """
+
+    CONNECTIONS = []
+
+    def __init__(self, path, prompt, user=None, address=None, password=None,
+                 name=None, delay=False, strict=True, log=True, **kwargs):
+        player = transcript.Player(path, delay=delay, strict=strict)
+        if name is None:
+            name = player.name
+        super(Replay, self).__init__(None, user, address, password, prompt,
+                                     name=name, log=log, player=player,
+                                     **kwargs)
+
+    @property
+    def divergences(self):
+        return self.player.divergences
+
+
 class BUI(object):
     CONNECTIONS = []
 
+    @timed(CONNECTION_SETUP)
     def __init__(self, user, address, password, name, log=True):
         self.username = user
         self.password = password
@@ -383,6 +609,9 @@ class BUI(object):
             self.driver.get(self.address)
             Connection.CONNECTIONS.append(self)
             self.__class__.CONNECTIONS.append(self)
+            self.opened = monotonic()
+            events.emit('connection open', connection=name, type='BUI',
+                        user=user, address=self.address)
         except Exception as e:
             print(str_error(e))
             raise ConnectionError("Failed to Establish BUI connection " + name)
@@ -394,6 +623,8 @@ class BUI(object):
         try:
             Connection.CONNECTIONS.remove(self)
             self.__class__.CONNECTIONS.remove(self)
+            events.emit('connection close', connection=self.address,
+                        type='BUI', duration=monotonic() - self.opened)
             self._logout()
             self.driver.quit()
         except:
@@ -0,0 +1,190 @@
+"""
+This module provides the result counters of a run in a memory mapped file,
+which monitors can read while the run goes on.
+"""
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import thread
+
+
+MAGIC = 'PYTESTCT'
+VERSION = 1
+#: The states counted, in the order of their slots.
+STATES = ('passed', 'failed', 'issue', 'abort')
+#: The magic, version, number of states and sequence number.
+HEADER = struct.Struct('<8sIIQ')
+#: The total and latest count of a state.
+SLOT = struct.Struct('<QQ')
+SEQUENCE_OFFSET = 16
+SIZE = HEADER.size + SLOT.size * len(STATES)
+#: The times a reader retries while the sequence number is odd or changes,
+#: and the seconds it sleeps between the retries after the first ones.
+READ_RETRIES = 1000
+READ_DELAY = 0.001
+
+
+class CounterError(Exception):
+    pass
+
+
+class Counters(object):
+    """Block of result counters in a memory mapped file. The block starts with
+    a header of the magic, the version, the number of states and a sequence
+    number, followed by the total and latest count of each state of
+    :data:`STATES` as unsigned 64 bit integers. Writers take a `flock` on the
+    file, make the sequence number odd, update the counts and make it even
+    again. Readers take no lock: they retry while the sequence number is odd
+    or changes during the read. A writer that died while it held the lock
+    leaves the sequence number odd, so the next writer makes it even first.
+    Forked workers share the block.
+
+    :param str path: The path of the file, which is created if it does not
+        exist.
+    :raises: :class:`CounterError` if the file is not a counter block of this
+        version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self.fd = None
+        self.lock = thread.allocate_lock()
+        self.open()
+        with self.locked():
+            if os.fstat(self.fd).st_size < SIZE:
+                os.ftruncate(self.fd, SIZE)
+                header = HEADER.pack(MAGIC, VERSION, len(STATES), 0)
+                os.write(self.fd, header)
+        self.map = mmap.mmap(self.fd, SIZE)
+        check_header(self.map)
+
+    def open(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.pid = os.getpid()
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0644)
+
+    def locked(self):
+        return _Locked(self)
+
+    def increment(self, state, count=1):
+        """Adds to the total and latest count of a state.
+
+        :param str state: The state of :data:`STATES`.
+        :param int count: The number to add.
+        """
+        offset = HEADER.size + SLOT.size * STATES.index(state)
+        with self.locked():
+            total, latest = SLOT.unpack_from(self.map, offset)
+            SLOT.pack_into(self.map, offset, total + count, latest + count)
+
+    def reset_latest(self):
+        """Sets the latest counts to 0, for example when a run starts.
+        """
+        with self.locked():
+            for i in range(len(STATES)):
+                offset = HEADER.size + SLOT.size * i
+                total = SLOT.unpack_from(self.map, offset)[0]
+                SLOT.pack_into(self.map, offset, total, 0)
+
+    def read(self):
+        return read_block(self.map)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class _Locked(object):
+    def __init__(self, counters):
+        self.counters = counters
+
+    def __enter__(self):
+        counters = self.counters
+        counters.lock.acquire()
+        try:
+            if counters.pid != os.getpid():
+                # The flock of the parent's file descriptor is shared
+                counters.open()
+            fcntl.flock(counters.fd, fcntl.LOCK_EX)
+        except BaseException:
+            counters.lock.release()
+            raise
+        self.map = getattr(counters, 'map', None)
+        if self.map is not None:
+            if self.get_sequence() % 2:
+                # A writer died while it held the lock
+                self.set_sequence(1)
+            self.set_sequence(1)
+
+    def __exit__(self, *exc_info):
+        if self.map is not None:
+            self.set_sequence(1)
+        fcntl.flock(self.counters.fd, fcntl.LOCK_UN)
+        self.counters.lock.release()
+
+    def get_sequence(self):
+        return struct.unpack_from('<Q', self.map, SEQUENCE_OFFSET)[0]
+
+    def set_sequence(self, step):
+        struct.pack_into('<Q', self.map, SEQUENCE_OFFSET,
+                         self.get_sequence() + step)
+
+
+def check_header(data):
+    magic, version, states, sequence = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or states != len(STATES):
+        raise CounterError('Not a version {0} counter block'.format(VERSION))
+
+
+def read_block(data):
+    """Reads the counts of a counter block without a lock.
+
+    :param data: The block, like an :class:`mmap.mmap` of the file.
+    :returns: The dictionary of states to total counts with the dictionary of
+        states to latest counts under `latest`.
+    :rtype: dict
+    :raises: :class:`CounterError` if no consistent read was made after
+        :data:`READ_RETRIES` tries, like when a writer died while it held the
+        lock and no writer came after it.
+    """
+    check_header(data)
+    for retry in range(READ_RETRIES):
+        if retry > 10:
+            time.sleep(READ_DELAY)
+        sequence = struct.unpack_from('<Q', data, SEQUENCE_OFFSET)[0]
+        if sequence % 2:
+            continue
+        slots = [SLOT.unpack_from(data, HEADER.size + SLOT.size * i)
+                 for i in range(len(STATES))]
+        if struct.unpack_from('<Q', data, SEQUENCE_OFFSET)[0] == sequence:
+            break
+    else:
+        raise CounterError('The counts kept changing or a writer died')
+    counts = dict((state, slot[0]) for state, slot in zip(STATES, slots))
+    counts['latest'] = dict((state, slot[1])
+                            for state, slot in zip(STATES, slots))
+    return counts
+
+
+def read(path):
+    """Reads the counts of a counter file without a lock, the way a monitor
+    does.
+
+    :param str path: The path of the file.
+    :returns: See :func:`read_block`.
+    :rtype: dict
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        data = mmap.mmap(fd, SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+    finally:
+        os.close(fd)
+    try:
+        return read_block(data)
+    finally:
+        data.close()
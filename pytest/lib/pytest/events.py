@@ -0,0 +1,98 @@
+"""
+This module provides the event stream of a run, written as one JSON object per
+line.
+"""
+
+import os
+import json
+import time
+import threading
+from pytest.globals import monotonic
+
+
+#: The open event stream or `None` if events are not written.
+STREAM = None
+#: The fields added to every event, like the module, test and testcase being
+#: run.
+CONTEXT = {}
+
+
+class EventStream(object):
+    """Events appended to a file as JSON lines. Every event carries its name,
+    the wall clock and monotonic times, the process id and the fields of
+    :data:`CONTEXT`. A line is written with a single write to a file opened
+    for appending, so the stream of a crashed run is complete up to the crash
+    and forked workers can share the file without mixing their lines.
+
+    :param str path: The path of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        """Writes an event.
+
+        :param str event: The name of the event.
+        :param fields: The fields of the event.
+        """
+        record = dict(CONTEXT)
+        record.update(fields)
+        record['event'] = event
+        record['time'] = time.time()
+        record['monotonic'] = monotonic()
+        record['pid'] = os.getpid()
+        line = json.dumps(record, sort_keys=True, default=str) + '\n'
+        with self.lock:
+            os.write(self.fd, line)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def start_events(path):
+    """Starts writing events to a file. The stream that was open is closed.
+
+    :param str path: The path of the file.
+    :returns: The event stream.
+    :rtype: EventStream
+    """
+    global STREAM
+    stop_events()
+    STREAM = EventStream(path)
+    return STREAM
+
+
+def stop_events():
+    """Stops writing events and clears the context.
+    """
+    global STREAM
+    if STREAM is not None:
+        STREAM.close()
+        STREAM = None
+    CONTEXT.clear()
+
+
+def emit(event, **fields):
+    """Writes an event if a stream is open.
+
+    :param str event: The name of the event.
+    :param fields: The fields of the event.
+    """
+    if STREAM is not None:
+        STREAM.emit(event, **fields)
+
+
+def set_context(**fields):
+    """Sets fields of every following event. A field set to `None` is
+    removed.
+
+    :param fields: The fields.
+    """
+    for key, value in fields.items():
+        if value is None:
+            CONTEXT.pop(key, None)
+        else:
+            CONTEXT[key] = value
@@ -6,9 +6,15 @@ import errno
 import fcntl
 import signal
 import thread
+import ctypes
 import pickle
+import select
+import struct
 import logging
-from threading import Condition as _Condition
+import ctypes.util
+from Queue import Queue as _Queue, Full as _Full
+from threading import Condition as _Condition, local as _local
+from threading import Thread as _Thread
 
 
 PASSED = 0
@@ -20,11 +26,35 @@ ABORT = 49
 SKIP = 47
 WIDTH = 80
 LOCK_TIMEOUT = 5
+F_OFD_SETLK = 37
+F_OFD_SETLKW = 38
+QUEUE_SUFFIX = '.queue'
+TICKET_SIZE = 8
+#: The offset of the byte of the first ticket in a lock queue file.
+TICKET_BASE = 8
+#: The flag for open file description locks, which is `None` until a lock
+#: finds out if the platform supports them.
+OFD_LOCKS = None
 EQUAL_HEADER = '{0:=^' + str(WIDTH - 1) + '}'
 STAR_HEADER = '{0:*^' + str(WIDTH - 1) + '}'
 SPACE_HEADER = '{0: ^' + str(WIDTH - 1) + '}'
 DASH_HEADER =  '{0:-^' + str(WIDTH - 1) + '}'
 LOG_SETTINGS = {}
+#: The extra attributes of the records of :func:`log_empty`.
+EMPTY = {'empty': True}
+#: The number of records the queue of a :class:`QueueHandler` holds.
+LOG_QUEUE_SIZE = 10000
+LOG_BLOCK = 'block'
+LOG_DROP = 'drop'
+METRICS = {}
+#: The seconds spent in each timing bucket by this process. The CPU time spent
+#: inside the buckets is kept under :data:`BUCKET_CPU`.
+TIMINGS = {}
+REMOTE_WAIT = 'remote wait'
+SLEEP = 'sleep'
+CONNECTION_SETUP = 'connection setup'
+BUCKET_CPU = 'bucket cpu'
+CLOCK_MONOTONIC = 1
 
 
 class NullHandler(logging.Handler):
@@ -48,6 +78,151 @@ class NullHandler(logging.Handler):
         self.lock = None
 
 
+class Formatter(logging.Formatter):
+    """Formatter that writes a record with the `empty` attribute, as logged by
+    :func:`log_empty`, as the bare message and any other record with its
+    format. The layout is chosen per record, so handlers are never reconfigured
+    and threads can log bare and formatted lines at the same time.
+
+    :param str fmt: The format of the records.
+    :param str datefmt: The format of the dates.
+    """
+
+    def __init__(self, fmt=None, datefmt=None):
+        logging.Formatter.__init__(self, fmt, datefmt)
+        self.empty = logging.Formatter()
+
+    def format(self, record):
+        if getattr(record, 'empty', False):
+            return self.empty.format(record)
+        return logging.Formatter.format(self, record)
+
+
+class QueueHandler(logging.Handler):
+    """Handler that puts records on a bounded queue, from which a listener
+    thread emits them to another handler, so that logging does not wait for
+    the writes of the handler. When the queue is full, the
+    :data:`LOG_BLOCK` policy waits for room and the :data:`LOG_DROP` policy
+    drops the record, and the number of dropped records is logged once the
+    queue has room again. A worker forked by the process starts its own queue
+    and listener.
+
+    :param Handler handler: The handler that writes the records.
+    :param int size: The number of records the queue holds.
+    :param str policy: The policy for a full queue.
+    """
+
+    def __init__(self, handler, size=LOG_QUEUE_SIZE, policy=LOG_BLOCK):
+        if policy not in [LOG_BLOCK, LOG_DROP]:
+            raise GlobalError('Unknown log overflow policy ' + str(policy))
+        self.handler = handler
+        logging.Handler.__init__(self, handler.level)
+        self.baseFilename = getattr(handler, 'baseFilename', None)
+        self.size = size
+        self.policy = policy
+        self.dropped_lock = thread.allocate_lock()
+        self.start()
+
+    def start(self):
+        self.pid = os.getpid()
+        self.dropped = 0
+        self.queue = _Queue(self.size)
+        self.listener = _Thread(target=self.listen)
+        self.listener.daemon = True
+        self.listener.start()
+
+    def listen(self):
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    return
+                self.handler.handle(record)
+                if self.dropped:
+                    with self.dropped_lock:
+                        dropped = self.dropped
+                        self.dropped = 0
+                    self.handler.handle(logging.makeLogRecord({
+                        'levelno': logging.WARNING, 'levelname': 'WARNING',
+                        'msg': 'Dropped {0} log records'.format(dropped)}))
+            finally:
+                self.queue.task_done()
+
+    def prepare(self, record):
+        """Formats the message and exception of a record, so that the record
+        does not change while it is queued.
+
+        :param LogRecord record: The record.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                formatter = self.handler.formatter or logging.Formatter()
+                record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.prepare(record)
+            if self.policy == LOG_BLOCK:
+                self.queue.put(record)
+                return
+            try:
+                self.queue.put_nowait(record)
+            except _Full:
+                with self.dropped_lock:
+                    self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def setFormatter(self, fmt):
+        logging.Handler.setFormatter(self, fmt)
+        self.handler.setFormatter(fmt)
+
+    def setLevel(self, level):
+        logging.Handler.setLevel(self, level)
+        self.handler.setLevel(level)
+
+    def flush(self):
+        """Waits until the listener emitted the queued records and flushes the
+        handler.
+        """
+        if self.pid == os.getpid() and self.listener.is_alive():
+            self.queue.join()
+        self.handler.flush()
+
+    def drain(self):
+        """Emits the queued records from the thread that calls this, without
+        the mutex of the queue, which the thread can hold when a signal
+        handler calls this. Only the records queued when the drain starts are
+        emitted, and a record the listener is emitting may be cut off.
+        """
+        if self.pid != os.getpid():
+            return
+        records = self.queue.queue
+        for i in range(len(records)):
+            try:
+                record = records.popleft()
+            except IndexError:
+                break
+            if record is not None:
+                self.handler.handle(record)
+        self.handler.flush()
+
+    def close(self):
+        """Stops the listener once it emitted the queued records and closes the
+        handler.
+        """
+        if self.pid == os.getpid() and self.listener.is_alive():
+            self.queue.put(None)
+            self.listener.join()
+        self.handler.close()
+        logging.Handler.close(self)
+
+
 debug_logger = logging.getLogger('debug')
 debug_logger.propagate = False
 debug_logger.addHandler(NullHandler())
@@ -73,8 +248,10 @@ path = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
 PYTEST_SCEN_PATH = os.path.abspath(os.path.join(path, 'scen'))
 PYTEST_DATA_PATH = os.path.abspath(os.path.join(path, 'data'))
 PYTEST_SYSTEMS_PATH = os.path.join(PYTEST_DATA_PATH, 'systems')
+PYTEST_TESTS_PATH = os.path.abspath(os.path.join(path, 'tests'))
 PYTEST_PATH.append(PYTEST_SCEN_PATH)
 PYTEST_PATH.append(PYTEST_DATA_PATH)
+PYTEST_CACHE_PATH = os.path.join(os.path.expanduser('~'), 'pytest_cache')
 del path
 
 
@@ -87,8 +264,25 @@ class LockError(Exception):
 
 
 class Lock(object):
+    """Lock on a file that is shared by processes and stores pickled data.
+    The lock is a `flock` on the file. Waiters queue for it in FIFO order:
+    each one takes a ticket from the counter in `name.queue`, holds an open
+    file description lock on the byte of its ticket and blocks in the kernel
+    on the byte of the previous ticket until that waiter released the lock.
+    If a process dies, the kernel releases its locks, so the queue moves on.
+    On a platform without open file description locks, waiters block on the
+    `flock` in no particular order. A timeout is waited for while a helper
+    thread blocks. The wait and hold times are added to the metrics as
+    `lock wait <file>` and `lock hold <file>`.
+
+    :param str name: The path of the file.
+    :param str option: The mode the file is opened in.
+    """
+
     def __init__(self, name, option='w'):
         self.name = name
+        self.held = None
+        self.acquired = None
         try:
             self.file = open(name, option)
         except IOError as e:
@@ -100,38 +294,130 @@ class Lock(object):
                 raise e
 
     def acquire(self, timeout=None):
-        delay = 0.0005
+        """Waits for the lock. Acquiring a lock that is already held returns
+        at once, like a second `flock` of the same file, and a single
+        :meth:`release` releases it.
+
+        :param float timeout: The seconds to wait or `None` to wait forever.
+        :returns: `False` if the timeout passed.
+        :rtype: bool
+        """
+        if self.held is not None:
+            return True
+        start = monotonic()
         if timeout is None:
-            while True:
+            held = self._wait()
+        else:
+            held = self._wait_timeout(timeout)
+            if held is None:
+                return False
+        self.held = held
+        self.acquired = monotonic()
+        add_metric('lock wait ' + os.path.basename(self.name),
+                   self.acquired - start, '')
+        return True
+
+    def release(self):
+        if self.held is None:
+            return
+        held = self.held
+        self.held = None
+        self._release(held)
+        add_metric('lock hold ' + os.path.basename(self.name),
+                   monotonic() - self.acquired, '')
+
+    def _wait(self):
+        """Queues for the lock and blocks until it is acquired.
+
+        :returns: The tuple (lock fd, queue fd, ticket) of the lock.
+        :rtype: tuple
+        """
+        global OFD_LOCKS
+        lock_fd = os.open(self.name, os.O_RDONLY | os.O_CREAT, 0644)
+        queue_fd = None
+        ticket = None
+        try:
+            if OFD_LOCKS is not False:
                 try:
-                    fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
-                except IOError as e:
-                    if e.errno != errno.EAGAIN:
-                        raise e
-                    else:
-                        delay = min(delay * 2, .05)
-                        time.sleep(delay)
+                    queue_fd, ticket = take_ticket(self.name + QUEUE_SUFFIX)
+                except (IOError, OSError) as e:
+                    if e.errno != errno.EINVAL:
+                        raise
+                    OFD_LOCKS = False
                 else:
-                    return True
-        else:
-            endtime = time.time() + timeout
+                    OFD_LOCKS = True
+            if ticket:
+                lock_range(queue_fd, fcntl.F_WRLCK, TICKET_BASE + ticket - 1)
+                lock_range(queue_fd, fcntl.F_UNLCK, TICKET_BASE + ticket - 1)
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._release((lock_fd, queue_fd, ticket))
+            raise
+        return (lock_fd, queue_fd, ticket)
+
+    def _wait_timeout(self, timeout):
+        """Waits for the lock in a helper thread. If the timeout passes, the
+        thread keeps the place of the waiter in the queue and releases the
+        lock as soon as it gets it, so the waiters behind it are not passed
+        over.
+
+        :param float timeout: The seconds to wait.
+        :returns: The tuple of :meth:`_wait` or `None` if the timeout passed.
+        :rtype: tuple
+        """
+        read_fd, write_fd = os.pipe()
+        guard = thread.allocate_lock()
+        state = {'held': None, 'error': None, 'abandoned': False}
+
+        def wait():
+            try:
+                held = self._wait()
+                error = None
+            except Exception as e:
+                held = None
+                error = e
+            with guard:
+                if state['abandoned']:
+                    if held is not None:
+                        self._release(held)
+                else:
+                    state['held'] = held
+                    state['error'] = error
+                    os.write(write_fd, 'x')
+            os.close(write_fd)
+
+        waiter = _Thread(target=wait)
+        waiter.daemon = True
+        waiter.start()
+        endtime = monotonic() + timeout
+        try:
             while True:
+                remaining = max(endtime - monotonic(), 0)
                 try:
-                    fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
-                except IOError as e:
-                    if e.errno != errno.EAGAIN:
-                        raise e
-                    else:
-                        remaining = endtime - time.time()
-                        if remaining <= 0:
-                            return False
-                        delay = min(delay * 2, remaining, .05)
-                        time.sleep(delay)
-                else:
-                    return True
+                    select.select([read_fd], [], [], remaining)
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                break
+        finally:
+            with guard:
+                done = state['held'] is not None or state['error'] is not None
+                if not done:
+                    state['abandoned'] = True
+            os.close(read_fd)
+        if state['error'] is not None:
+            raise state['error']
+        return state['held']
 
-    def release(self):
-        fcntl.flock(self.file, fcntl.LOCK_UN)
+    def _release(self, held):
+        lock_fd, queue_fd, ticket = held
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        finally:
+            os.close(lock_fd)
+            if queue_fd is not None:
+                os.close(queue_fd)
 
     def download(self, acquire=True, release=False, exit=True,
                  timeout=LOCK_TIMEOUT):
@@ -166,57 +452,282 @@ class Lock(object):
             self.release()
 
     def __del__(self):
+        try:
+            self.release()
+        except Exception:
+            pass
         try:
             self.file.close()
         except AttributeError:
             pass
 
 
+def lock_range(fd, lock_type, offset, wait=True):
+    """Sets an open file description lock on a byte of a file.
+
+    :param int fd: The file descriptor.
+    :param int lock_type: `fcntl.F_WRLCK` or `fcntl.F_UNLCK`.
+    :param int offset: The offset of the byte.
+    :param bool wait: The flag for blocking until the byte is free.
+    """
+    data = struct.pack('hhqqi', lock_type, os.SEEK_SET, offset, 1, 0)
+    fcntl.fcntl(fd, F_OFD_SETLKW if wait else F_OFD_SETLK, data)
+
+
+def take_ticket(path):
+    """Takes the next ticket of a lock queue and locks its byte.
+
+    :param str path: The path of the queue file.
+    :returns: The tuple (fd, ticket) of the open queue file and the ticket.
+    :rtype: tuple
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0644)
+    try:
+        lock_range(fd, fcntl.F_WRLCK, 0)
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            data = os.read(fd, TICKET_SIZE)
+            if len(data) == TICKET_SIZE:
+                ticket = struct.unpack('<Q', data)[0]
+            else:
+                ticket = 0
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, struct.pack('<Q', ticket + 1))
+            lock_range(fd, fcntl.F_WRLCK, TICKET_BASE + ticket, wait=False)
+        finally:
+            lock_range(fd, fcntl.F_UNLCK, 0)
+    except BaseException:
+        os.close(fd)
+        raise
+    return (fd, ticket)
+
+
+#: The flag for skipping the sleeps of :func:`sleep`, set by
+#: :func:`fast_forward`.
+FAST_FORWARD = False
+#: The seconds of the sleeps skipped so far.
+SKIPPED = 0.0
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+try:
+    _clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or
+                                 'librt.so.1', use_errno=True).clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+
+def monotonic():
+    """Gets the value of a clock that cannot go backwards. Falls back to the
+    wall clock if the platform does not provide a monotonic clock. The
+    seconds skipped by :func:`sleep` when fast forwarding are added.
+
+    :returns: The clock value in seconds.
+    :rtype: float
+    """
+    if _clock_gettime is not None:
+        t = _timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) == 0:
+            return t.tv_sec + t.tv_nsec * 1e-9 + SKIPPED
+    return time.time() + SKIPPED
+
+
+def fast_forward(enable=True):
+    """Makes :func:`sleep` return at once and move the clock of
+    :func:`monotonic` forward instead, so waits on systems that are not there,
+    like connections replayed from transcripts, take no time but still time
+    out.
+
+    :param bool enable: The flag for skipping the sleeps.
+    """
+    global FAST_FORWARD
+    FAST_FORWARD = enable
+
+
+def cpu_time():
+    """Gets the user and system CPU time of the process.
+
+    :returns: The seconds.
+    :rtype: float
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+class Timing(object):
+    """Context manager that adds the wall time of its block to a bucket of
+    :data:`TIMINGS`. Only the outermost timing of a thread is counted, so the
+    expects of a login during a connection setup count as connection setup.
+
+    For example::
+
+        with Timing(REMOTE_WAIT):
+            index = self.expect_list(patterns)
+
+    :param str bucket: The bucket.
+    """
+    active = _local()
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.start = None
+
+    def __enter__(self):
+        if getattr(Timing.active, 'timing', None) is None:
+            Timing.active.timing = self
+            self.start = monotonic()
+            self.cpu = cpu_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            Timing.active.timing = None
+            TIMINGS[self.bucket] = (TIMINGS.get(self.bucket, 0) +
+                                    monotonic() - self.start)
+            TIMINGS[BUCKET_CPU] = (TIMINGS.get(BUCKET_CPU, 0) +
+                                   cpu_time() - self.cpu)
+        return False
+
+
+def timed(bucket):
+    """Decorates a function so that its calls are counted in a bucket of
+    :data:`TIMINGS`.
+
+    :param str bucket: The bucket.
+    """
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            with Timing(bucket):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+def get_timings():
+    """Takes a snapshot of :data:`TIMINGS` with the monotonic time under
+    `wall` and the CPU time of the process under `cpu`.
+
+    :returns: The snapshot.
+    :rtype: dict
+    """
+    timings = dict(TIMINGS)
+    timings['wall'] = monotonic()
+    timings['cpu'] = cpu_time()
+    return timings
+
+
+def diff_timings(start, end):
+    """Breaks down the time between two snapshots of :func:`get_timings`. The
+    local CPU is the CPU time outside of the buckets and `other` is the rest
+    of the wall time, like blocking outside of expects.
+
+    :param dict start: The snapshot at the start.
+    :param dict end: The snapshot at the end.
+    :returns: The dictionary of `wall`, the buckets, `local cpu` and `other`
+        in seconds.
+    :rtype: dict
+    """
+    keys = [REMOTE_WAIT, SLEEP, CONNECTION_SETUP, BUCKET_CPU, 'wall', 'cpu']
+    times = dict((key, end.get(key, 0) - start.get(key, 0)) for key in keys)
+    times['local cpu'] = max(times.pop('cpu') - times.pop(BUCKET_CPU), 0)
+    times['other'] = max(times['wall'] - times[REMOTE_WAIT] - times[SLEEP] -
+                         times[CONNECTION_SETUP] - times['local cpu'], 0)
+    return times
+
+
+def str_timings(rows):
+    """Formats time breakdowns of :func:`diff_timings` as a table.
+
+    :param list rows: The list of (name, breakdown) tuples.
+    :returns: The table.
+    :rtype: str
+    """
+    columns = ['wall', REMOTE_WAIT, 'local cpu', SLEEP, CONNECTION_SETUP,
+               'other']
+    table = [['Timing'] + [column.capitalize() for column in columns]]
+    for name, times in rows:
+        table.append([name] + ['{0:.2f}'.format(times[column])
+                               for column in columns])
+    return str_table(table)
+
+
+class _Waiter(object):
+    """Waiter of a condition that blocks on a pipe, so that it wakes as soon
+    as it is notified and signal handlers run while it waits.
+    """
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+
+    def release(self):
+        os.write(self.write_fd, 'x')
+
+    def wait(self, timeout=None):
+        """Waits until the waiter is released.
+
+        :param float timeout: The seconds to wait or `None` to wait forever.
+        :returns: `False` if the timeout passed.
+        :rtype: bool
+        """
+        if timeout is not None:
+            endtime = monotonic() + timeout
+        remaining = timeout
+        while True:
+            try:
+                ready = select.select([self.read_fd], [], [], remaining)[0]
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+            else:
+                return bool(ready)
+            if timeout is not None:
+                remaining = max(endtime - monotonic(), 0)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
 def Condition(*args, **kwargs):
+    """Creates a :class:`threading.Condition` whose waits block on a pipe
+    instead of a lock. A notified thread wakes right away, a timeout is
+    waited for in the kernel, and, unlike a wait on a lock, signal handlers
+    like the one raising `KeyboardInterrupt` run while the thread waits.
+
+    :returns: The condition.
+    :rtype: threading.Condition
+    """
     def wait(self, timeout=None):
         if not self._is_owned():
             raise RuntimeError("cannot wait on un-acquired lock")
-        waiter = thread.allocate_lock()
-        waiter.acquire()
+        waiter = _Waiter()
         self._Condition__waiters.append(waiter)
         saved_state = self._release_save()
         try:
-            delay = 0.0005
-            if timeout is None:
-                while True:
-                    gotit = waiter.acquire(0)
-                    if gotit:
-                        break
-                    delay = min(delay * 2, .05)
-                    time.sleep(delay)
-                if __debug__:
-                    self._note("%s.wait(): got it", self)
-                return_value = True
-            else:
-                endtime = time.time() + timeout
-                while True:
-                    gotit = waiter.acquire(0)
-                    if gotit:
-                        break
-                    remaining = endtime - time.time()
-                    if remaining <= 0:
-                        break
-                    delay = min(delay * 2, remaining, .05)
-                    time.sleep(delay)
-                if not gotit:
-                    if __debug__:
-                        self._note("%s.wait(%s): timed out", self, timeout)
-                    try:
-                        self._Condition__waiters.remove(waiter)
-                    except ValueError:
-                        pass
-                    return_value = False
-                else:
-                    if __debug__:
-                        self._note("%s.wait(%s): got it", self, timeout)
-                    return_value = True
+            waiter.wait(timeout)
         finally:
             self._acquire_restore(saved_state)
+            # A waiter that is still in the list was not notified. It is
+            # removed while the lock is held, so no notify can write to its
+            # pipe once it is closed.
+            try:
+                self._Condition__waiters.remove(waiter)
+            except ValueError:
+                return_value = True
+            else:
+                return_value = False
+            waiter.close()
+        if __debug__:
+            if return_value:
+                self._note("%s.wait(%s): got it", self, timeout)
+            else:
+                self._note("%s.wait(%s): timed out", self, timeout)
         return return_value
     condition = _Condition(*args, **kwargs)
     method = types.MethodType(wait, condition)
@@ -224,6 +735,91 @@ def Condition(*args, **kwargs):
     return condition
 
 
+class Event(object):
+    """Event whose waits block on a pipe, so they wake right away and can be
+    interrupted by signals. Setting the event stores the flag and writes to
+    the pipe without taking a lock, so it is safe in a signal handler that
+    interrupts a wait of the same thread. The pipe is opened again in a
+    forked process, so the events of a parent and its workers stay apart.
+    """
+
+    def __init__(self):
+        self.flag = False
+        self.pid = None
+        self.check_pipe()
+
+    def check_pipe(self):
+        if self.pid != os.getpid():
+            self.read_fd, self.write_fd = os.pipe()
+            for fd in (self.read_fd, self.write_fd):
+                flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+                fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            self.pid = os.getpid()
+
+    def drain(self):
+        try:
+            while os.read(self.read_fd, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def is_set(self):
+        return self.flag
+
+    def set(self):
+        self.flag = True
+        self.check_pipe()
+        try:
+            os.write(self.write_fd, 'x')
+        except OSError as e:
+            # A full pipe already wakes the waits
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def clear(self):
+        self.flag = False
+        self.check_pipe()
+        self.drain()
+
+    def wait(self, timeout=None):
+        """Waits until the event is set. The pipe stays readable while the
+        event is set, so every wait wakes, and the flag is checked again
+        after every wake, so a set in between is never lost.
+
+        :param float timeout: The seconds to wait or `None` to wait forever.
+        :returns: The flag of the event.
+        :rtype: bool
+        """
+        self.check_pipe()
+        if timeout is not None:
+            endtime = monotonic() + timeout
+        remaining = timeout
+        while not self.flag:
+            try:
+                ready = select.select([self.read_fd], [], [], remaining)[0]
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                ready = []
+            if self.flag:
+                break
+            if ready:
+                # Left over from a set that was cleared since
+                self.drain()
+            if timeout is not None:
+                remaining = endtime - monotonic()
+                if remaining <= 0:
+                    break
+        return self.flag
+
+
+#: The event that stops every :func:`sleep` and :func:`wait_until` of the run.
+#: It is set when a test aborts or an operator sends SIGUSR1 without a
+#: signaler, and cleared when a testcase or its cleanup starts.
+STOP = Event()
+
+
 def check_make_dir(path, level=logging.CRITICAL, log=True, empty=False,
                    error=False):
     """Checks the path if it is a directory and makes a directory if the path
@@ -315,15 +911,60 @@ def import_module(name):
     return module
 
 
-def sleep(timeout):
-    delay = 0.0005
-    endtime = time.time() + timeout
-    while True:
-        remaining = endtime - time.time()
-        if remaining <= 0:
+@timed(SLEEP)
+def sleep(timeout, log=True):
+    """Sleeps in the kernel. The sleep ends early when :data:`STOP` is set.
+    When fast forwarding, the seconds are skipped instead.
+
+    :param float timeout: The seconds to sleep.
+    :param bool log: The flag for logging the seconds slept.
+    :returns: `True` if the sleep was stopped.
+    :rtype: bool
+    """
+    global SKIPPED
+    timeout = max(timeout, 0)
+    start = monotonic()
+    if FAST_FORWARD:
+        stopped = STOP.is_set()
+        if not stopped:
+            SKIPPED += timeout
+    else:
+        stopped = STOP.wait(timeout)
+    if log:
+        logging.debug('Slept {0:.1f} of {1} seconds{2}'.format(
+                      monotonic() - start, timeout,
+                      ' until stopped' if stopped else ''))
+    return stopped
+
+
+def wait_until(predicate, timeout, delay=1, backoff=1, max_delay=None):
+    """Calls a predicate until it returns a true value or the timeout passes,
+    sleeping between the calls with :func:`sleep`. The wait ends early when
+    :data:`STOP` is set.
+
+    :param function predicate: The function called without arguments.
+    :param float timeout: The seconds to wait.
+    :param float delay: The seconds to sleep after the first call.
+    :param float backoff: The factor the delay grows by after every call.
+    :param float max_delay: The most seconds to sleep between calls or `None`
+        for no limit.
+    :returns: The last value of the predicate.
+    """
+    start = monotonic()
+    endtime = start + timeout
+    value = predicate()
+    while not value:
+        remaining = endtime - monotonic()
+        if remaining <= 0 or sleep(min(delay, remaining), log=False):
             break
-        delay = min(delay * 2, remaining, .05)
-        time.sleep(delay)
+        delay *= backoff
+        if max_delay is not None:
+            delay = min(delay, max_delay)
+        value = predicate()
+    logging.debug('Waited {0:.1f} of {1} seconds{2}'.format(
+                  monotonic() - start, timeout,
+                  ' until stopped' if STOP.is_set() and not value else ''))
+    return value
 
 
 def str_error(e):
@@ -374,14 +1015,50 @@ def str_table(table, separator=' ', header='-', width=None):
     return '\n'.join(strings)
 
 
+def add_metric(name, value, system=None):
+    """Records a value in the run metrics. The metrics are summarized at the
+    end of the run.
+
+    :param str name: The name of the metric.
+    :param float value: The value to record.
+    :param str system: The name of the system the value belongs to.
+    """
+    METRICS.setdefault(name, []).append((system, value))
+
+
+def str_metrics():
+    """Formats the run metrics as a table with one row per metric and system.
+
+    :returns: The table or '' if no metrics were recorded.
+    :rtype: str
+    """
+    table = [('Metric', 'System', 'Count', 'Mean', 'Max')]
+    for name in sorted(METRICS):
+        systems = {}
+        for system, value in METRICS[name]:
+            systems.setdefault(system, []).append(value)
+        for system in sorted(systems):
+            values = systems[system]
+            table.append((name, system, len(values),
+                          '{0:.2f}'.format(sum(values) / len(values)),
+                          '{0:.2f}'.format(max(values))))
+    if len(table) == 1:
+        return ''
+    return str_table(table)
+
+
 def add_log_setting(handler, formatter):
     """Adds a handler and formatter to the settings so that :func:`log_empty`
     and :func:`log_result` work properly for the handler.
 
     :param Handler handler: The handler to add.
-    :param Formatter formatter: The formatter associated with the handler.
+    :param Formatter formatter: The formatter associated with the handler. A
+        :class:`logging.Formatter` is replaced by a :class:`Formatter` with
+        the same formats.
     """
     global LOG_SETTINGS
+    if not isinstance(formatter, Formatter):
+        formatter = Formatter(formatter._fmt, formatter.datefmt)
     LOG_SETTINGS[handler] = formatter
     handler.setFormatter(formatter)
     logging.root.addHandler(handler)
@@ -397,6 +1074,23 @@ def remove_log_setting(handler):
     logging.root.removeHandler(handler)
 
 
+def flush_logs():
+    """Waits until the handlers in the settings wrote every record logged so
+    far, for example before the process forks or exits.
+    """
+    for handler in list(LOG_SETTINGS):
+        handler.flush()
+
+
+def drain_logs():
+    """Emits the records queued in the queue handlers of the settings without
+    waiting on the queues, so that a signal handler can call this.
+    """
+    for handler in list(LOG_SETTINGS):
+        if isinstance(handler, QueueHandler):
+            handler.drain()
+
+
 def log_empty(message='', level=logging.CRITICAL, logger=logging):
     """Logs a message without any formatting.
 
@@ -404,16 +1098,11 @@ def log_empty(message='', level=logging.CRITICAL, logger=logging):
     :param int level: The level to log the message.
     :param Logger logger: The logger to log the message to.
     """
-    empty = logging.Formatter()
-    for log_handler in LOG_SETTINGS:
-        log_handler.setFormatter(empty)
     if type(logger) is list:
         for l in logger:
-            l.log(level, message)
+            l.log(level, message, extra=EMPTY)
     else:
-        logger.log(level, message)
-    for log_handler in LOG_SETTINGS:
-        log_handler.setFormatter(LOG_SETTINGS[log_handler])
+        logger.log(level, message, extra=EMPTY)
 
 
 def log_result(message='', level=logging.CRITICAL, logger=logging):
@@ -4,10 +4,13 @@ This module provides ilom functionality and methods.
 
 import re
 import time
+import random
 import logging
 from pexpect import TIMEOUT as TimeoutError
-from pytest.globals import log_empty, debug_logger, file_logger, sleep
+from pytest.globals import (log_empty, debug_logger, file_logger, sleep,
+                            monotonic, add_metric)
 from pytest.connections import Console, SSH
+from pytest.capture import Capture, text_capture
 
 
 ESCAPE = '#.'
@@ -15,6 +18,8 @@ TIMESTEP = 15
 TIMEOUT = 600
 STOP_TIMEOUT = 900
 START_TIMEOUT = 3600
+POWER_DELAY = 1
+POWER_PROPERTIES = {'System':'power_state', 'HOST':'status'}
 STATUS_LIST = ['Starting', 'Powered On', 'HV started', 'OpenBoot initializing',
                'OpenBoot Running', 'OpenBoot Primary Boot Loader',
                'OpenBoot Running OS Boot', 'Solaris running']
@@ -276,6 +281,68 @@ def set(self, target, timeout=-1, log=True, **property_value):
     return changed
 
 
+def set_many(self, targets, timeout=-1, log=True, verify=True):
+    """Sets the values of properties associated with several targets. All of
+    the set commands are written at once and their results are parsed
+    together. The values are then verified with one show per target.
+
+    For example::
+
+        ilom.set_many({'/HOST/tpm':{'mode':'activated',
+                                    'forceclear':'true'},
+                       '/HOST/domain/control':{'auto-boot':'disabled'}})
+
+    :param dict targets: The properties and values to set. The keys are
+        targets and the values are dictionaries of properties and values.
+    :param int timeout: The timeout value of each set command.
+    :param bool log: The flag for allowing info messages.
+    :param bool verify: The flag for verifying the values with show.
+    :returns: The result of each property. The keys are targets and the values
+        are dictionaries of properties and booleans.
+    :rtype: dict
+    """
+    commands = []
+    for target, property_value in targets.items():
+        property_value_list = ['{0}="{1}"'.format(key, value)
+                               for key, value in property_value.items()]
+        commands.append((target, list(property_value),
+                         'set -script {0} '.format(target) +
+                         ' '.join(property_value_list)))
+    self.send(''.join([command + self.linesep
+                       for target, keys, command in commands]))
+    results = {}
+    for target, keys, command in commands:
+        logging.debug(command)
+        output = self.sync(timeout=timeout)
+        lines = [line for line in output.splitlines()
+                 if line.startswith('Set') or line.startswith('set:')]
+        results[target] = {}
+        for i in range(len(keys)):
+            results[target][keys[i]] = (i < len(lines) and
+                                        lines[i].startswith('Set'))
+    if verify:
+        for target, property_value in targets.items():
+            try:
+                properties = self.show(target, debug=False).properties
+            except (ILOMError, AttributeError):
+                properties = {}
+            for key, value in property_value.items():
+                actual = properties.get(key)
+                if actual is None or actual.lower() != str(value).lower():
+                    results[target][key] = False
+    for target, property_value in targets.items():
+        for key, value in property_value.items():
+            property_value_string = '{0}="{1}"'.format(key, value)
+            if results[target][key]:
+                if log:
+                    logging.info('Set {0} '.format(target) +
+                                 property_value_string)
+            else:
+                logging.warning('Could not set {0} '.format(target) +
+                                property_value_string)
+    return results
+
+
 def show(self, target, *property, **property_value):
     """
     """
@@ -472,11 +539,16 @@ def start_system(self, system='System', host='HOST', user=None, boot=True,
         else:
             raise ILOMError(system + ' is in state ' + status)
     bootmode = '/' + host + '/bootmode'
+    start = None
     if status == 'Powered Off':
         self.set(bootmode, script='setenv auto-boot? false', log=False)
+        start = monotonic()
         result = self.sendcmd('start -script /' + system)
         if not result.startswith('Starting'):
             raise ILOMError('Could not start ' + system + '\n' + result)
+        state = self.wait_for_power_state('/' + system, 'On', timeout=TIMEOUT)
+        if state != 'On':
+            raise ILOMError('Timed out in powering on ' + system)
         if verbose:
             logging.info('Starting ' + system + '. This might take a while...')
     elif status in STATUS_LIST:
@@ -486,15 +558,20 @@ def start_system(self, system='System', host='HOST', user=None, boot=True,
         raise ILOMError(system + ' is in state ' + status)
     self.start_console(host=host, log=verbose)
     self.switch(user='openboot')
+    if start is not None:
+        self.start_timeline(start=start)
     self.sendline()
     start_list = [self.prompt, '(?i)Console Login:', TimeoutError]
-    start_output = self.sync(start_list, timeout=timeout, debug=False).strip()
+    start_output = self.capture(start_list, timeout=timeout,
+                                capture=Capture('start'))
+    self.stop_timeline(log=verbose)
     if not start_output:
-        start_output = 'No start output available'
+        start_output.remove()
+        message = 'No start output available'
         if self.match_index != 2:
-            start_output += ' because ' + system + ' was already up'
-    log_empty(start_output, level=logging.INFO,
-              logger=[debug_logger, file_logger])
+            message += ' because ' + system + ' was already up'
+        start_output = text_capture('start', message)
+    start_output.log(level=logging.INFO, logger=[debug_logger, file_logger])
     boot_output = None
     if self.match_index == 2:
         raise ILOMError('Timed out in starting ' + system)
@@ -507,7 +584,7 @@ def start_system(self, system='System', host='HOST', user=None, boot=True,
             self.stop_console(log=False)
             domain_control = '/' + host + '/domain/control'
             control_properties = {'auto-boot':'disabled'}
-            self.set(domain_control, log=False, **control_properties)
+            self.set_many({domain_control:control_properties}, log=False)
             self.sendcmd('reset -force -script ' + domain_control, debug=False)
             #self.set(bootmode, script='setenv auto-boot? false', log=False)
             #self.set('/' + host, send_break_action='break', log=False)
@@ -528,10 +605,11 @@ def start_system(self, system='System', host='HOST', user=None, boot=True,
         if boot and disk is None:
             if verbose:
                 logging.info('Starting to boot. This might take a while...')
-            boot_output = ('No boot output available because ' + system +
-                           ' was started with auto-boot?=true')
-            log_empty(boot_output, level=logging.INFO,
-                      logger=[debug_logger, file_logger])
+            boot_output = text_capture('boot', 'No boot output available ' +
+                                       'because ' + system + ' was started ' +
+                                       'with auto-boot?=true')
+            boot_output.log(level=logging.INFO,
+                            logger=[debug_logger, file_logger])
             if verbose:
                 logging.info('Finished booting')
     if self.match_index == 0:
@@ -546,7 +624,7 @@ def start_system(self, system='System', host='HOST', user=None, boot=True,
     if not console:
         self.stop_console(log=verbose)
     errors = []
-    for line in start_output.splitlines():
+    for line in start_output.find('ERROR:'):
         if 'ERROR:' in line:
             errors.append(line)
     return (start_output, boot_output, errors)
@@ -567,40 +645,72 @@ def stop_system(self, system='System', force=False, timeout=-1):
     if (result.startswith('Stopping')
         or 'Target shutdown in progress' in result):
         logging.info('Stopping ' + system)
-        timed_out = True
-        end_time = time.time() + timeout
-        while True:
-            remaining = end_time - time.time()
-            if remaining <= 0:
-                break
-            sleep(TIMESTEP)
-            result = self.sendcmd(command, debug=False)
-            if result.startswith('stop:'):
-                if result.startswith('stop: Target already stopped'):
-                    timed_out = False
-                    logging.info('Finished stopping ' + system)
-                    break
-                elif 'Target shutdown in progress' in result:
-                    continue
-                else:
-                    raise ILOMError('Could not stop ' + system + '\n' + result)
-        """
-        for i in range(0, timeout, TIMESTEP):
-            time.sleep(TIMESTEP)
-            result = self.sendcmd(command, debug=False)
-            if result.startswith('stop:'):
-                if result.startswith('stop: Target already stopped'):
-                    timed_out = False
-                    logging.info('Finished stopping ' + system)
-                    break
-                elif 'Target shutdown in progress' in result:
-                    continue
-                else:
-                    raise ILOMError('Could not stop ' + system + '\n' + result)
-        """
-        if timed_out:
+        state = self.wait_for_power_state('/' + system, 'Off', timeout=timeout)
+        if state != 'Off':
             raise ILOMError('Timed out in stopping ' + system)
+        logging.info('Finished stopping ' + system)
     elif result.startswith('stop: Target already stopped'):
         logging.info(system + ' already stopped')
     else:
         raise ILOMError('Could not stop ' + system + '\n' + result)
+
+
+def wait_for_power_state(self, target, state, timeout=-1, property=None,
+                         log=True):
+    """Waits for the power state of a target by polling its read-only status
+    property. The polling interval starts at :data:`POWER_DELAY` and doubles up
+    to :data:`TIMESTEP` with jitter, so that several systems do not poll their
+    SPs in lockstep. The time it took to reach the state is recorded in the run
+    metrics.
+
+    For example::
+
+        ilom.wait_for_power_state('/System', 'Off')
+        ilom.wait_for_power_state('/HOST', ['OpenBoot Running',
+                                            'Solaris running'])
+
+    :param str target: The target, for example `/System` or `/HOST`.
+    :param state: The state or the list of states to wait for.
+    :param int timeout: The maximum time to wait.
+    :param str property: The property holding the state. If this is `None`,
+        the property is looked up in :data:`POWER_PROPERTIES`.
+    :param bool log: The flag for allowing info messages.
+    :returns: The last state read. This is one of the given states unless the
+        wait timed out.
+    :rtype: str
+    """
+    if timeout == -1:
+        timeout = max(self.timeout, TIMEOUT)
+    if type(state) is str:
+        states = [state]
+    else:
+        states = state
+    if property is None:
+        name = [string for string in target.split('/') if string][-1]
+        property = POWER_PROPERTIES.get(name, 'power_state')
+    try:
+        system = self.current[0].name
+    except AttributeError:
+        system = self.name
+    start_time = monotonic()
+    end_time = start_time + timeout
+    delay = POWER_DELAY
+    while True:
+        current = self.show(target, property, debug=False)
+        if current in states:
+            elapsed = monotonic() - start_time
+            add_metric('time to {0} {1}'.format(target, current), elapsed, system)
+            if log:
+                logging.info('{0} {1} is {2} after {3:.1f} seconds'.format(
+                             target, property, current, elapsed))
+            return current
+        remaining = end_time - monotonic()
+        if remaining <= 0:
+            break
+        if sleep(min(random.uniform(delay / 2.0, delay), remaining)):
+            break
+        delay = min(delay * 2, TIMESTEP)
+    if log:
+        logging.info('Timed out waiting for {0} {1} '.format(target, property) +
+                     'to be ' + ' or '.join(states))
+    return current
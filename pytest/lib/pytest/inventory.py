@@ -0,0 +1,148 @@
+"""
+This module provides the compiled inventory of the system files.
+"""
+
+import os
+import cPickle
+import logging
+from pytest.globals import PYTEST_CACHE_PATH, check_make_dir
+
+
+INVENTORY = 'inventory'
+#: The values of the component data files by path.
+COMPONENT_DATA = {}
+
+
+class Inventory(object):
+    """Cache of parsed systems shared by every run of the user. A system is
+    stored with the warnings of parsing it and the mtimes of its sources, the
+    system file and the component data files it read, and it is parsed again
+    if any of them change. Addresses are not stored, since they are resolved
+    on every run.
+
+    :param str path: The path of the cache file.
+    :param list code: The modules whose classes are stored. If
+        any of them change, every system is parsed again.
+    """
+
+    def __init__(self, path=None, code=()):
+        if path is None:
+            path = os.path.join(PYTEST_CACHE_PATH, INVENTORY)
+        self.path = path
+        self.code = [source_path(module) for module in code]
+        self.entries = None
+        self.changed = False
+
+    def load(self):
+        """Reads the cache file once.
+
+        :returns: The dictionary of system file paths to entries.
+        :rtype: dict
+        """
+        if self.entries is None:
+            try:
+                with open(self.path, 'rb') as inventory_file:
+                    self.entries = cPickle.load(inventory_file)
+            except Exception:
+                self.entries = None
+            if type(self.entries) is not dict:
+                self.entries = {}
+        return self.entries
+
+    def get(self, system):
+        """Gets a parsed system.
+
+        :param str system: The path of the system file.
+        :returns: The (system, warnings) tuple or `None` if the system is not
+            cached or its sources changed.
+        :rtype: tuple
+        """
+        entry = self.load().get(os.path.realpath(system))
+        if entry is None:
+            return None
+        mtimes, warnings, data = entry
+        if any(get_mtime(path) != mtime for path, mtime in mtimes):
+            return None
+        return (cPickle.loads(data), warnings)
+
+    def put(self, system, system_instance, warnings, sources, save=True):
+        """Stores a parsed system.
+
+        :param str system: The path of the system file.
+        :param System system_instance: The system without addresses.
+        :param list warnings: The warnings of parsing the system.
+        :param list sources: The paths of the component data files read.
+        :param bool save: The flag for writing the cache file.
+        """
+        paths = [os.path.realpath(system)] + self.code + sorted(set(sources))
+        mtimes = [(path, get_mtime(path)) for path in paths]
+        data = cPickle.dumps(system_instance, cPickle.HIGHEST_PROTOCOL)
+        self.load()[os.path.realpath(system)] = (mtimes, warnings, data)
+        self.changed = True
+        if save:
+            self.save()
+
+    def save(self):
+        """Writes the cache file if a system was stored since it was last
+        written.
+        """
+        if not self.changed:
+            return
+        self.changed = False
+        temp = '{0}.{1}'.format(self.path, os.getpid())
+        try:
+            check_make_dir(os.path.dirname(self.path), log=False, error=True)
+            with open(temp, 'wb') as inventory_file:
+                cPickle.dump(self.entries, inventory_file,
+                             cPickle.HIGHEST_PROTOCOL)
+            os.rename(temp, self.path)
+        except (IOError, OSError) as e:
+            logging.debug('Could not write the inventory: ' + str(e))
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def source_path(module):
+    path = os.path.realpath(module.__file__)
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return path
+
+
+def read_component_data(path):
+    """Reads the `key: value` lines of a component data file. Each file is
+    read once per run.
+
+    :param str path: The path of the file.
+    :returns: A copy of the values or `None` if the file cannot be read.
+    :rtype: dict
+    """
+    if path not in COMPONENT_DATA:
+        try:
+            data_file = open(path, 'r')
+        except IOError:
+            COMPONENT_DATA[path] = None
+        else:
+            values = {}
+            with data_file:
+                for line in data_file:
+                    if not line.strip() or line.startswith('#'):
+                        continue
+                    try:
+                        k, value = line.strip().split(':', 1)
+                    except ValueError:
+                        continue
+                    k = k.strip()
+                    value = value.strip()
+                    if k and value:
+                        values[k] = value
+            COMPONENT_DATA[path] = values
+    values = COMPONENT_DATA[path]
+    if values is None:
+        return None
+    return dict(values)
@@ -0,0 +1,396 @@
+"""
+This module provides the index of the results in run logs and the
+`logsearch` command line that queries it.
+"""
+
+import os
+import re
+import sys
+import gzip
+import time
+import shlex
+import sqlite3
+from optparse import OptionParser
+from pytest.globals import PYTEST_CACHE_PATH, check_make_dir
+
+
+LOG_INDEX = 'logindex.sqlite'
+LOG_PATH = os.path.join(os.path.expanduser('~'), 'pytest_logs')
+TIME = '%Y/%m/%d %H:%M:%S'
+LEVELS = ['PASS', 'FAIL', 'ISSUE', 'ABORT', 'SKIP']
+#: The bytes at the end of a log file that are read to find out if its run
+#: finished.
+TAIL_SIZE = 4096
+#: The last summary line of a run, which marks a finished log file.
+FINISHED = '[RESULT] Aborted: '
+MESSAGE_SIZE = 200
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime REAL,
+    command TEXT);
+CREATE TABLE IF NOT EXISTS systems (file INTEGER, system TEXT);
+CREATE TABLE IF NOT EXISTS testcases (
+    file INTEGER, line INTEGER, time INTEGER, module TEXT, test TEXT,
+    testcase TEXT);
+CREATE TABLE IF NOT EXISTS results (
+    file INTEGER, line INTEGER, time INTEGER, level TEXT, module TEXT,
+    test TEXT, testcase TEXT, message TEXT);
+CREATE INDEX IF NOT EXISTS systems_system ON systems (system, file);
+CREATE INDEX IF NOT EXISTS systems_file ON systems (file);
+CREATE INDEX IF NOT EXISTS testcases_file ON testcases (file);
+CREATE INDEX IF NOT EXISTS results_testcase ON results (testcase, level, time);
+CREATE INDEX IF NOT EXISTS results_level ON results (level, time);
+CREATE INDEX IF NOT EXISTS results_file ON results (file);
+'''
+MODULE_BANNER = re.compile(r'^(?:\[[^\]]*\] )?=+ Running (?:Module|Scenario) '
+                           r'(\S+) =+$')
+TEST_BANNER = re.compile(r'^(?:\[[^\]]*\] )?\*+ Running Test (\w+)\(')
+TESTCASE_BANNER = re.compile(r'^(?:\[[^\]]*\] )?-+ Running Testcase '
+                             r'(\w+)\(')
+TESTCASE_END = re.compile(r'^(?:\[[^\]]*\] )?-+ Finished Running Testcase ')
+RECORD = re.compile(r'^(?:\[[^\]]*\] )?(\d{4}/\d\d/\d\d \d\d:\d\d:\d\d)'
+                    r'(?:,\d+)? - (?:\[[^\]]*\] )*?\[(' + '|'.join(LEVELS) +
+                    r')\] ?(.*)$')
+TIMESTAMP = re.compile(r'^(?:\[[^\]]*\] )?(\d{4}/\d\d/\d\d \d\d:\d\d:\d\d)')
+
+
+class LogIndex(object):
+    """Index of the results in run logs, stored in SQLite. A log file is
+    indexed once its run finished, and again only if its size or mtime
+    changed. The index records the systems of the command line of the run,
+    the testcase banners and every PASS, FAIL, ISSUE, ABORT and SKIP record
+    with its time, module, test and testcase. The rotated segments of a log
+    are read before the log itself.
+
+    :param str path: The path of the index file.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(PYTEST_CACHE_PATH, LOG_INDEX)
+        check_make_dir(os.path.dirname(path), log=False, error=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def update(self, directories, all=False):
+        """Indexes the log files of directories that are new or changed.
+
+        :param list directories: The log directories, which are walked.
+        :param bool all: The flag for indexing log files whose run did not
+            finish.
+        :returns: The number of log files indexed.
+        :rtype: int
+        """
+        known = dict((path, (size, mtime)) for path, size, mtime in
+                     self.db.execute('SELECT path, size, mtime FROM files'))
+        count = 0
+        for directory in directories:
+            for root, directories, files in os.walk(directory):
+                for name in sorted(files):
+                    if not name.endswith('.log'):
+                        continue
+                    path = os.path.abspath(os.path.join(root, name))
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if known.get(path) == (stat.st_size, stat.st_mtime):
+                        continue
+                    if not all and not is_finished(path):
+                        continue
+                    self.add(path, stat.st_size, stat.st_mtime)
+                    count += 1
+        self.db.commit()
+        return count
+
+    def add(self, path, size, mtime):
+        """Indexes a log file, replacing what was indexed for it before.
+
+        :param str path: The path of the log file.
+        :param int size: The size the log file is indexed at.
+        :param float mtime: The mtime the log file is indexed at.
+        """
+        self.remove(path)
+        cursor = self.db.execute(
+            'INSERT INTO files (path, size, mtime) VALUES (?, ?, ?)',
+            (path, size, mtime))
+        file_id = cursor.lastrowid
+        command = None
+        module = test = testcase = None
+        last_time = int(mtime)
+        testcases = []
+        results = []
+        for number, line in enumerate(read_log(path), 1):
+            line = line.rstrip('\r\n')
+            if command is None:
+                command = line
+                continue
+            match = TIMESTAMP.match(line)
+            if match:
+                last_time = parse_time(match.group(1))
+                match = RECORD.match(line)
+                if match:
+                    results.append((file_id, number, last_time,
+                                    match.group(2), module, test, testcase,
+                                    match.group(3)[:MESSAGE_SIZE]))
+                continue
+            match = TESTCASE_BANNER.match(line)
+            if match:
+                testcase = match.group(1)
+                testcases.append((file_id, number, last_time, module, test,
+                                  testcase))
+                continue
+            if TESTCASE_END.match(line):
+                testcase = None
+                continue
+            match = TEST_BANNER.match(line)
+            if match:
+                test = match.group(1)
+                testcase = None
+                continue
+            match = MODULE_BANNER.match(line)
+            if match:
+                module = match.group(1)
+                test = testcase = None
+        self.db.execute('UPDATE files SET command = ? WHERE id = ?',
+                        (command, file_id))
+        self.db.executemany('INSERT INTO systems VALUES (?, ?)',
+                            [(file_id, system) for system
+                             in get_systems(command or '')])
+        self.db.executemany('INSERT INTO testcases VALUES (?, ?, ?, ?, ?, ?)',
+                            testcases)
+        self.db.executemany('INSERT INTO results VALUES '
+                            '(?, ?, ?, ?, ?, ?, ?, ?)', results)
+
+    def remove(self, path):
+        row = self.db.execute('SELECT id FROM files WHERE path = ?',
+                              (path,)).fetchone()
+        if row is None:
+            return
+        for table in ['systems', 'testcases', 'results']:
+            self.db.execute('DELETE FROM {0} WHERE file = ?'.format(table),
+                            row)
+        self.db.execute('DELETE FROM files WHERE id = ?', row)
+
+    def search(self, levels=None, testcase=None, test=None, module=None,
+               system=None, since=None, until=None, limit=None):
+        """Finds results.
+
+        :param list levels: The levels or `None` for every level.
+        :param str testcase: The name of the testcase or `None`.
+        :param str test: The name of the test or `None`.
+        :param str module: The name of the module or `None`.
+        :param str system: The name of a system of the run or `None`.
+        :param int since: The earliest time in seconds since the epoch or
+            `None`.
+        :param int until: The latest time in seconds since the epoch or
+            `None`.
+        :param int limit: The most results or `None` for every result.
+        :returns: The list of (time, level, module, test, testcase, path,
+            line, message, systems) tuples ordered by time.
+        :rtype: list
+        """
+        conditions = []
+        values = []
+        if levels:
+            conditions.append('r.level IN ({0})'.format(
+                              ', '.join('?' * len(levels))))
+            values.extend(levels)
+        for column, value in [('testcase', testcase), ('test', test),
+                              ('module', module)]:
+            if value is not None:
+                conditions.append('r.{0} = ?'.format(column))
+                values.append(value)
+        if system is not None:
+            conditions.append('r.file IN (SELECT file FROM systems '
+                              'WHERE system = ?)')
+            values.append(system)
+        if since is not None:
+            conditions.append('r.time >= ?')
+            values.append(since)
+        if until is not None:
+            conditions.append('r.time <= ?')
+            values.append(until)
+        query = ('SELECT r.time, r.level, r.module, r.test, r.testcase, '
+                 'f.path, r.line, r.message, '
+                 '(SELECT group_concat(system, \',\') FROM systems s '
+                 'WHERE s.file = r.file) '
+                 'FROM results r JOIN files f ON f.id = r.file')
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY r.time, f.path, r.line'
+        if limit is not None:
+            query += ' LIMIT ?'
+            values.append(limit)
+        return self.db.execute(query, values).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+def is_finished(path):
+    """Checks if the run of a log file finished, which writes the summary of
+    the results last.
+
+    :param str path: The path of the log file.
+    :rtype: bool
+    """
+    try:
+        with open(path, 'rb') as log_file:
+            log_file.seek(0, 2)
+            log_file.seek(max(log_file.tell() - TAIL_SIZE, 0))
+            return FINISHED in log_file.read()
+    except IOError:
+        return False
+
+
+def read_log(path):
+    """Reads the lines of a log file, starting with its rotated segments
+    `path.1`, `path.2` and so on, which may be compressed.
+
+    :param str path: The path of the log file.
+    :returns: The iterator of lines.
+    """
+    segment = 1
+    while True:
+        base = '{0}.{1}'.format(path, segment)
+        if os.path.exists(base):
+            segment_file = open(base, 'rb')
+        elif os.path.exists(base + '.gz'):
+            segment_file = gzip.open(base + '.gz', 'rb')
+        else:
+            break
+        with segment_file:
+            for line in segment_file:
+                yield line
+        segment += 1
+    with open(path, 'rb') as log_file:
+        for line in log_file:
+            yield line
+
+
+def get_systems(command):
+    """Gets the systems of the `-s` and `--system` options of a command line.
+
+    :param str command: The command line.
+    :returns: The list of system names.
+    :rtype: list
+    """
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        args = command.split()
+    systems = []
+    for i, arg in enumerate(args):
+        if arg in ['-s', '--system'] and i + 1 < len(args):
+            value = args[i + 1]
+        elif arg.startswith('--system='):
+            value = arg.split('=', 1)[1]
+        elif arg.startswith('-s') and len(arg) > 2 and arg[2] != '-':
+            value = arg[2:]
+        else:
+            continue
+        for system in value.split(','):
+            system = os.path.basename(system.strip())
+            if system and system not in systems:
+                systems.append(system)
+    return systems
+
+
+def parse_time(string, end=False):
+    """Parses a time of the logs or a date like `2016/11/21`, `2016-11-21`
+    or `2016-11-21 18:21:35`.
+
+    :param str string: The time.
+    :param bool end: The flag for the last second of a date or minute
+        instead of the first, so that a range up to a date includes the day.
+    :returns: The seconds since the epoch.
+    :rtype: int
+    """
+    string = string.strip().replace('-', '/')
+    for format, field in [(TIME, 5), ('%Y/%m/%d %H:%M', 4),
+                          ('%Y/%m/%d', 2)]:
+        try:
+            parsed = list(time.strptime(string, format))
+        except ValueError:
+            continue
+        if not end or field == 5:
+            return int(time.mktime(parsed))
+        # The start of the next day or minute, which mktime normalizes
+        parsed[field] += 1
+        parsed[8] = -1
+        return int(time.mktime(parsed)) - 1
+    raise ValueError('Unknown time ' + string)
+
+
+def main():
+    usage = 'Usage: %prog [OPTION]...'
+    parser = OptionParser(usage=usage,
+                          description='Searches the results of run logs. '
+                          'The logs are indexed first, unless --no-update '
+                          'is given.')
+    parser.add_option('-d', '--directory', action='append',
+                      dest='directories', metavar='DIR',
+                      help='indexes the logs of a directory, which can be ' +
+                           'given more than once [default: ' + LOG_PATH + ']')
+    parser.add_option('-l', '--level', action='append', dest='levels',
+                      choices=LEVELS, type='choice',
+                      help='finds results of a level: ' + ', '.join(LEVELS))
+    parser.add_option('-c', '--testcase', dest='testcase',
+                      help='finds results of a testcase')
+    parser.add_option('-t', '--test', dest='test',
+                      help='finds results of a test')
+    parser.add_option('-m', '--module', dest='module',
+                      help='finds results of a module')
+    parser.add_option('-s', '--system', dest='system',
+                      help='finds results of runs against a system')
+    parser.add_option('--since', dest='since', metavar='DATE',
+                      help='finds results at or after a date, like ' +
+                           '2016-11-21 or "2016-11-21 18:21:35"')
+    parser.add_option('--until', dest='until', metavar='DATE',
+                      help='finds results at or before a date, up to the ' +
+                           'end of the day if no time is given')
+    parser.add_option('-n', '--limit', dest='limit', type='int',
+                      help='shows at most this many results')
+    parser.add_option('--index', dest='index', metavar='FILE',
+                      help='uses an index file [default: ' +
+                           os.path.join(PYTEST_CACHE_PATH, LOG_INDEX) + ']')
+    parser.add_option('--no-update', action='store_false', dest='update',
+                      default=True, help='searches without indexing new logs')
+    parser.add_option('--all', action='store_true', dest='all',
+                      default=False,
+                      help='indexes logs of runs that did not finish')
+    options, args = parser.parse_args()
+    if args:
+        parser.error('unexpected arguments: ' + ' '.join(args))
+    try:
+        since = parse_time(options.since) if options.since else None
+        until = (parse_time(options.until, end=True) if options.until
+                 else None)
+    except ValueError as e:
+        parser.error(str(e))
+    index = LogIndex(options.index)
+    try:
+        if options.update:
+            start = time.time()
+            count = index.update(options.directories or [LOG_PATH],
+                                 options.all)
+            if count:
+                sys.stderr.write('Indexed {0} log files in {1:.2f} '
+                                 'seconds\n'.format(count,
+                                                    time.time() - start))
+        start = time.time()
+        rows = index.search(options.levels, options.testcase, options.test,
+                            options.module, options.system, since, until,
+                            options.limit)
+        for (result_time, level, module, test, testcase, path, line, message,
+             systems) in rows:
+            print('{0} [{1}] {2} {3}.{4}.{5} {6}:{7} {8}'.format(
+                  time.strftime(TIME, time.localtime(result_time)), level,
+                  systems or '-', module, test, testcase, path, line,
+                  message))
+        sys.stderr.write('{0} results in {1:.1f} ms\n'.format(
+                         len(rows), (time.time() - start) * 1000))
+    finally:
+        index.close()
@@ -0,0 +1,335 @@
+"""
+This module provides the manifest of the test modules, which describes the
+tests of a module without importing it.
+"""
+
+import os
+import ast
+import json
+import logging
+from pytest.globals import PYTEST_CACHE_PATH, PYTEST_TESTS_PATH, check_make_dir
+
+
+MANIFEST = 'manifest'
+#: The full name of the base class of tests.
+TEST_CLASS = 'pytest.test.Test'
+
+
+class Manifest(object):
+    """Manifest of the modules in the tests directories. A module is described
+    by its `TESTS`, imports and classes, and a class by its bases,
+    `TESTCASES`, methods and `notest` flag, as read from the source. The
+    manifest is written by `--build-manifest`. A module whose source changed
+    since then is read again when it is listed, and is imported and inspected
+    when it is run.
+
+    :param list roots: The tests directories.
+    :param str path: The path of the manifest file.
+    """
+
+    def __init__(self, roots=None, path=None):
+        if roots is None:
+            roots = [PYTEST_TESTS_PATH]
+        if path is None:
+            path = os.path.join(PYTEST_CACHE_PATH, MANIFEST)
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.path = path
+        self.modules = None
+
+    def load(self):
+        """Reads the manifest file once.
+
+        :returns: The dictionary of module names to modules.
+        :rtype: dict
+        """
+        if self.modules is None:
+            try:
+                with open(self.path) as manifest_file:
+                    data = json.load(manifest_file)
+            except (IOError, ValueError):
+                data = None
+            if type(data) is not dict or data.get('roots') != self.roots:
+                data = {'modules': {}}
+            self.modules = data['modules']
+        return self.modules
+
+    def save(self):
+        """Writes the manifest file.
+        """
+        check_make_dir(os.path.dirname(self.path), log=False, error=True)
+        temp = '{0}.{1}'.format(self.path, os.getpid())
+        with open(temp, 'w') as manifest_file:
+            json.dump({'roots': self.roots, 'modules': self.load()},
+                      manifest_file, indent=1, sort_keys=True)
+        os.rename(temp, self.path)
+
+    def build(self):
+        """Reads every module in the tests directories and writes the
+        manifest file. Only directories that are packages are walked.
+
+        :returns: The dictionary of module names to modules.
+        :rtype: dict
+        """
+        modules = {}
+        for root in self.roots:
+            for directory, directories, files in os.walk(root):
+                package = os.path.relpath(directory, root)
+                if package == os.curdir:
+                    prefix = ''
+                else:
+                    prefix = package.replace(os.sep, '.') + '.'
+                directories[:] = sorted(
+                    name for name in directories
+                    if os.path.isfile(os.path.join(directory, name,
+                                                   '__init__.py')))
+                for file_name in sorted(files):
+                    if not file_name.endswith('.py'):
+                        continue
+                    if file_name == '__init__.py':
+                        if not prefix:
+                            continue
+                        name = prefix[:-1]
+                    else:
+                        name = prefix + file_name[:-3]
+                    if name in modules:
+                        continue
+                    try:
+                        modules[name] = parse_module(
+                            os.path.join(directory, file_name))
+                    except (IOError, SyntaxError, TypeError) as e:
+                        logging.warning('Could not read module ' + name +
+                                        ': ' + str(e))
+        self.modules = modules
+        self.save()
+        return modules
+
+    def find(self, name):
+        """Finds the source of a module in the tests directories.
+
+        :param str name: The name of the module.
+        :returns: The path or `None` if the module is not found.
+        :rtype: str
+        """
+        for root in self.roots:
+            base = os.path.join(root, *name.split('.'))
+            for candidate in [os.path.join(base, '__init__.py'),
+                              base + '.py']:
+                if os.path.isfile(candidate):
+                    return candidate
+        return None
+
+    def get_module(self, name, refresh=True):
+        """Gets a module.
+
+        :param str name: The name of the module.
+        :param bool refresh: The flag for reading a module that is missing
+            from the manifest or whose source changed.
+        :returns: The module or `None` if it is not found or not current.
+        :rtype: dict
+        """
+        modules = self.load()
+        module = modules.get(name)
+        if module is not None and get_mtime(module['path']) == module['mtime']:
+            return module
+        if not refresh:
+            return None
+        path = module['path'] if module is not None else self.find(name)
+        if path is None or get_mtime(path) is None:
+            path = self.find(name)
+            if path is None:
+                modules.pop(name, None)
+                return None
+        try:
+            module = parse_module(path)
+        except (IOError, SyntaxError, TypeError):
+            return None
+        modules[name] = module
+        return module
+
+    def resolve(self, module_name, name, refresh=True):
+        """Finds the class that a name of a module refers to, following
+        imports into other modules of the manifest.
+
+        :param str module_name: The name of the module.
+        :param str name: The name, which can be dotted like `tpm.TPMADM`.
+        :param bool refresh: See :meth:`get_module`.
+        :returns: The (module name, class name) tuple or `None` if the name
+            does not refer to a class of the manifest or to
+            :data:`TEST_CLASS`.
+        :rtype: tuple
+        """
+        for depth in range(10):
+            module = self.get_module(module_name, refresh)
+            if module is None:
+                return None
+            first, _, rest = name.partition('.')
+            if not rest and first in module['classes']:
+                return (module_name, first)
+            if not rest and first in module['imports']:
+                target = module['imports'][first]
+            elif rest and first in module['aliases']:
+                target = module['aliases'][first] + '.' + rest
+            else:
+                return None
+            if target == TEST_CLASS:
+                return tuple(TEST_CLASS.rsplit('.', 1))
+            target_module, _, name = target.rpartition('.')
+            package = module_name.rpartition('.')[0]
+            if (self.get_module(target_module, refresh) is None and package and
+                    self.get_module(package + '.' + target_module, refresh)):
+                target_module = package + '.' + target_module
+            module_name = target_module
+        return None
+
+    def describe(self, module_name, name, refresh=True, depth=0):
+        """Describes the class that a name of a module refers to, including
+        what it inherits.
+
+        :param str module_name: The name of the module.
+        :param str name: The name of the class.
+        :param bool refresh: See :meth:`get_module`.
+        :returns: The dictionary with the flag `test` for a subclass of
+            :data:`TEST_CLASS`, which is `None` if a base is unknown, the
+            `testcases`, the set of `methods` or `None` if a base is unknown,
+            and the `notest` flag. `None` is returned if the name does not
+            refer to a class or the class cannot be read from its source.
+        :rtype: dict
+        """
+        resolved = self.resolve(module_name, name, refresh)
+        if resolved is None or depth > 10:
+            return None
+        if '.'.join(resolved) == TEST_CLASS:
+            return {'test': True, 'testcases': None, 'methods': set(),
+                    'notest': False, 'base': True}
+        module_name, name = resolved
+        class_ = self.get_module(module_name, refresh)['classes'][name]
+        if class_['dynamic']:
+            return None
+        test = False
+        testcases = class_['testcases']
+        methods = set(class_['methods'])
+        for base in class_['bases']:
+            if base == 'object':
+                continue
+            info = self.describe(module_name, base, refresh, depth + 1)
+            if info is None:
+                test = test or None
+                methods = None
+                continue
+            test = test or info['test']
+            if testcases is None:
+                testcases = info['testcases']
+            if methods is not None and info['methods'] is not None:
+                methods |= info['methods']
+            else:
+                methods = None
+        return {'test': test, 'testcases': testcases, 'methods': methods,
+                'notest': class_['notest'], 'base': False}
+
+    def get_tests(self, module_name, refresh=True):
+        """Gets the test classes that are run when a module is run without
+        test names, the same way :func:`~pytest.setup.run` finds them by
+        inspecting the module.
+
+        :param str module_name: The name of the module.
+        :param bool refresh: See :meth:`get_module`.
+        :returns: The list of class names or `None` if the module is not in
+            the manifest or its tests cannot be read from its source.
+        :rtype: list
+        """
+        module = self.get_module(module_name, refresh)
+        if module is None or module['dynamic']:
+            return None
+        if module['tests'] is not None:
+            names = module['tests']
+        else:
+            names = sorted(set(module['classes']) | set(module['imports']))
+        tests = []
+        for name in names:
+            info = self.describe(module_name, name, refresh)
+            if info is None:
+                if name in module['classes']:
+                    return None
+                continue
+            if info['test'] is None:
+                return None
+            if info['test'] and not info['base']:
+                tests.append(str(name))
+        return tests
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_dotted(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        value = get_dotted(node.value)
+        if value is not None:
+            return value + '.' + node.attr
+    return None
+
+
+def parse_module(path):
+    """Reads the tests of a module from its source.
+
+    :param str path: The path of the source file.
+    :returns: The module.
+    :rtype: dict
+    """
+    with open(path) as source_file:
+        tree = ast.parse(source_file.read(), path)
+    module = {'path': path, 'mtime': get_mtime(path), 'tests': None,
+              'dynamic': False, 'imports': {}, 'aliases': {}, 'classes': {}}
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name == '*':
+                    module['dynamic'] = True
+                else:
+                    module['imports'][alias.asname or alias.name] = (
+                        (node.module or '') + '.' + alias.name).lstrip('.')
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    module['aliases'][alias.asname] = alias.name
+                else:
+                    first = alias.name.partition('.')[0]
+                    module['aliases'][first] = first
+        elif isinstance(node, ast.Assign):
+            if any(isinstance(target, ast.Name) and target.id == 'TESTS'
+                   for target in node.targets):
+                try:
+                    module['tests'] = list(ast.literal_eval(node.value))
+                except ValueError:
+                    module['dynamic'] = True
+        elif isinstance(node, ast.ClassDef):
+            module['classes'][node.name] = parse_class(node)
+    return module
+
+
+def parse_class(node):
+    class_ = {'bases': [get_dotted(base) for base in node.bases],
+              'testcases': None, 'notest': False, 'methods': [],
+              'dynamic': None in [get_dotted(base) for base in node.bases]}
+    for item in node.body:
+        if isinstance(item, ast.FunctionDef):
+            class_['methods'].append(item.name)
+        elif isinstance(item, ast.Assign):
+            for target in item.targets:
+                if not isinstance(target, ast.Name):
+                    continue
+                try:
+                    if target.id == 'TESTCASES':
+                        class_['testcases'] = list(
+                            ast.literal_eval(item.value))
+                    elif target.id == 'notest':
+                        class_['notest'] = bool(ast.literal_eval(item.value))
+                except ValueError:
+                    class_['dynamic'] = True
+    return class_
@@ -7,6 +7,7 @@ import logging
 from pexpect import TIMEOUT as TimeoutError
 from globals import log_empty, debug_logger, file_logger, sleep
 from pytest.ilom import ESCAPE
+from pytest.capture import Capture
 
 
 TIMEOUT = 600
@@ -36,11 +37,15 @@ def boot(self, disk=None, timeout=-1):
         command += ' ' + disk
     boot_list = [self.prompt, '(?i)Console Login:', TimeoutError]
     logging.info('Starting to boot. This might take a while...')
-    result = self.sendcmd(command, prompt=boot_list, timeout=timeout,
-                          debug=False).strip()
-    log_empty(result, level=logging.INFO, logger=[debug_logger, file_logger])
+    self.start_timeline('ok')
+    self.send(command)
+    self.expect_exact(command, timeout=timeout)
+    self.sendline()
+    result = self.capture(boot_list, timeout=timeout, capture=Capture('boot'))
+    self.stop_timeline()
+    result.log(level=logging.INFO, logger=[debug_logger, file_logger])
     if self.match_index == 0:
-        raise OpenBootError('Could not boot\n' + result)
+        raise OpenBootError('Could not boot\n' + str(result))
     elif self.match_index == 1:
         logging.info('Finished booting')
     else:
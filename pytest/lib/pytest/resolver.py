@@ -0,0 +1,189 @@
+"""
+This module resolves the names of subsystems concurrently and caches the
+addresses between runs.
+"""
+
+import os
+import time
+import socket
+import logging
+import datetime
+import threading
+from pytest.globals import Lock, LockError, PYTEST_CACHE_PATH, check_make_dir
+
+
+HOSTS = 'hosts'
+#: The seconds a cached address is used without resolving its name again.
+RESOLVE_TTL = 3600
+#: The seconds after the TTL that a cached address is still used right away
+#: while its name is resolved again in the background.
+RESOLVE_STALE = 86400
+RESOLVE_THREADS = 16
+#: The addresses resolved by this run.
+ADDRESSES = {}
+
+
+class Resolver(object):
+    """Resolver of subsystem names backed by a cache of resolved addresses
+    shared by every run of the user. Names missing from the cache are
+    resolved concurrently. A cached address within its TTL is used as is, a
+    stale address is used while its name is resolved again in a background
+    thread, and an expired address is only used if its name cannot be
+    resolved, for example while the DNS is down.
+
+    :param str path: The path of the cache file.
+    :param int ttl: The seconds a cached address is fresh.
+    :param int stale: The seconds after the TTL a cached address is stale.
+    :param int threads: The maximum number of concurrent lookups.
+    """
+
+    def __init__(self, path=None, ttl=RESOLVE_TTL, stale=RESOLVE_STALE,
+                 threads=RESOLVE_THREADS):
+        if path is None:
+            path = os.path.join(PYTEST_CACHE_PATH, HOSTS)
+        self.path = path
+        self.ttl = ttl
+        self.stale = stale
+        self.threads = threads
+        self.revalidation = None
+
+    def load(self):
+        """Reads the cache file.
+
+        :returns: The dictionary of names to (address, time) tuples.
+        :rtype: dict
+        """
+        try:
+            check_make_dir(os.path.dirname(self.path), log=False, error=True)
+            data = Lock(self.path, 'a').download(release=True, exit=False)
+        except (LockError, IOError, OSError) as e:
+            logging.debug('Could not read the host cache: ' + str(e))
+            data = None
+        if type(data) is not dict:
+            data = {}
+        return data
+
+    def save(self, addresses):
+        """Adds resolved addresses to the cache file.
+
+        :param dict addresses: The dictionary of names to addresses. Names
+            that could not be resolved are not added.
+        """
+        addresses = dict((name, address) for name, address
+                         in addresses.items() if address is not None)
+        if not addresses:
+            return
+        now = time.time()
+        try:
+            lock = Lock(self.path, 'a')
+            data = lock.download(release=False, exit=False)
+            if type(data) is not dict:
+                data = {}
+            for name, address in addresses.items():
+                data[name] = (address, now)
+            lock.upload(data, exit=False)
+        except (LockError, IOError, OSError) as e:
+            logging.debug('Could not write the host cache: ' + str(e))
+
+    def lookup(self, names):
+        """Resolves names with concurrent DNS lookups.
+
+        :param list names: The names.
+        :returns: The dictionary of names to addresses, where the address is
+            `None` if the name could not be resolved.
+        :rtype: dict
+        """
+        if len(names) <= 1:
+            return dict((name, gethostbyname(name)) for name in names)
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(self.threads, len(names)))
+        try:
+            return dict(zip(names, pool.map(gethostbyname, names)))
+        finally:
+            pool.close()
+
+    def revalidate(self, names):
+        self.save(self.lookup(names))
+
+    def resolve(self, names):
+        """Resolves names using the cache.
+
+        :param list names: The names.
+        :returns: The dictionary of names to addresses, where the address is
+            `None` if the name could not be resolved and was never cached.
+        :rtype: dict
+        """
+        now = time.time()
+        cache = self.load()
+        addresses = {}
+        missing = []
+        stale = []
+        for name in set(names):
+            if is_address(name):
+                addresses[name] = name
+                continue
+            address, resolved = cache.get(name, (None, 0))
+            age = now - resolved
+            if address is not None and 0 <= age < self.ttl:
+                addresses[name] = address
+            elif address is not None and 0 <= age < self.ttl + self.stale:
+                addresses[name] = address
+                stale.append(name)
+            else:
+                missing.append(name)
+        resolved = self.lookup(missing)
+        self.save(resolved)
+        for name in missing:
+            if resolved[name] is None and name in cache:
+                resolved_time = datetime.datetime.fromtimestamp(cache[name][1])
+                logging.warning('Could not resolve {0}. Using the address '
+                                'resolved on {1:%Y/%m/%d %H:%M:%S}'
+                                .format(name, resolved_time))
+                addresses[name] = cache[name][0]
+            else:
+                addresses[name] = resolved[name]
+        if stale:
+            self.revalidation = threading.Thread(target=self.revalidate,
+                                                 args=(stale,))
+            self.revalidation.daemon = True
+            self.revalidation.start()
+        return addresses
+
+
+def gethostbyname(name):
+    try:
+        return socket.gethostbyname(name)
+    except Exception:
+        return None
+
+
+def is_address(name):
+    """Checks if the name is an IPv4 address in dotted-quad notation.
+
+    :param str name: The name.
+    :rtype: bool
+    """
+    try:
+        socket.inet_aton(name)
+    except (socket.error, TypeError):
+        return False
+    return name.count('.') == 3
+
+
+def resolve(names, resolver=None):
+    """Resolves the names that were not resolved by this run yet and adds them
+    to :data:`ADDRESSES`.
+
+    :param list names: The names. `None` is ignored.
+    :param resolver: The :class:`Resolver`. If this is `None`, a resolver
+        with the default cache is used.
+    :returns: The :data:`ADDRESSES` dictionary.
+    :rtype: dict
+    """
+    names = [name for name in names
+             if name is not None and name not in ADDRESSES]
+    if names:
+        if resolver is None:
+            resolver = Resolver()
+        ADDRESSES.update(resolver.resolve(names))
+    return ADDRESSES
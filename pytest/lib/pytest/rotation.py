@@ -0,0 +1,163 @@
+"""
+This module provides log files that are rotated by size and age, with the
+finished segments compressed in the background.
+"""
+
+import os
+import gzip
+import time
+import shutil
+import logging
+import threading
+
+
+#: The bytes a segment grows to before the log file is rotated.
+LOG_MAX_BYTES = 64 * 1024 * 1024
+#: The seconds a segment is written to before the log file is rotated.
+LOG_MAX_AGE = 24 * 3600
+#: The bytes of the compressed segments of a log directory above which the
+#: oldest ones are removed.
+LOG_RETENTION = 4 * 1024 * 1024 * 1024
+COMPRESSED = '.gz'
+CHUNK_SIZE = 1024 * 1024
+#: The lock that keeps threads from pruning the same directory at once.
+RETENTION_LOCK = threading.Lock()
+
+
+class RotatingFileHandler(logging.FileHandler):
+    """File handler that moves the log file to a numbered segment, like
+    `name.log.1`, when it reaches a size or age, and starts the log file
+    again. A thread compresses each finished segment to `name.log.1.gz` and
+    then removes the oldest compressed segments of other logs in the
+    directory while the compressed segments are above the retention budget.
+    Uncompressed files are never removed and do not count against the
+    budget, since they can be the live logs of other runs, and the segments
+    of the log itself are kept whole. The directory is only scanned after a
+    rotation, so starting a log is not slowed down by old logs.
+
+    :param str path: The path of the log file.
+    :param int max_bytes: The bytes of a segment or 0 for no limit.
+    :param int max_age: The seconds of a segment or 0 for no limit.
+    :param int retention: The bytes of the compressed segments or 0 for no
+        limit.
+    """
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, max_age=LOG_MAX_AGE,
+                 retention=LOG_RETENTION):
+        logging.FileHandler.__init__(self, path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention = retention
+        self.segment = 0
+        self.started = time.time()
+        self.compressors = []
+
+    def should_rotate(self, record):
+        if self.stream is None:
+            return False
+        if self.max_age and record.created - self.started >= self.max_age:
+            return True
+        if self.max_bytes:
+            self.stream.seek(0, 2)
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    def rotate(self):
+        """Moves the log file to the next segment, starts compressing the
+        segment and opens the log file again.
+        """
+        self.stream.close()
+        self.stream = None
+        self.segment += 1
+        segment = '{0}.{1}'.format(self.baseFilename, self.segment)
+        os.rename(self.baseFilename, segment)
+        self.stream = self._open()
+        self.started = time.time()
+        compressor = threading.Thread(target=compress_segment,
+                                      args=(segment, self.retention,
+                                            self.baseFilename))
+        compressor.daemon = True
+        compressor.start()
+        self.compressors = [thread for thread in self.compressors
+                            if thread.is_alive()] + [compressor]
+
+    def emit(self, record):
+        try:
+            if self.should_rotate(record):
+                self.rotate()
+        except Exception:
+            self.handleError(record)
+        logging.FileHandler.emit(self, record)
+
+    def close(self):
+        """Closes the log file once the segments are compressed.
+        """
+        for compressor in self.compressors:
+            compressor.join()
+        self.compressors = []
+        logging.FileHandler.close(self)
+
+
+def compress_segment(path, retention=0, live=None):
+    """Compresses a segment in chunks and removes it, then applies the
+    retention budget to its directory.
+
+    :param str path: The path of the segment.
+    :param int retention: The bytes of the compressed segments or 0 for no
+        limit.
+    :param str live: The path of the log being written, whose segments are
+        kept, or `None`.
+    """
+    temp = path + COMPRESSED + '.tmp'
+    try:
+        with open(path, 'rb') as segment_file:
+            with gzip.open(temp, 'wb') as compressed_file:
+                shutil.copyfileobj(segment_file, compressed_file, CHUNK_SIZE)
+        os.rename(temp, path + COMPRESSED)
+        os.remove(path)
+    except (IOError, OSError) as e:
+        logging.debug('Could not compress ' + path + ': ' + str(e))
+        return
+    if retention:
+        apply_retention(os.path.dirname(path), retention, live)
+
+
+def apply_retention(directory, retention, live=None):
+    """Removes the oldest compressed segments of a directory until the
+    compressed segments take at most the retention budget. The segments of
+    the live log are never removed, so the budget can stay exceeded if they
+    alone are above it.
+
+    :param str directory: The directory.
+    :param int retention: The bytes of the compressed segments.
+    :param str live: The path of the log being written or `None`.
+    :returns: The paths that were removed.
+    :rtype: list
+    """
+    removed = []
+    prefix = None
+    if live is not None:
+        prefix = os.path.basename(live) + '.'
+    with RETENTION_LOCK:
+        files = []
+        total = 0
+        for name in os.listdir(directory):
+            if not name.endswith(COMPRESSED):
+                continue
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            total += stat.st_size
+            if prefix is None or not name.startswith(prefix):
+                files.append((stat.st_mtime, name, stat.st_size))
+        for mtime, name, size in sorted(files):
+            if total <= retention:
+                break
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                continue
+            total -= size
+            removed.append(os.path.join(directory, name))
+    return removed
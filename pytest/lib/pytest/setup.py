@@ -5,23 +5,34 @@ tests, and reports the results.
 
 import os
 import sys
-import pdb
 import time
-import socket
+import pickle
+import select
+import signal
 import logging
 import datetime
 import tempfile
 import traceback
 from datetime import datetime as dt
 from optparse import OptionParser, SUPPRESS_HELP
-from xml.etree import ElementTree
 from pytest.globals import *
 from pytest.test import *
-from pytest.connections import Connection
+from pytest import connections, environment, events, resolver, transcript
+from pytest.connections import Connection, BUI
+from pytest.cache import ResultCache
+from pytest.counters import Counters
+from pytest.capture import CAPTURES, remove_captures
+from pytest.checkpoint import Checkpoint, get_key
+from pytest.manifest import Manifest
+from pytest.rotation import (RotatingFileHandler, LOG_MAX_BYTES, LOG_MAX_AGE,
+                             LOG_RETENTION)
+from pytest.inventory import Inventory, read_component_data
 from pytest.environment import add_system, System, Subsystem, User, Component
 
 
 CURRENT_TEST = None
+#: The result counters of the run or `None` if they are not written.
+COUNTERS = None
 FORMAT = 'DEFAULT'
 FORMATS = {'DEFAULT':'%(asctime)s - [%(levelname)s] %(message)s',
            'DEBUG':'%(asctime)s - [%(module)s] [%(funcName)s] ' +
@@ -32,8 +43,12 @@ LEVELS = {'DEBUG':logging.DEBUG, 'INFO':logging.INFO,
           'PASS':PASS, 'SKIP':SKIP, 'FAIL':FAIL, 'ABORT':ABORT,
           'CRITICAL':logging.CRITICAL}
 STREAM = 'PASS'
+INVENTORY = Inventory(code=[environment, sys.modules[__name__]])
+MANIFEST = Manifest()
 TIME = '%Y/%m/%d %H:%M:%S'
 TIME_FILE = '%Y-%m-%d_%H-%M-%S-%f'
+SIMULATOR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir,
+                                         os.pardir, 'bin', 'simulator'))
 
 
 class OptionError(Exception):
@@ -57,92 +72,94 @@ def main(name=None, version='1.0', *args, **kwargs):
     :param str kwargs: The names of the keyword arguments and the default
         values. This is used to display the help message.
     """
+    global COUNTERS
     try:
         SECONDS = time.time()
         command = ' '.join(sys.argv)
         options, vargs = get_options(name, version, *args, **kwargs)
-        formatter = logging.Formatter(options.format, TIME)
+        if options.build_manifest:
+            modules = MANIFEST.build()
+            print('Wrote the manifest of {0} modules to {1}'.format(
+                len(modules), MANIFEST.path))
+            sys.exit(PASSED)
+        if options.list:
+            sys.exit(list_tests(getattr(options, 'tests', [])))
+        formatter = Formatter(options.format, TIME)
         stream_handler = logging.StreamHandler(sys.stdout)
         stream_handler.setLevel(options.verbosity)
         add_log_setting(stream_handler, formatter)
         stream_logger.addHandler(stream_handler)
 	logging.root.setLevel(logging.DEBUG)
+        if options.log_queue > 0 and not options.nolog:
+            signal.signal(signal.SIGTERM, terminate)
+        if options.simulate and connections.SIMULATOR is None:
+            connections.SIMULATOR = ' '.join([sys.executable, SIMULATOR])
         if not options.nolog:
             tmp_path = tempfile.gettempdir()
             debug_path = os.path.join(tmp_path, 'pytest_debug_logs')
             if not check_make_dir(debug_path):
                 sys.exit(FAILED)
             log_handler = start_log('', debug_path, FORMATS['DEBUG'],
-                                    LEVELS['DEBUG'])
+                                    LEVELS['DEBUG'], options)
             debug_logger.addHandler(log_handler)
             log_empty(command, logger=debug_logger)
+        groups = []
         if options.system:
-            for system in options.system:
-                try:
-                    system_file_path = get_systems_path(system)
-                    if system_file_path is not None:
-                        add_system(parse_system(system_file_path))
-                        logging.info('Added system {0}'.format(system))
-                    else:
-                        raise OptionError('System file does not exist')
-                except Exception as e:
-                    logging.warning('Could not add system ' + system + '\n' +
-
-                                    str_error(e))
+            resolve_systems([get_systems_path(system)
+                             for group in options.system
+                             for system in group.split(',')])
+            for group in options.system:
+                systems = []
+                for system in group.split(','):
+                    try:
+                        system_file_path = get_systems_path(system)
+                        if system_file_path is not None:
+                            system_instance = parse_system(system_file_path)
+                            add_system(system_instance)
+                            systems.append(system_instance)
+                            logging.info('Added system {0}'.format(system))
+                        else:
+                            raise OptionError('System file does not exist')
+                    except Exception as e:
+                        logging.warning('Could not add system ' + system +
+                                        '\n' + str_error(e))
+                if systems:
+                    groups.append(systems)
         else:
             logging.warning('No systems were added')
         if not options.nolog and not check_make_dir(options.directory):
             sys.exit(FAILED)
+        options.checkpoint = options.resume
+        if options.checkpoint is None and not options.nolog:
+            options.checkpoint = os.path.join(options.directory,
+                                              dt.now().strftime(TIME_FILE) +
+                                              '.checkpoint.jsonl')
+        if options.checkpoint is not None:
+            log_empty('Writing checkpoints to ' + options.checkpoint)
+        if options.counters is not None:
+            COUNTERS = Counters(options.counters)
+            COUNTERS.reset_latest()
+            log_empty('Writing counters to ' + options.counters)
+        if options.replay is not None:
+            transcript.start_replay(options.replay, delay=options.replay_delay)
+            if not options.replay_delay:
+                fast_forward()
+            log_empty('Replaying the transcripts of ' + options.replay)
         if name is not None:
             if name.endswith('.py'):
                 name = name[:-3]
             options.tests = [parse_test(name, vargs)]
         if name is None:
             log_empty('{0:=^79}'.format(' Running Tests '))
-        total_passed = 0
-        total_failed = 0
-        total_aborted = 0
-        for test in options.tests:
-            if type(test) is str:
-                test_name = 'Scenario ' + test
-                test_name_other = test
-            else:
-                test_name = 'Module ' + test[0]
-                test_name_other = test[0]
-            if not options.nolog:
-                log_handler = start_log(test_name_other, options.directory,
-                                        options.format, options.level)
-                file_logger.addHandler(log_handler)
-                log_empty(command, logger=file_logger)
-            log_empty('{0:=^79}'.format(' Running ' + test_name + ' '))
-            passed = 0
-            failed = 0
-            issues = 0
-            aborted = 0
-            try:
-                passed, failed, issues, aborted = run(test, options.debug)
-            except OptionError as e:
-                logging.log(SKIP, test_name + ' was skipped\n' +
-                            str_error(e))
-            except Exception as e:
-                logging.critical(test_name + ' failed to run\n\n' +
-                                 traceback.format_exc())
-                Connection.close_all()
-            log_empty('{0:=^79}'.format(''))
-            log_result(test_name)
-            log_empty('{0:=^79}'.format(''))
-            log_result('Passed: ' + str(passed))
-            log_result('Failed: ' + str(failed))
-            log_result('Issues: ' + str(issues))
-            log_result('Aborted: ' + str(aborted))
-            log_empty('{0:=^79}'.format(''))
-            total_passed += passed
-            total_failed += failed
-            total_aborted += aborted
-            if not options.nolog:
-                remove_log_setting(log_handler)
-                file_logger.removeHandler(log_handler)
-                log_handler.close()
+        if options.parallel > 1 and len(groups) > 1:
+            totals = run_parallel(groups, options, command)
+        else:
+            totals = run_tests(options, command)
+        total_passed, total_failed, total_aborted = totals
+        metrics = str_metrics()
+        if metrics:
+            log_empty('{0:=^79}'.format(' Metrics '))
+            log_empty(metrics)
         running_time = int(time.time() - SECONDS)
         running_time = str(datetime.timedelta(seconds=running_time))
         log_empty('{0:=^79}'.format(' Running Time: ' + running_time + ' '))
@@ -166,6 +183,258 @@ def main(name=None, version='1.0', *args, **kwargs):
         sys.exit(FAILED)
 
 
+def run_tests(options, command, report=None):
+    """Runs the tests of the options against the systems in the environment.
+
+    :param options: The parsed options.
+    :param str command: The command line that is logged at the top of every
+        log file.
+    :param function report: The function that is called with the tuple
+        (test name, passed, failed, issues, aborted) after every test.
+    :returns: The tuple (passed, failed, aborted) of the totals.
+    :rtype: tuple
+    """
+    cache = None
+    if options.incremental:
+        cache = ResultCache()
+    checkpoint = None
+    if options.checkpoint is not None:
+        checkpoint = Checkpoint(options.checkpoint)
+    total_passed = 0
+    total_failed = 0
+    total_aborted = 0
+    for test in options.tests:
+        if type(test) is str:
+            test_name = 'Scenario ' + test
+            test_name_other = test
+        else:
+            test_name = 'Module ' + test[0]
+            test_name_other = test[0]
+        if not options.nolog:
+            log_handler = start_log(test_name_other, options.directory,
+                                    options.format, options.level, options)
+            file_logger.addHandler(log_handler)
+            log_empty(command, logger=file_logger)
+            events.start_events(os.path.splitext(log_handler.baseFilename)[0] +
+                                '.events.jsonl')
+            if options.transcripts:
+                transcript.start_transcripts(
+                    os.path.splitext(log_handler.baseFilename)[0] +
+                    '.transcripts')
+        log_empty('{0:=^79}'.format(' Running ' + test_name + ' '))
+        events.emit('run start', name=test_name_other, command=command)
+        start = monotonic()
+        passed = 0
+        failed = 0
+        issues = 0
+        aborted = 0
+        try:
+            passed, failed, issues, aborted = run(test, options.debug,
+                                                  options.jobs, cache,
+                                                  checkpoint)
+        except OptionError as e:
+            logging.log(SKIP, test_name + ' was skipped\n' +
+                        str_error(e))
+        except Exception as e:
+            logging.critical(test_name + ' failed to run\n\n' +
+                             traceback.format_exc())
+            Connection.close_all()
+        log_empty('{0:=^79}'.format(''))
+        log_result(test_name)
+        log_empty('{0:=^79}'.format(''))
+        log_result('Passed: ' + str(passed))
+        log_result('Failed: ' + str(failed))
+        log_result('Issues: ' + str(issues))
+        log_result('Aborted: ' + str(aborted))
+        log_empty('{0:=^79}'.format(''))
+        events.set_context(module=None, test=None, testcase=None)
+        events.emit('run end', name=test_name_other, passed=passed,
+                    failed=failed, issues=issues, aborted=aborted,
+                    duration=monotonic() - start)
+        total_passed += passed
+        total_failed += failed
+        total_aborted += aborted
+        if report is not None:
+            report((test_name, passed, failed, issues, aborted))
+        if not options.nolog:
+            events.stop_events()
+            transcript.stop_transcripts()
+            remove_log_setting(log_handler)
+            file_logger.removeHandler(log_handler)
+            log_handler.close()
+    if checkpoint is not None:
+        checkpoint.close()
+    return (total_passed, total_failed, total_aborted)
+
+
+def run_parallel(groups, options, command):
+    """Runs the tests in a forked worker for every group of systems. At most
+    `options.parallel` workers run at a time. Every worker has only its group
+    in :data:`~pytest.environment.SYSTEMS`, its own connection registry and
+    its own log directory named after the group. The results of the workers
+    are streamed back through pipes as they finish each test.
+
+    :param list groups: The list of lists of systems.
+    :param options: The parsed options.
+    :param str command: The command line.
+    :returns: The tuple (passed, failed, aborted) of the totals.
+    :rtype: tuple
+    """
+    pending = list(groups)
+    workers = {}
+    results = {}
+    finished = set()
+    while pending or workers:
+        while pending and len(workers) < options.parallel:
+            systems = pending.pop(0)
+            group = '+'.join(system.name for system in systems)
+            pid, pipe = fork_worker(workers, run_worker, systems, group,
+                                    options, command)
+            workers[pipe.fileno()] = (pid, group, pipe)
+            results[group] = [0, 0, 0, 0]
+            logging.info('Started worker {0} for {1}'.format(pid, group))
+        for group, kind, value in read_workers(workers):
+            if kind == 'result':
+                test_name, passed, failed, issues, aborted = value
+                for i, count in enumerate([passed, failed, issues, aborted]):
+                    results[group][i] += count
+                logging.info('{0} finished {1}: '.format(group, test_name) +
+                             '{0} passed, {1} failed, '.format(passed, failed) +
+                             '{0} issues, {1} aborted'.format(issues, aborted))
+            elif kind == 'done':
+                finished.add(group)
+            elif kind == 'exit' and (value or group not in finished):
+                if not value:
+                    logging.warning('Worker for {0} exited '.format(group) +
+                                    'without finishing its tests')
+                results[group][3] += 1
+    table = [('Group', 'Passed', 'Failed', 'Issues', 'Aborted')]
+    for group in sorted(results):
+        table.append([group] + results[group])
+    log_empty('{0:=^79}'.format(' Parallel Results '))
+    log_empty(str_table(table))
+    return (sum(result[0] for result in results.values()),
+            sum(result[1] for result in results.values()),
+            sum(result[3] for result in results.values()))
+
+
+def run_worker(pipe, systems, group, options, command):
+    """Runs the tests against a group of systems in a forked worker and writes
+    the results to the pipe.
+
+    :param file pipe: The pipe to the parent.
+    :param list systems: The systems of the group.
+    :param str group: The name of the group.
+    :param options: The parsed options.
+    :param str command: The command line.
+    :returns: The exit status.
+    :rtype: int
+    """
+    environment.SYSTEMS[:] = systems
+    prefix_logs('[' + group + '] ')
+    options.directory = os.path.join(options.directory, group)
+    if not options.nolog and not check_make_dir(options.directory):
+        return FAILED
+
+    def report(result):
+        send_worker(pipe, 'result', result)
+
+    passed, failed, aborted = run_tests(options, command, report)
+    send_worker(pipe, 'done', (passed, failed, aborted))
+    if failed or aborted:
+        return FAILED
+    return PASSED
+
+
+def fork_worker(workers, function, *args):
+    """Forks a worker that calls the function with a pipe to the parent and
+    the arguments. The worker starts with empty connection registries and
+    metrics, and its metrics are sent to the parent when the function returns.
+
+    :param dict workers: The running workers keyed by file descriptor. Their
+        pipes are closed in the new worker.
+    :param function function: The function that returns the exit status.
+    :returns: The tuple (pid, pipe) of the worker.
+    :rtype: tuple
+    """
+    read_fd, write_fd = os.pipe()
+    flush_logs()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        for fd in workers:
+            os.close(fd)
+        code = FAILED
+        try:
+            for class_ in [Connection, BUI] + Connection.__subclasses__():
+                class_.CONNECTIONS[:] = []
+            METRICS.clear()
+            pipe = os.fdopen(write_fd, 'wb')
+            code = function(pipe, *args)
+            send_worker(pipe, 'metrics', METRICS)
+            pipe.close()
+        except KeyboardInterrupt:
+            shutdown()
+        except BaseException:
+            traceback.print_exc()
+        flush_logs()
+        os._exit(code)
+    os.close(write_fd)
+    return (pid, os.fdopen(read_fd, 'rb', 0))
+
+
+def send_worker(pipe, kind, value):
+    pickle.dump((kind, value), pipe, pickle.HIGHEST_PROTOCOL)
+    pipe.flush()
+
+
+def read_workers(workers):
+    """Waits for records from the workers. The metrics of the workers are
+    added to the run metrics. A worker is removed once its pipe is closed and
+    an `exit` record is returned with the signal that killed the worker, or 0
+    if it exited. The exit status of a worker that exited is not an error,
+    since workers exit with :data:`FAILED` when a testcase failed.
+
+    :param dict workers: The running workers as (pid, name, pipe) tuples keyed
+        by file descriptor.
+    :returns: The list of (name, kind, value) records.
+    :rtype: list
+    """
+    records = []
+    for fd in select.select(list(workers), [], [])[0]:
+        pid, name, pipe = workers[fd]
+        try:
+            kind, value = pickle.load(pipe)
+        except (EOFError, pickle.UnpicklingError):
+            pipe.close()
+            del workers[fd]
+            status = os.waitpid(pid, 0)[1]
+            signum = 0
+            if os.WIFSIGNALED(status):
+                signum = os.WTERMSIG(status)
+                logging.warning('Worker {0} for {1} '.format(pid, name) +
+                                'was killed by signal {0}'.format(signum))
+            records.append((name, 'exit', signum))
+            continue
+        if kind == 'metrics':
+            for metric, values in value.items():
+                METRICS.setdefault(metric, []).extend(values)
+        else:
+            records.append((name, kind, value))
+    return records
+
+
+def prefix_logs(prefix):
+    """Prefixes the format of every log handler, so that the output of
+    concurrent workers can be told apart.
+
+    :param str prefix: The prefix.
+    """
+    for handler, formatter in LOG_SETTINGS.items():
+        formatter = Formatter(prefix + formatter._fmt, formatter.datefmt)
+        add_log_setting(handler, formatter)
+
+
 def shutdown():
     try:
         CURRENT_TEST.cleanup()
@@ -180,6 +449,16 @@ def shutdown():
     logging.shutdown()
 
 
+def terminate(signum, frame):
+    """Writes the queued log records and lets the signal end the process. The
+    queues are drained without waiting on them, since the signal can arrive
+    while the main thread holds the mutex of a queue.
+    """
+    drain_logs()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
 def get_options(name, version, *args, **kwargs):
     arguments = ' '.join(args)
     kwargument_list = ['{0}={1}'.format(key, value)
@@ -196,9 +475,30 @@ def get_options(name, version, *args, **kwargs):
         parser.add_option('-c', '--scenario', action='callback',
                           callback=add_test, type='string',
                           help='scenario file to be run')
+        parser.add_option('--build-manifest', action='store_true',
+                          dest='build_manifest', default=False,
+                          help='writes the manifest of the test modules ' +
+                               'and exits')
+        parser.add_option('--list', action='store_true', dest='list',
+                          default=False,
+                          help='lists the tests and testcases to be run ' +
+                               'from the manifest and exits')
+    else:
+        parser.set_defaults(build_manifest=False, list=False)
     parser.add_option('-s', '--system',
                       action='append', dest='system',
-                      help='system required by test')
+                      help='system required by test. A comma separated ' +
+                           'list of systems is a group for --parallel')
+    parser.add_option('-p', '--parallel', action='store', dest='parallel',
+                      type='int', default=0,
+                      help='runs the tests in a worker per system group ' +
+                           'with up to PARALLEL workers at a time')
+    parser.add_option('-j', '--jobs', action='store', dest='jobs',
+                      type='int', default=0,
+                      help='runs up to JOBS entries of a scheduled scenario ' +
+                           'at a time. By default, every entry whose ' +
+                           'dependencies finished and whose resources are ' +
+                           'free runs')
     parser.add_option('-d', '--directory',
                       action='store', dest='directory',
                       help='specifies log directory')
@@ -216,6 +516,63 @@ def get_options(name, version, *args, **kwargs):
                       help='outputs on the command line')
     parser.add_option('--nolog', action='store_true', dest='nolog',
                       default=False, help='inhibits log creation')
+    parser.add_option('--log-queue', action='store', type='int',
+                      dest='log_queue', default=LOG_QUEUE_SIZE,
+                      metavar='RECORDS',
+                      help='queues log records for the log files and writes ' +
+                           'them from a thread, or writes them synchronously ' +
+                           'if this is 0 [default: %default]')
+    parser.add_option('--log-overflow', action='store', type='choice',
+                      dest='log_overflow', default=LOG_BLOCK,
+                      choices=[LOG_BLOCK, LOG_DROP],
+                      help='waits for room (block) or drops records (drop) ' +
+                           'when a log queue is full [default: %default]')
+    parser.add_option('--log-size', action='store', type='int',
+                      dest='log_size', default=LOG_MAX_BYTES // 1024 // 1024,
+                      metavar='MB',
+                      help='rotates a log file when it reaches this size, ' +
+                           'or never if this is 0 [default: %default]')
+    parser.add_option('--log-age', action='store', type='int',
+                      dest='log_age', default=LOG_MAX_AGE // 3600,
+                      metavar='HOURS',
+                      help='rotates a log file when it was written to for ' +
+                           'this long, or never if this is 0 ' +
+                           '[default: %default]')
+    parser.add_option('--log-retention', action='store', type='int',
+                      dest='log_retention',
+                      default=LOG_RETENTION // 1024 // 1024, metavar='MB',
+                      help='removes the oldest compressed log segments of ' +
+                           'a log directory while they take more than this ' +
+                           'size, or none if this is 0 [default: %default]')
+    parser.add_option('--incremental', action='store_true',
+                      dest='incremental', default=False,
+                      help='skips testcases that passed before against the ' +
+                           'same test module, arguments and system firmware')
+    parser.add_option('--resume', action='store', dest='resume',
+                      metavar='CHECKPOINT',
+                      help='skips the testcases finished in the checkpoint ' +
+                           'file of a run and carries their results forward')
+    parser.add_option('--counters', action='store', dest='counters',
+                      metavar='FILE',
+                      help='counts the results in a memory mapped file that ' +
+                           'monitors can read during the run')
+    parser.add_option('--transcripts', action='store_true',
+                      dest='transcripts', default=False,
+                      help='records the bytes sent and read by every ' +
+                           'connection with their times in transcripts ' +
+                           'next to the log')
+    parser.add_option('--replay', action='store', dest='replay',
+                      metavar='DIR',
+                      help='serves the connections from the transcripts ' +
+                           'of a directory instead of the systems and ' +
+                           'skips the sleeps of the tests')
+    parser.add_option('--replay-delay', action='store_true',
+                      dest='replay_delay', default=False,
+                      help='replays the output of the transcripts no ' +
+                           'sooner than it was recorded and keeps the sleeps')
+    parser.add_option('--simulate', action='store_true', dest='simulate',
+                      default=False,
+                      help='connects to the simulator instead of the systems')
     parser.add_option('--debug', action='store_true', dest='debug',
                       default=False, help=SUPPRESS_HELP)
     try:
@@ -225,7 +582,8 @@ def get_options(name, version, *args, **kwargs):
         print('')
         print(str_error(e))
         sys.exit(FAILED)
-    if name is None and not hasattr(options, 'tests'):
+    if (name is None and not hasattr(options, 'tests') and
+        not options.build_manifest and not options.list):
         parser.print_help()
         print('')
         print('OptionError: At least one test or scenario required')
@@ -244,21 +602,122 @@ def get_options(name, version, *args, **kwargs):
     return (options, vargs)
 
 
-def start_log(name, directory, format, level):
+def start_log(name, directory, format, level, options=None):
+    """Starts a log file in a directory and adds it to the log settings.
+
+    :param str name: The name the log file starts with.
+    :param str directory: The directory.
+    :param str format: The format of the records.
+    :param int level: The level of the handler.
+    :param options: The parsed options with the rotation of the log file, the
+        size of its queue and the policy for a full queue. If this is `None`,
+        the log file is not rotated and records are written synchronously.
+    :returns: The handler.
+    :rtype: Handler
+    """
     name = name.replace(os.sep, '.')
     if name:
         log_name = '{0}_{1}.log'.format(name, dt.now().strftime(TIME_FILE))
     else:
         log_name = dt.now().strftime(TIME_FILE) + '.log'
     log_file = os.path.join(directory, log_name)
-    log_handler = logging.FileHandler(log_file)
-    log_formatter = logging.Formatter(format, TIME)
+    if options is None:
+        log_handler = logging.FileHandler(log_file)
+    else:
+        log_handler = RotatingFileHandler(log_file,
+                                          options.log_size * 1024 * 1024,
+                                          options.log_age * 3600,
+                                          options.log_retention * 1024 * 1024)
+    log_formatter = Formatter(format, TIME)
     log_handler.setLevel(level)
+    if options is not None and options.log_queue > 0:
+        log_handler = QueueHandler(log_handler, options.log_queue,
+                                   options.log_overflow)
     add_log_setting(log_handler, log_formatter)
     return log_handler
 
 
+def resolve_systems(paths):
+    """Resolves the names of the subsystems in the system files
+    concurrently, so that :func:`parse_system` finds their addresses in
+    :data:`~pytest.resolver.ADDRESSES`.
+
+    :param list paths: The paths of the system files. `None` is ignored.
+    """
+    names = []
+    for path in paths:
+        if path is None:
+            continue
+        try:
+            system_instance, warnings = load_system(path, save=False)
+        except Exception:
+            continue
+        names.extend(subsystem.name for subsystem
+                     in system_instance.subsystems.values())
+    INVENTORY.save()
+    resolver.resolve(names)
+
+
+def load_system(system, save=True):
+    """Loads a system file from the inventory or parses it if its sources
+    changed.
+
+    :param str system: The path of the system file.
+    :param bool save: The flag for writing the inventory after parsing.
+    :returns: The (system, warnings) tuple of the system without addresses
+        and the warnings of parsing it.
+    :rtype: tuple
+    """
+    cached = INVENTORY.get(system)
+    if cached is not None:
+        return cached
+    warnings = []
+    sources = []
+    system_instance = compile_system(system, warnings, sources)
+    INVENTORY.put(system, system_instance, warnings, sources, save)
+    return (system_instance, warnings)
+
+
 def parse_system(system, log=True):
+    """Parses a system file and resolves the addresses of its subsystems.
+    The parsed system is taken from the inventory if its sources did not
+    change.
+
+    :param str system: The path of the system file.
+    :param bool log: The flag for logging warnings.
+    :returns: The system.
+    :rtype: System
+    """
+    system_instance, warnings = load_system(system)
+    if log:
+        for warning in warnings:
+            logging.warning(warning)
+    names = [subsystem.name for subsystem
+             in system_instance.subsystems.values()]
+    addresses = resolver.resolve(names)
+    for type, subsystem_instance in system_instance.subsystems.items():
+        subsystem_instance.address = addresses.get(subsystem_instance.name)
+        if subsystem_instance.address is None:
+            if log:
+                logging.warning('Could not process IP address ' +
+                                'for {0}. '.format(subsystem_instance.name) +
+                                'Not adding {0}...'.format(type))
+            del system_instance.subsystems[type]
+    return system_instance
+
+
+def compile_system(system, warnings, sources):
+    """Parses a system file without resolving the addresses of its
+    subsystems.
+
+    :param str system: The path of the system file.
+    :param list warnings: The list to add the warnings to.
+    :param list sources: The list to add the paths of the component data
+        files to.
+    :returns: The system.
+    :rtype: System
+    """
+    from xml.etree import ElementTree
     tree = ElementTree.parse(system)
     root = tree.getroot()
     system_name = root.tag
@@ -274,23 +733,12 @@ def parse_system(system, log=True):
     system_instance = System(system_name, VNC)
     for child in list(root):
         name = child.get('name')
-        try:
-            address = socket.gethostbyname(name)
-        except Exception:
-            address = None
         type = child.tag
         if name is None:
-            if log:
-                logging.warning('Subsystem {0} requires name. '.format(type) +
-                                'Not adding {0}...'.format(type))
+            warnings.append('Subsystem {0} requires name. '.format(type) +
+                            'Not adding {0}...'.format(type))
             continue
-        if address is None:
-            if log:
-                logging.warning('Could not process IP address ' +
-                                'for {0}. '.format(name) +
-                                'Not adding {0}...'.format(type))
-            continue
-        subsystem_instance = Subsystem(name, address, type)
+        subsystem_instance = Subsystem(name, None, type)
         system_instance.subsystems[type] = subsystem_instance
         for grandchild in list(child):
             key = grandchild.tag.lower()
@@ -298,10 +746,9 @@ def parse_system(system, log=True):
                 try:
                     name = grandchild.find('name').text
                 except AttributeError:
-                    if log:
-                        logging.warning('User requires name. ' +
-                                        'Not adding user in ' +
-                                        subsystem_instance.type + '...')
+                    warnings.append('User requires name. ' +
+                                    'Not adding user in ' +
+                                    subsystem_instance.type + '...')
                     continue
                 if name is None:
                     name = ''
@@ -310,9 +757,8 @@ def parse_system(system, log=True):
                     prompt = grandchild.find('prompt').text
                     type = grandchild.find('type').text
                 except AttributeError:
-                    if log:
-                        logging.warning('Could not process user ' + name +
-                                        ' in ' + subsystem_instance.type)
+                    warnings.append('Could not process user ' + name +
+                                    ' in ' + subsystem_instance.type)
                     continue
                 if password is None:
                     password = ''
@@ -324,34 +770,20 @@ def parse_system(system, log=True):
                 subsystem_instance.users[name] = user
             else:
                 try:
-                    component = process_component(grandchild, log=log)
+                    component = process_component(grandchild,
+                                                  warnings=warnings)
                 except OptionError as e:
-                    if log:
-                        logging.warning(str(e) + '. Not adding component ' +
-                                        grandchild.tag + ' in ' +
-                                        subsystem_instance.type + '...')
+                    warnings.append(str(e) + '. Not adding component ' +
+                                    grandchild.tag + ' in ' +
+                                    subsystem_instance.type + '...')
                     continue
                 key += 's'
-                try:
-                    type = component.type
-                    path = os.path.join(PYTEST_DATA_PATH, key, type)
-                    f = open(path, 'r')
-                    lines = [line.strip() for line in f.readlines()
-                             if line.strip() and not line.startswith('#')]
-                    f.close()
-                    values = {}
-                    for line in lines:
-                        try:
-                            k, value = line.split(':', 1)
-                            k = k.strip()
-                            value = value.strip()
-                            if k and value:
-                                values[k] = value
-                        except ValueError:
-                            continue
-                    component.values = values
-                except Exception:
-                    pass
+                if hasattr(component, 'type'):
+                    path = os.path.join(PYTEST_DATA_PATH, key, component.type)
+                    sources.append(path)
+                    values = read_component_data(path)
+                    if values is not None:
+                        component.values = values
                 try:
                     getattr(subsystem_instance, key)[component.name] = component
                 except AttributeError:
@@ -359,7 +791,7 @@ def parse_system(system, log=True):
     return system_instance
 
 
-def process_component(component, log=True):
+def process_component(component, log=True, warnings=None):
     name = ''
     found = False
     dictionary = {}
@@ -373,11 +805,15 @@ def process_component(component, log=True):
             found = True
         elif list(child):
             try:
-                subcomponent = process_component(child, log=log)
+                subcomponent = process_component(child, log=log,
+                                                 warnings=warnings)
             except OptionError as e:
-                if log:
-                    logging.warning(str(e) + '. Not adding component ' +
-                                    child.tag + ' in ' + name + '...')
+                message = (str(e) + '. Not adding component ' + child.tag +
+                           ' in ' + name + '...')
+                if warnings is not None:
+                    warnings.append(message)
+                elif log:
+                    logging.warning(message)
                 continue
             key += 's'
             try:
@@ -397,7 +833,7 @@ def process_component(component, log=True):
     return component
 
 
-def run(test, debug):
+def run(test, debug, jobs=0, cache=None, checkpoint=None):
     global CURRENT_TEST
     passed = 0
     failed = 0
@@ -410,13 +846,19 @@ def run(test, debug):
         f = open(file_path)
         tests = f.readlines()
         f.close()
+        for t in tests:
+            if not t.startswith('#') and \
+               any(token.startswith('@') for token in t.split()):
+                return run_schedule(test, tests, debug, jobs, cache,
+                                    checkpoint)
         for t in tests:
             if not t.startswith('#'):
                 test_list = t.split()
                 try:
                     module = test_list[0]
                     values = test_list[1:]
-                    result = run(parse_test(module, values), debug)
+                    result = run(parse_test(module, values), debug, jobs,
+                                 cache, checkpoint)
                     passed += result[0]
                     failed += result[1]
                     issues += result[2]
@@ -437,24 +879,26 @@ def run(test, debug):
         args = test[3]
         kwargs = test[4]
         if not class_names:
-            try:
-                tests = module.TESTS
-            except AttributeError:
-                tests = []
-            inspect_list = []
-            for name in tests:
+            class_names = MANIFEST.get_tests(module_name, refresh=False)
+            if class_names is None:
                 try:
-                    attribute = getattr(module, name)
-                except Exception:
-                    logging.warning('Module {0} does not '.format(module) +
-                                    'contain test {0}'.format(name))
-                inspect_list.append((name, attribute))
-            if not inspect_list:
-                inspect_list = inspect.getmembers(module)
-            class_names = [name for name, attribute in inspect_list
-                           if (inspect.isclass(attribute) and
-                               issubclass(attribute, Test) and
-                               attribute is not Test)]
+                    tests = module.TESTS
+                except AttributeError:
+                    tests = []
+                inspect_list = []
+                for name in tests:
+                    try:
+                        attribute = getattr(module, name)
+                    except Exception:
+                        logging.warning('Module {0} does not contain test '
+                                        '{1}'.format(module, name))
+                    inspect_list.append((name, attribute))
+                if not inspect_list:
+                    inspect_list = inspect.getmembers(module)
+                class_names = [name for name, attribute in inspect_list
+                               if (inspect.isclass(attribute) and
+                                   issubclass(attribute, Test) and
+                                   attribute is not Test)]
             number = len(class_names)
             method_names = []
             args = []
@@ -476,12 +920,22 @@ def run(test, debug):
             log_empty('{0:*^79}'.format(' Running Test ' +
                                         class_description + ' '),
                       level=logging.INFO)
+            test_start = monotonic()
+            test_timings = get_timings()
+            test_captures = set(CAPTURES)
+            timing_rows = []
+            events.set_context(module=module_name, test=class_description,
+                               testcase=None,
+                               systems=[system.name for system
+                                        in environment.SYSTEMS])
+            events.emit('test start')
             try:
                 class_ = getattr(module, class_name)
                 if not issubclass(class_, Test) and class_ is not Test:
                     logging.log(SKIP, 'Test {0} in '.format(class_description) +
                                 module_name + ' was skipped\n' +
                                 'TestError: Not a subclass of Test')
+                    events.emit('test skip', reason='Not a subclass of Test')
                     continue
                 try:
                     if class_.__dict__['notest']:
@@ -489,15 +943,38 @@ def run(test, debug):
                                     'Test {0} in '. format(class_description) +
                                     module_name + ' was skipped\n' +
                                     "TestError: Flag 'notest' was set")
+                        events.emit('test skip', reason="Flag 'notest' was set")
                         continue
                 except KeyError:
                     pass
+                if checkpoint is not None:
+                    finished = [checkpoint.get(key) for key
+                                in get_checkpoint_keys(
+                                    module_name, class_name,
+                                    class_method_names or
+                                    getattr(class_, 'TESTCASES', []),
+                                    args[i], kwargs[i])]
+                    if finished and None not in finished:
+                        for counts in finished:
+                            passed += counts['passed']
+                            failed += counts['failed']
+                            issues += counts['issues']
+                            aborted += counts['aborted']
+                        logging.log(SKIP,
+                                    'Test {0} in '.format(class_description) +
+                                    module_name + ' was skipped\n' +
+                                    'Resume: All testcases finished before')
+                        events.emit('test skip', reason='Resume')
+                        continue
                 class_instance = class_(*class_args, **class_kwargs)
                 CURRENT_TEST = class_instance
+                class_instance.info_counters = COUNTERS
             except Exception:
                 logging.log(SKIP, 'Test {0} in '.format(class_description) +
                             module_name + ' was skipped\n\n' +
                             traceback.format_exc())
+                events.emit('test skip',
+                            reason=traceback.format_exc().splitlines()[-1])
                 Connection.close_all()
                 continue
             if not class_method_names:
@@ -522,12 +999,18 @@ def run(test, debug):
                 log_empty('{0:-^79}'.format(' Running Testcase ' +
                                             method_description + ' '),
                           level=logging.INFO)
+                testcase_start = monotonic()
+                testcase_timings = get_timings()
+                testcase_captures = set(CAPTURES)
+                events.set_context(testcase=method_description)
+                events.emit('testcase start')
                 try:
                     method = getattr(class_instance, class_method_name)
                 except AttributeError:
                     logging.log(SKIP, 'Testcase ' + method_description +
                                 ' in ' + class_description + ' was skipped\n' +
                                 'OptionError: Does not exist')
+                    events.emit('testcase skip', reason='Does not exist')
                     log_empty('{0:-^79}'.format(' Finished Running Testcase ' +
                                                 method_description + ' '),
                               level=logging.INFO)
@@ -536,12 +1019,61 @@ def run(test, debug):
                     logging.log(SKIP, 'Testcase ' + method_description +
                                 ' in ' + class_description + ' was skipped\n' +
                                 'OptionError: Not a method')
+                    events.emit('testcase skip', reason='Not a method')
                     log_empty('{0:-^79}'.format(' Finished Running Testcase ' +
                                                 method_description + ' '),
                               level=logging.INFO)
                     continue
+                checkpoint_key = None
+                if checkpoint is not None:
+                    checkpoint_key = get_checkpoint_keys(
+                        module_name, class_name, [class_method_name],
+                        [class_args, method_args],
+                        [class_kwargs, method_kwargs])[0]
+                    finished = checkpoint.get(checkpoint_key)
+                    if finished is not None:
+                        class_instance.passed_count += finished['passed']
+                        class_instance.failed_count += finished['failed']
+                        class_instance.issue_count += finished['issues']
+                        aborted += finished['aborted']
+                        test_aborted += finished['aborted']
+                        finished_time = time.localtime(finished['time'])
+                        logging.log(SKIP, 'Testcase ' + method_description +
+                                    ' in ' + class_description +
+                                    ' was skipped\nResume: Finished on ' +
+                                    time.strftime(TIME, finished_time))
+                        events.emit('testcase skip', reason='Resume')
+                        log_empty('{0:-^79}'.format(
+                                  ' Finished Running Testcase ' +
+                                  method_description + ' '),
+                                  level=logging.INFO)
+                        continue
+                key = None
+                if cache is not None:
+                    key = cache.key(module, class_name, class_args,
+                                    class_kwargs, class_method_name,
+                                    method_args, method_kwargs)
+                    passed_time = cache.passed(key)
+                    if passed_time is not None:
+                        passed_time = time.localtime(passed_time)
+                        logging.log(SKIP, 'Testcase ' + method_description +
+                                    ' in ' + class_description +
+                                    ' was skipped\nIncremental: Passed on ' +
+                                    time.strftime(TIME, passed_time))
+                        events.emit('testcase skip', reason='Incremental')
+                        log_empty('{0:-^79}'.format(
+                                  ' Finished Running Testcase ' +
+                                  method_description + ' '),
+                                  level=logging.INFO)
+                        continue
+                testcase_aborted = False
+                STOP.clear()
+                counts = (class_instance.passed_count,
+                          class_instance.failed_count,
+                          class_instance.issue_count)
                 try:
                     if debug:
+                        import pdb
                         pdb.runcall(method, *method_args, **method_kwargs)
                     else:
                         method(*method_args, **method_kwargs)
@@ -550,13 +1082,23 @@ def run(test, debug):
                 except TestError:
                     aborted += 1
                     test_aborted += 1
+                    testcase_aborted = True
                 except Exception:
                     aborted += 1
                     test_aborted += 1
+                    testcase_aborted = True
                     logging.log(ABORT, 'Testcase ' + method_description +
                                        ' in ' + class_description +
                                        ' was aborted\n\n' +
                                        traceback.format_exc())
+                    events.emit('abort',
+                                error=traceback.format_exc().splitlines()[-1])
+                if cache is not None:
+                    cache.record(key, not testcase_aborted and
+                                 class_instance.current_passed_count and
+                                 not class_instance.current_failed_count and
+                                 not class_instance.current_issue_count)
+                STOP.clear()
                 try:
                     logging.info('Running testcase cleanup routine')
                     class_instance.testcase_cleanup()
@@ -564,12 +1106,32 @@ def run(test, debug):
                 except Exception:
                     logging.warning('Could not cleanup after testcase\n\n' +
                                     traceback.format_exc())
+                remove_captures(testcase_captures)
+                if checkpoint is not None:
+                    checkpoint.record(
+                        checkpoint_key,
+                        passed=class_instance.passed_count - counts[0],
+                        failed=class_instance.failed_count - counts[1],
+                        issues=class_instance.issue_count - counts[2],
+                        aborted=int(testcase_aborted))
+                times = diff_timings(testcase_timings, get_timings())
+                timing_rows.append((method_description, times))
+                events.emit('testcase end',
+                            duration=monotonic() - testcase_start,
+                            timings=times,
+                            passed=class_instance.current_passed_count,
+                            failed=class_instance.current_failed_count,
+                            issues=class_instance.current_issue_count,
+                            aborted=int(testcase_aborted))
+                events.set_context(testcase=None)
                 log_empty('{0:-^79}'.format(' Finished Running Testcase ' +
                                             method_description + ' '),
                           level=logging.INFO)
+            events.set_context(testcase=None)
             failed += class_instance.failed_count
             passed += class_instance.passed_count
             issues += class_instance.issue_count
+            STOP.clear()
             try:
                 logging.info('Running cleanup routine')
                 class_instance.cleanup()
@@ -577,7 +1139,14 @@ def run(test, debug):
             except Exception:
                 logging.warning('Could not cleanup\n\n' +
                                 traceback.format_exc())
+            remove_captures(test_captures)
             Connection.close_all()
+            events.emit('test end', duration=monotonic() - test_start,
+                        passed=class_instance.passed_count,
+                        failed=class_instance.failed_count,
+                        issues=class_instance.issue_count,
+                        aborted=test_aborted)
+            events.set_context(test=None)
             log_empty('{0:*^79}'.format(''), level=logging.INFO)
             log_result(' '.join(description), level=logging.INFO)
             log_empty('{0:*^79}'.format(''), level=logging.INFO)
@@ -589,9 +1158,384 @@ def run(test, debug):
                        level=logging.INFO)
             log_result('Aborted: ' + str(test_aborted), level=logging.INFO)
             log_empty('{0:*^79}'.format(''), level=logging.INFO)
+            log_empty(str_test_timings(timing_rows, test_timings),
+                      level=logging.INFO)
+            log_empty('{0:*^79}'.format(''), level=logging.INFO)
     return (passed, failed, issues, aborted)
 
 
+def get_checkpoint_keys(module_name, class_name, method_names, args, kwargs):
+    """Gets the checkpoint keys of testcases of a test run against the systems
+    in the environment.
+
+    :param str module_name: The name of the module.
+    :param str class_name: The name of the test.
+    :param list method_names: The names of the testcases.
+    :param list args: The arguments of the test followed by the arguments of
+        each testcase.
+    :param list kwargs: The keyword arguments of the test followed by the
+        keyword arguments of each testcase.
+    :returns: The list of keys.
+    :rtype: list
+    """
+    systems = [system.name for system in environment.SYSTEMS]
+    keys = []
+    for j, method_name in enumerate(method_names):
+        try:
+            method_args = args[j+1]
+            method_kwargs = kwargs[j+1]
+        except IndexError:
+            method_args = []
+            method_kwargs = {}
+        keys.append(get_key(systems, module_name, class_name, args[0],
+                            kwargs[0], method_name, method_args,
+                            method_kwargs))
+    return keys
+
+
+def str_test_timings(rows, start):
+    """Formats the time breakdowns of the testcases of a test with a row for
+    the rest of the test, like its setup and cleanup, and a row for the total.
+
+    :param list rows: The list of (testcase description, breakdown) tuples.
+    :param dict start: The snapshot of :func:`~pytest.globals.get_timings` at
+        the start of the test.
+    :returns: The table.
+    :rtype: str
+    """
+    total = diff_timings(start, get_timings())
+    rest = dict((key, max(value - sum(times[key] for name, times in rows), 0))
+                for key, value in total.items())
+    return str_timings(rows + [('Setup and cleanup', rest),
+                               ('Total', total)])
+
+
+class ScenarioEntry(object):
+    """Entry of a scheduled scenario.
+
+    :ivar str name: The name of the entry that other entries depend on.
+    :ivar tuple test: The parsed test.
+    :ivar list after: The names of the entries that must finish first.
+    :ivar dict resources: The modes `exclusive` or `shared` of the resources.
+    :param str name: The name of the entry.
+    :param tuple test: The parsed test.
+    """
+
+    def __init__(self, name, test):
+        self.name = name
+        self.test = test
+        self.after = []
+        self.resources = {}
+        self.ready = None
+        self.start = None
+        self.end = None
+        self.result = (0, 0, 0, 0)
+
+    def conflicts(self, other):
+        """Checks if the entries cannot run at the same time. Resources
+        overlap if they are the same or one contains the other, for example
+        `system` contains `system.HOST`. An entry without resources uses all
+        of them exclusively.
+
+        :param ScenarioEntry other: The other entry.
+        :rtype: bool
+        """
+        for resource, mode in self.resources.items():
+            for other_resource, other_mode in other.resources.items():
+                if not (resource == other_resource or
+                        other_resource.startswith(resource + '.') or
+                        resource.startswith(other_resource + '.') or
+                        not resource or not other_resource):
+                    continue
+                if mode == 'exclusive' or other_mode == 'exclusive':
+                    return True
+        return False
+
+
+def parse_scenario(lines):
+    """Parses the lines of a scheduled scenario. Besides the module and its
+    values, a line can have the tokens
+
+    * `@name=NAME` to name the entry. The default is the module name and, if
+      the name is taken, the line number.
+    * `@after=NAME[,NAME]...` to run the entry after other entries.
+    * `@exclusive=RESOURCE[,RESOURCE]...` to use resources alone.
+    * `@shared=RESOURCE[,RESOURCE]...` to use resources alongside other
+      shared users.
+
+    A resource is a system, a subsystem of the first system like `HOST`, or
+    a subsystem of a system like `system.HOST`.
+
+    For example::
+
+        security.tpm FPGA @name=fpga @exclusive=HOST
+        security.ilom_users @shared=SP
+        security.tpm TPMADM @after=fpga @exclusive=HOST
+
+    :param list lines: The lines of the scenario file.
+    :returns: The list of entries in order.
+    :rtype: list
+    :raises: OptionError
+    """
+    entries = []
+    names = {}
+    for number, line in enumerate(lines, 1):
+        if line.startswith('#') or not line.split():
+            continue
+        values = []
+        tokens = {}
+        for token in line.split():
+            if token.startswith('@'):
+                key, _, value = token[1:].partition('=')
+                if key not in ['name', 'after', 'exclusive', 'shared']:
+                    raise OptionError('Invalid token {0} '.format(token) +
+                                      'on line {0}'.format(number))
+                tokens.setdefault(key, []).extend(
+                    [string for string in value.split(',') if string])
+            else:
+                values.append(token)
+        name = (tokens.get('name') or [values[0]])[0]
+        if name in names:
+            if 'name' in tokens:
+                raise OptionError('Duplicate name {0} '.format(name) +
+                                  'on line {0}'.format(number))
+            name = '{0}:{1}'.format(name, number)
+        entry = ScenarioEntry(name, parse_test(values[0], values[1:]))
+        entry.after = tokens.get('after', [])
+        for mode in ['shared', 'exclusive']:
+            for resource in tokens.get(mode, []):
+                if '.' not in resource and environment.SYSTEMS and \
+                   resource not in [system.name
+                                    for system in environment.SYSTEMS]:
+                    resource = environment.SYSTEMS[0].name + '.' + resource
+                entry.resources[resource] = mode
+        if not entry.resources:
+            entry.resources[''] = 'exclusive'
+        names[name] = entry
+        entries.append(entry)
+    for entry in entries:
+        for name in entry.after:
+            if name not in names:
+                raise OptionError('Entry {0} is after '.format(entry.name) +
+                                  'unknown entry {0}'.format(name))
+    visiting = []
+    visited = []
+
+    def visit(entry):
+        if entry.name in visited:
+            return
+        if entry.name in visiting:
+            raise OptionError('Entries {0} '.format(' -> '.join(visiting)) +
+                              'depend on each other')
+        visiting.append(entry.name)
+        for name in entry.after:
+            visit(names[name])
+        visiting.pop()
+        visited.append(entry.name)
+
+    for entry in entries:
+        visit(entry)
+    return entries
+
+
+def run_schedule(scenario, lines, debug, jobs=0, cache=None,
+                 checkpoint=None):
+    """Runs a scheduled scenario. Every entry runs in a forked worker once the
+    entries it is after have finished and none of the running entries
+    conflict with its resources. At most `jobs` entries run at a time, if
+    `jobs` is not 0, and ready entries are started in the order of the file.
+    A critical path report is logged at the end.
+
+    :param str scenario: The name of the scenario.
+    :param list lines: The lines of the scenario file.
+    :param bool debug: The flag for running the testcases in the debugger.
+    :param int jobs: The maximum number of entries running at a time or 0
+        for no maximum.
+    :param ResultCache cache: The result cache of incremental runs.
+    :param Checkpoint checkpoint: The checkpoints of the run.
+    :returns: The tuple (passed, failed, issues, aborted) of the totals.
+    :rtype: tuple
+    """
+    if jobs == 1:
+        logging.warning('Scenario {0} is scheduled but runs one entry at a '
+                        'time with --jobs 1'.format(scenario))
+    entries = parse_scenario(lines)
+    names = dict((entry.name, entry) for entry in entries)
+    pending = list(entries)
+    running = []
+    workers = {}
+    reported = set()
+    start = monotonic()
+    while pending or workers:
+        now = monotonic()
+        for entry in pending:
+            if entry.ready is None and \
+               all(names[name].end is not None for name in entry.after):
+                entry.ready = max([now] + [names[name].end
+                                           for name in entry.after])
+        for entry in pending[:]:
+            if jobs and len(workers) >= jobs:
+                break
+            if entry.ready is None or \
+               any(entry.conflicts(other) for other in running):
+                continue
+            pending.remove(entry)
+            running.append(entry)
+            entry.start = monotonic()
+            pid, pipe = fork_worker(workers, run_entry, entry, debug, cache,
+                                    checkpoint)
+            workers[pipe.fileno()] = (pid, entry.name, pipe)
+            logging.info('Started {0} in worker {1}'.format(entry.name, pid))
+        if not workers:
+            raise OptionError('Scenario {0} cannot be scheduled'.format(
+                              scenario))
+        for name, kind, value in read_workers(workers):
+            entry = names[name]
+            if kind == 'result':
+                entry.result = value
+                reported.add(name)
+            elif kind == 'exit':
+                entry.end = monotonic()
+                running.remove(entry)
+                if ((value or name not in reported) and
+                    entry.result == (0, 0, 0, 0)):
+                    entry.result = (0, 0, 0, 1)
+    log_empty(str_schedule(entries, monotonic() - start), level=logging.INFO)
+    return tuple(sum(entry.result[i] for entry in entries) for i in range(4))
+
+
+def run_entry(pipe, entry, debug, cache, checkpoint):
+    prefix_logs('[' + entry.name + '] ')
+    result = (0, 0, 0, 0)
+    try:
+        result = run(entry.test, debug, cache=cache, checkpoint=checkpoint)
+    except Exception:
+        logging.log(SKIP, 'Module {0} was skipped\n\n'.format(entry.test[0]) +
+                    traceback.format_exc())
+    send_worker(pipe, 'result', result)
+    return PASSED
+
+
+def str_schedule(entries, wall_time):
+    """Formats the schedule of the entries with the critical path. The
+    critical path is the chain of entries along the `after` dependencies with
+    the longest total running time. Time spent waiting for resources is shown
+    separately.
+
+    :param list entries: The finished entries.
+    :param float wall_time: The running time of the scenario.
+    :returns: The report.
+    :rtype: str
+    """
+    names = dict((entry.name, entry) for entry in entries)
+    first = min(entry.start for entry in entries)
+    paths = {}
+
+    def duration(path):
+        return sum(names[name].end - names[name].start for name in path)
+
+    def find_path(entry):
+        if entry.name not in paths:
+            path = []
+            for name in entry.after:
+                after_path = find_path(names[name])
+                if duration(after_path) > duration(path):
+                    path = after_path
+            paths[entry.name] = path + [entry.name]
+        return paths[entry.name]
+
+    critical = max([find_path(entry) for entry in entries], key=duration)
+    table = [('Entry', 'Start', 'Duration', 'Waited', 'Critical')]
+    for entry in entries:
+        table.append((entry.name, '{0:.1f}'.format(entry.start - first),
+                      '{0:.1f}'.format(entry.end - entry.start),
+                      '{0:.1f}'.format(entry.start - entry.ready),
+                      '*' if entry.name in critical else ''))
+    serial_time = sum(entry.end - entry.start for entry in entries)
+    critical_time = duration(critical)
+    strings = ['{0:=^79}'.format(' Schedule '), str_table(table), '',
+               'Wall time:     {0:.1f}'.format(wall_time),
+               'Serial time:   {0:.1f}'.format(serial_time),
+               'Critical path: {0} ({1:.1f})'.format(' -> '.join(critical),
+                                                     critical_time)]
+    return '\n'.join(strings)
+
+
+def list_tests(tests):
+    """Prints the tests and testcases that would be run, as read from the
+    manifest without importing the test modules.
+
+    :param list tests: The parsed tests and scenario files. If this is empty,
+        every module of the manifest is listed.
+    :returns: :data:`PASSED` or :data:`FAILED` if a test cannot be found.
+    :rtype: int
+    """
+    if not tests:
+        modules = MANIFEST.load() or MANIFEST.build()
+        tests = [(name, [], [], [], []) for name in sorted(modules)]
+    parsed = []
+    for test in tests:
+        if type(test) is not str:
+            parsed.append(test)
+            continue
+        file_path = get_file_path(test)
+        if file_path is None:
+            print('OptionError: Scenario file ' + test + ' does not exist')
+            return FAILED
+        f = open(file_path)
+        lines = f.readlines()
+        f.close()
+        for line in lines:
+            values = [token for token in line.split()
+                      if not token.startswith('@')]
+            if not line.startswith('#') and values:
+                parsed.append(parse_test(values[0], values[1:]))
+    table = [('Module', 'Test', 'Testcases')]
+    errors = []
+    for module_name, class_names, method_names, args, kwargs in parsed:
+        if MANIFEST.get_module(module_name) is None:
+            errors.append('Module {0} does not exist'.format(module_name))
+            continue
+        if not class_names:
+            class_names = MANIFEST.get_tests(module_name)
+            if class_names is None:
+                errors.append('Tests of module {0} '.format(module_name) +
+                              'cannot be read from its source')
+                continue
+            method_names = [[] for class_name in class_names]
+            args = [[[]] for class_name in class_names]
+            kwargs = [[{}] for class_name in class_names]
+        for i, class_name in enumerate(class_names):
+            description = get_description(class_name, args[i][0],
+                                          kwargs[i][0])
+            info = MANIFEST.describe(module_name, class_name)
+            if info is None or info['test'] is False:
+                errors.append('Module {0} does not '.format(module_name) +
+                              'contain test {0}'.format(class_name))
+                continue
+            if info['notest']:
+                table.append((module_name, description, "(notest)"))
+                continue
+            testcases = []
+            for j, method_name in enumerate(method_names[i]):
+                if (info['methods'] is not None and
+                    method_name not in info['methods']):
+                    errors.append('Test {0} does not '.format(class_name) +
+                                  'contain testcase {0}'.format(method_name))
+                testcases.append(get_description(method_name, args[i][j+1],
+                                                 kwargs[i][j+1]))
+            if not method_names[i]:
+                testcases = info['testcases'] or []
+            table.append((module_name, description, ' '.join(testcases)))
+    if len(table) > 1:
+        print(str_table(table))
+    for error in errors:
+        print('OptionError: ' + error)
+    if errors:
+        return FAILED
+    return PASSED
+
+
 def get_description(name, args, kwargs):
     strings = []
     for arg in args:
@@ -0,0 +1,1198 @@
+"""
+This module simulates the ILOM, OpenBoot and Solaris command line interfaces
+of a system so that the connections in :mod:`~pytest.connections` can be
+spawned without real hardware. The simulator is started in place of `ssh` or
+`ltconsole` (see :data:`~pytest.connections.SIMULATOR`) and reads the systems
+files to find the subsystem and users that belong to the address it was given.
+The power, boot and TPM state of each system is shared between all simulator
+processes through a state file.
+
+For example::
+
+    pytest -s simulator --simulate -t security.tpm FPGA
+
+The latency of each command, the volume of the boot output and the length of a
+boot can be changed with the simulator options, for example::
+
+    PYTEST_SIMULATOR='python pytest/bin/simulator --latency 0.1 --volume 5000'
+"""
+
+import os
+import sys
+import time
+import shlex
+import select
+import tempfile
+from optparse import OptionParser
+from pytest.globals import (Lock, LockError, PYTEST_SYSTEMS_PATH, FAILED,
+                            str_error)
+
+
+LATENCY = 0
+VOLUME = 50
+BOOT = 5
+PROMPTS = {'ilom':'-> ', 'sunservice':'[(flash)root@SP:~]# ',
+           'solaris':'root@{0}:~# '}
+OK_PROMPT = '{0} ok '
+CONSOLE_LOGIN = '{0} console login: '
+ESCAPE = '#.'
+CONTROL_E = '\x05'
+MRK_KEY = '00000000-0000-0000-0000-00000000000b'
+MIGRATION_FILES = ['tpm-migration.dat', 'tpm-migration.key']
+# Offsets of the boot milestones as a fraction of the boot time
+POST_OFFSET = 0.2
+HV_OFFSET = 0.4
+OPENBOOT_OFFSET = 0.5
+OK_OFFSET = 0.7
+LOGIN_OFFSET = 1.0
+STOP_OFFSET = 0.2
+
+
+class SimulatorError(Exception):
+    """Raised when the simulator cannot find or serve a subsystem.
+    """
+
+
+def default_state():
+    return {'power':'Off', 'started':None, 'stopping':None, 'output':None,
+            'stop_at_ok':False, 'post':[],
+            'properties':{'/HOST/tpm':{'mode':'off', 'forceclear':'false'},
+                          '/HOST/bootmode':{'state':'normal',
+                                            'script':'(none)'},
+                          '/HOST/domain/control':{'auto-boot':'enabled'},
+                          '/SP':{'hostname':'SP'}},
+            'fpga_tpm':'disabled', 'tpm_state':'off', 'tcsd':False,
+            'owned':False, 'owner_pin':None, 'keys':{},
+            'files':set()}
+
+
+class Host(object):
+    """Model of the host and the service processor of a simulated system. The
+    state is kept in a pickled dictionary in a file that is shared with the
+    other simulator processes of the same system.
+
+    :param str name: The name of the system.
+    :param str hostname: The host name of the host.
+    :param float boot: The time in seconds of a full boot.
+    :param int volume: The number of extra lines of POST and boot output.
+    :param str path: The path of the state file.
+    """
+
+    def __init__(self, name, hostname, boot=BOOT, volume=VOLUME, path=None):
+        self.name = name
+        self.hostname = hostname
+        self.boot = boot
+        self.volume = volume
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(),
+                                'pytest_simulator_' + name)
+        self.lock = Lock(path, 'a')
+
+    def load(self, release=True):
+        state = self.lock.download(release=release, exit=False)
+        if state is None:
+            state = default_state()
+        return self.settle(state)
+
+    def save(self, state):
+        self.lock.upload(state, exit=False)
+
+    def update(self, function, *args):
+        """Applies a function to the state while holding the state lock.
+
+        :param function function: The function. It is called with the state
+            followed by the arguments.
+        :returns: The return value of the function.
+        """
+        state = self.load(release=False)
+        try:
+            value = function(state, *args)
+        except Exception:
+            self.lock.release()
+            raise
+        self.save(state)
+        return value
+
+    def settle(self, state):
+        if (state['stopping'] is not None and
+            time.time() - state['stopping'] >= STOP_OFFSET * self.boot):
+            self.power_off(state)
+        return state
+
+    def power_on(self, state, post=True):
+        state['power'] = 'On'
+        state['stopping'] = None
+        properties = state['properties']
+        script = properties['/HOST/bootmode']['script']
+        control = properties['/HOST/domain/control']['auto-boot']
+        state['stop_at_ok'] = ('auto-boot? false' in script or
+                               control == 'disabled')
+        properties['/HOST/bootmode']['script'] = '(none)'
+        state['output'] = time.time()
+        if post:
+            state['started'] = state['output']
+            self.post(state)
+        else:
+            state['started'] = state['output'] - OPENBOOT_OFFSET * self.boot
+
+    def power_off(self, state):
+        state['power'] = 'Off'
+        state['started'] = None
+        state['stopping'] = None
+
+    def post(self, state):
+        tpm = state['properties']['/HOST/tpm']
+        lines = ['NOTICE: POST starting on {0}'.format(self.name)]
+        for i in range(self.volume):
+            lines.append('POST: Running diagnostic {0} on '.format(i) +
+                         '/SYS/MB/CM0/CMP/MR{0}/BOB0/CH0/D0'.format(i % 4))
+        if state['fpga_tpm'] != 'enabled' or tpm['mode'] == 'deactivated':
+            state['tpm_state'] = 'disabled'
+        elif tpm['mode'] == 'off':
+            state['tpm_state'] = 'off'
+        else:
+            state['tpm_state'] = 'enabled'
+            lines.append('NOTICE: TPM initialized')
+        if tpm['forceclear'] == 'true':
+            if state['tpm_state'] == 'enabled':
+                state['owned'] = False
+                state['owner_pin'] = None
+                state['keys'] = {}
+                lines.append('NOTICE: TPM ForceClear issued. ' +
+                             'Resetting TPM ForceClear')
+            tpm['forceclear'] = 'false'
+        lines.append('NOTICE: Current TPM state: ' + state['tpm_state'])
+        lines.append('NOTICE: POST completed')
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        state['post'] = ['{0}.000 0:0:0> {1}'.format(stamp, line)
+                         for line in lines]
+
+    def events(self, state):
+        """Gets the output of the host since it was last powered on, reset or
+        booted.
+
+        :param dict state: The state of the system.
+        :returns: The list of (time, status, text) tuples in order.
+        :rtype: list
+        """
+        return [event for event in self.timeline(state)
+                if event[0] >= state['output']]
+
+    def timeline(self, state):
+        if state['power'] != 'On':
+            return []
+        start = state['started']
+        boot = self.boot
+        events = [(start, 'Starting', '')]
+        post = state['post']
+        step = (HV_OFFSET - POST_OFFSET) * boot / max(len(post), 1)
+        for i in range(len(post)):
+            events.append((start + POST_OFFSET * boot + i * step,
+                           'Powered On', post[i] + '\n'))
+        events.append((start + HV_OFFSET * boot, 'HV started',
+                       'Hypervisor version: @(#)Hypervisor 1.17.0\n'))
+        events.append((start + OPENBOOT_OFFSET * boot,
+                       'OpenBoot initializing',
+                       '\nSPARC T7-2, No Keyboard\n' +
+                       'Copyright (c) 1998, 2016, Oracle and/or its ' +
+                       'affiliates. All rights reserved.\n' +
+                       'OpenBoot 4.40.1, 256.0000 GB memory available\n' +
+                       'Ethernet address 0:10:e0:0:0:1, Host ID: 86000001.' +
+                       '\n\n'))
+        if state['stop_at_ok']:
+            events.append((start + OK_OFFSET * boot, 'OpenBoot Running', '\n'))
+        else:
+            events.extend(self.os_boot(start + OK_OFFSET * boot))
+        return events
+
+    def os_boot(self, start):
+        boot = self.boot
+        lines = ['Boot device: /pci@300/pci@1/scsi@0/disk@w0,0:a  ' +
+                 'File and args:',
+                 'SunOS Release 5.11 Version 11.3 64-bit',
+                 'Copyright (c) 1983, 2016, Oracle and/or its affiliates. ' +
+                 'All rights reserved.']
+        lines.extend(['Configuring devices. ({0})'.format(i)
+                      for i in range(self.volume)])
+        lines.append('Hostname: ' + self.hostname)
+        step = (LOGIN_OFFSET - OK_OFFSET) * boot / len(lines)
+        events = [(start + i * step, 'OpenBoot Running OS Boot',
+                   lines[i] + '\n') for i in range(len(lines))]
+        events.append((start + (LOGIN_OFFSET - OK_OFFSET) * boot,
+                       'Solaris running', '\n'))
+        return events
+
+    def status(self, state):
+        if state['power'] != 'On':
+            return 'Powered Off'
+        status = 'Starting'
+        now = time.time()
+        for event_time, event_status, text in self.timeline(state):
+            if event_time > now:
+                break
+            status = event_status
+        return status
+
+    def tcsd(self, state):
+        if not state['tcsd']:
+            return 'disabled'
+        elif state['tpm_state'] == 'enabled':
+            return 'online'
+        else:
+            return 'maintenance'
+
+
+class Session(object):
+    """Terminal session of a simulator process. The session reads the input
+    character by character and hands it to the current mode. The modes are
+    kept in a stack so that a mode can return to the one that started it.
+
+    :param Host host: The host of the session.
+    :param float latency: The delay in seconds before the output of a command.
+    """
+
+    def __init__(self, host, latency=LATENCY):
+        self.host = host
+        self.latency = latency
+        self.modes = []
+        self.status = 0
+
+    def write(self, text):
+        text = text.replace('\r\n', '\n').replace('\n', '\r\n')
+        while text:
+            n = os.write(sys.stdout.fileno(), text)
+            text = text[n:]
+
+    def respond(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        self.write(text)
+
+    def push(self, mode):
+        self.modes.append(mode)
+        mode.start()
+
+    def pop(self):
+        self.modes.pop()
+        if self.modes:
+            self.modes[-1].resume()
+
+    def replace(self, mode):
+        self.modes.pop()
+        self.push(mode)
+
+    def pop_to(self, mode):
+        while self.modes[-1] is not mode:
+            self.modes.pop()
+        mode.resume()
+
+    def feed(self, character):
+        consoles = [mode for mode in self.modes
+                    if isinstance(mode, HostConsole)]
+        if consoles and consoles[-1].escaped(character):
+            return
+        self.modes[-1].feed(character)
+
+    def exit(self, status=0):
+        self.status = status
+        del self.modes[:]
+
+    def run(self):
+        fd = sys.stdin.fileno()
+        settings = None
+        if os.isatty(fd):
+            import tty
+            import termios
+            settings = termios.tcgetattr(fd)
+            tty.setraw(fd)
+        try:
+            while self.modes:
+                timeout = self.modes[-1].timeout()
+                r, w, e = select.select([fd], [], [], timeout)
+                if r:
+                    data = os.read(fd, 1024)
+                    if not data:
+                        break
+                    for character in data:
+                        if not self.modes:
+                            break
+                        self.feed(character)
+                if self.modes:
+                    self.modes[-1].tick()
+        finally:
+            if settings is not None:
+                termios.tcsetattr(fd, termios.TCSADRAIN, settings)
+        return self.status
+
+
+class Mode(object):
+    """Base class of the simulator modes. A mode echoes and buffers the input
+    until a newline and then calls :func:`line`.
+    """
+    echo = True
+
+    def __init__(self, session):
+        self.session = session
+        self.host = session.host
+        self.buffer = ''
+
+    def start(self):
+        self.prompt()
+
+    def resume(self):
+        self.prompt()
+
+    def prompt(self):
+        pass
+
+    def timeout(self):
+        return None
+
+    def tick(self):
+        pass
+
+    def feed(self, character):
+        if character in '\r\n':
+            if self.echo:
+                self.session.write('\n')
+            line = self.buffer
+            self.buffer = ''
+            self.line(line)
+        elif character == '\x7f' or character == '\b':
+            self.buffer = self.buffer[:-1]
+        else:
+            self.buffer += character
+            if self.echo:
+                self.session.write(character)
+
+    def line(self, line):
+        pass
+
+
+class Password(Mode):
+    """Asks for the password of a user and replaces itself with the mode of the
+    user.
+    """
+    echo = False
+
+    def __init__(self, session, user, mode, tries=3):
+        super(Password, self).__init__(session)
+        self.user = user
+        self.mode = mode
+        self.tries = tries
+
+    def prompt(self):
+        self.session.write('Password: ')
+
+    def line(self, line):
+        if line == self.user.password:
+            self.session.write('\n')
+            self.session.replace(self.mode)
+            return
+        self.tries -= 1
+        if self.tries:
+            self.session.write('\nPermission denied, please try again.\n')
+            self.prompt()
+        elif len(self.session.modes) > 1:
+            self.session.write('\nLogin incorrect\n')
+            self.session.pop()
+        else:
+            self.session.write('\nPermission denied ' +
+                               '(publickey,keyboard-interactive).\n')
+            self.session.exit(255)
+
+
+class Shell(Mode):
+    """Base class of the command line modes. The first word of a line selects
+    the method `command_<word>`.
+    """
+    PROMPT = ''
+    UNKNOWN = '{0}: command not found\n'
+
+    def prompt(self):
+        self.session.write(self.PROMPT)
+
+    def line(self, line):
+        words = line.split()
+        if words:
+            method = getattr(self, 'command_' + words[0].replace('-', '_'),
+                             None)
+            if method is None:
+                output = self.UNKNOWN.format(words[0])
+            else:
+                try:
+                    output = method(words[1:], line)
+                except LockError as e:
+                    output = str_error(e) + '\n'
+            if output is None:
+                return
+            self.session.respond(output)
+        if self.session.modes and self.session.modes[-1] is self:
+            self.prompt()
+
+
+class ILOM(Shell):
+    """The ILOM command line of the service processor.
+    """
+    PROMPT = PROMPTS['ilom']
+    UNKNOWN = "Invalid command '{0}' - type help for a list of commands.\n"
+    TARGETS = {'/':['HOST', 'System', 'SP'],
+               '/HOST':['bootmode', 'console', 'domain', 'tpm'],
+               '/HOST/domain':['control'],
+               '/System':[], '/SP':[], '/HOST/console':[],
+               '/HOST/tpm':[], '/HOST/bootmode':[], '/HOST/domain/control':[]}
+    VALUES = {'mode':['off', 'deactivated', 'activated'],
+              'forceclear':['true', 'false'],
+              'auto-boot':['enabled', 'disabled']}
+    HELP = {'/HOST/tpm':('TPM (Trusted Platform Module) configuration',
+                         {'mode':'TPM mode of the host',
+                          'forceclear':'Purge the TPM state on next power ' +
+                                       'on'}),
+            '/HOST/bootmode':('Boot mode configuration',
+                              {'state':'Boot mode state',
+                               'script':'Boot script to run on next boot'}),
+            '/HOST/domain/control':('Domain control',
+                                    {'auto-boot':'Automatically boot the ' +
+                                                 'host'})}
+
+    def start(self):
+        self.session.write('\nOracle(R) Integrated Lights Out Manager\n\n' +
+                           'Version 3.2.6.0\n\n' +
+                           'Copyright (c) 2016, Oracle and/or its ' +
+                           'affiliates. All rights reserved.\n\n')
+        self.prompt()
+
+    @staticmethod
+    def arguments(words):
+        options = [word for word in words if word.startswith('-')]
+        targets = [word for word in words if not word.startswith('-')]
+        if '-l' in words:
+            i = words.index('-l')
+            targets.remove(words[i + 1])
+        if '-format' in words:
+            i = words.index('-format')
+            targets.remove(words[i + 1])
+        return (options, targets)
+
+    @staticmethod
+    def normalize(target):
+        target = '/' + '/'.join([t for t in target.split('/') if t])
+        if target.lower() == '/system':
+            return '/System'
+        return target
+
+    def properties(self, state, target):
+        host = self.host
+        properties = dict(state['properties'].get(target, {}))
+        if target == '/System':
+            properties['power_state'] = state['power']
+            properties['health'] = 'OK'
+            properties['model'] = 'SPARC T7-2'
+        elif target == '/HOST':
+            properties['status'] = host.status(state)
+        return properties
+
+    def command_version(self, arguments, line):
+        return ('SP firmware 3.2.6.0\n' +
+                'SP firmware build number: 104000\n' +
+                'SP firmware date: Mon Nov 21 18:21:35 PST 2016\n' +
+                'SP filesystem version: 0.2.10\n')
+
+    def command_show(self, arguments, line):
+        options, words = self.arguments(arguments)
+        if not words:
+            words = ['/']
+        target = self.normalize(words[0])
+        if target not in self.TARGETS:
+            return 'show: Invalid target {0}\n'.format(words[0])
+        state = self.host.load()
+        properties = self.properties(state, target)
+        names = [word for word in words[1:] if '==' not in word]
+        if names:
+            keys = [name for name in names if name in properties]
+            if not keys:
+                return 'show: No matching properties found.\n'
+        else:
+            keys = sorted(properties)
+        lines = [' ' + target, '    Targets:']
+        if not names:
+            lines.extend(['        ' + t for t in self.TARGETS[target]])
+        lines.extend(['', '    Properties:'])
+        lines.extend(['        {0} = {1}'.format(key, properties[key])
+                      for key in keys])
+        if not names:
+            lines.extend(['', '    Commands:', '        cd', '        set',
+                          '        show'])
+        return '\n'.join(lines) + '\n\n'
+
+    def command_set(self, arguments, line):
+        try:
+            words = shlex.split(line)[1:]
+        except ValueError as e:
+            return 'set: ' + str(e) + '\n'
+        options, words = self.arguments(words)
+        if not words:
+            return 'set: Invalid command syntax\n'
+        target = self.normalize(words[0])
+        return self.host.update(self._set, target, words[1:])
+
+    def _set(self, state, target, words):
+        if target not in state['properties']:
+            return 'set: Invalid target {0}\n'.format(target)
+        properties = state['properties'][target]
+        output = ''
+        for word in words:
+            try:
+                key, value = word.split('=', 1)
+            except ValueError:
+                return output + 'set: Invalid command syntax\n'
+            if key not in properties:
+                return output + 'set: Invalid property {0}\n'.format(key)
+            if key in self.VALUES and value not in self.VALUES[key]:
+                return output + 'set: Invalid property value\n'
+            properties[key] = value
+            output += "Set '{0}' to '{1}'\n".format(key, value)
+        return output
+
+    def command_start(self, arguments, line):
+        options, targets = self.arguments(arguments)
+        if not targets:
+            return 'start: Invalid command syntax\n'
+        target = self.normalize(targets[0])
+        if target == '/HOST/console':
+            self.session.respond('\nSerial console started.  ' +
+                                 'To stop, type ' + ESCAPE + '\n')
+            self.session.push(HostConsole(self.session))
+            return None
+        if target not in ['/System', '/HOST']:
+            return 'start: Invalid target {0}\n'.format(targets[0])
+        return self.host.update(self._start, target)
+
+    def _start(self, state, target):
+        if state['power'] == 'On':
+            return 'start: Target already started\n'
+        self.host.power_on(state)
+        return 'Starting {0}\n'.format(target)
+
+    def command_stop(self, arguments, line):
+        options, targets = self.arguments(arguments)
+        if not targets:
+            return 'stop: Invalid command syntax\n'
+        target = self.normalize(targets[0])
+        if target not in ['/System', '/HOST']:
+            return 'stop: Invalid target {0}\n'.format(targets[0])
+        return self.host.update(self._stop, target, '-force' in options)
+
+    def _stop(self, state, target, force):
+        if state['power'] == 'Off':
+            return 'stop: Target already stopped\n'
+        if force:
+            self.host.power_off(state)
+        elif state['stopping'] is not None:
+            return 'stop: Target shutdown in progress\n'
+        else:
+            state['stopping'] = time.time()
+        return 'Stopping {0}\n'.format(target)
+
+    def command_reset(self, arguments, line):
+        options, targets = self.arguments(arguments)
+        if not targets:
+            return 'reset: Invalid command syntax\n'
+        target = self.normalize(targets[0])
+        if target == '/SP':
+            self.session.respond('Performing reset on /SP\n')
+            self.session.exit()
+            return None
+        if target not in ['/System', '/HOST', '/HOST/domain/control']:
+            return 'reset: Invalid target {0}\n'.format(targets[0])
+        return self.host.update(self._reset, target)
+
+    def _reset(self, state, target):
+        if state['power'] == 'Off':
+            return 'reset: Target is powered off\n'
+        self.host.power_on(state)
+        return 'Performing reset on {0}\n'.format(target)
+
+    def command_help(self, arguments, line):
+        options, words = self.arguments(arguments)
+        if not words:
+            return ('The help command is used to view information about ' +
+                    'commands and targets.\n')
+        target = self.normalize(words[0])
+        if target not in self.HELP:
+            return 'help: Invalid target {0}\n'.format(words[0])
+        description, properties = self.HELP[target]
+        names = words[1:] or sorted(properties)
+        lines = []
+        if not words[1:]:
+            lines.extend([' {0} : {1}'.format(target, description),
+                          '    Targets:', '', '    Properties:'])
+        for name in names:
+            if name not in properties:
+                lines.append('        {0} : Property not found'.format(name))
+                continue
+            lines.append('        {0} : {1}'.format(name, properties[name]))
+            if name in self.VALUES:
+                lines.append('        {0} : Possible values = '.format(name) +
+                             ', '.join(self.VALUES[name]))
+            lines.append('        {0} : User role required for set = '
+                         .format(name) + 'r')
+        return '\n'.join(lines) + '\n\n'
+
+    def command_cd(self, arguments, line):
+        return ''
+
+    def command_exit(self, arguments, line):
+        self.session.exit()
+
+    command_logout = command_exit
+
+
+class SunService(Shell):
+    """The restricted service shell of the service processor.
+    """
+    PROMPT = PROMPTS['sunservice']
+
+    def command_fpga(self, arguments, line):
+        if arguments == ['version']:
+            return 'FPGA version: 4.1.2\n'
+        elif arguments[:1] == ['tpm'] and len(arguments) == 2:
+            return self.host.update(self._tpm, arguments[1])
+        return 'fpga: invalid arguments\n'
+
+    def _tpm(self, state, argument):
+        if argument == 'status':
+            return state['fpga_tpm'] + '\n'
+        elif argument in ['enable', 'disable']:
+            if state['power'] == 'On':
+                return 'fpga: host must be powered off\n'
+            state['fpga_tpm'] = argument + 'd'
+            return ''
+        return 'fpga: invalid arguments\n'
+
+    def command_exit(self, arguments, line):
+        self.session.exit()
+
+
+class Solaris(Shell):
+    """The Solaris shell of the host. Over SSH the shell checks that the host
+    is still running before each command. On the console, `exit` returns to
+    the console login prompt.
+
+    :param bool console: The flag for a shell on the host console.
+    """
+
+    def __init__(self, session, console=False):
+        super(Solaris, self).__init__(session)
+        self.console = console
+        self.PROMPT = PROMPTS['solaris'].format(self.host.hostname)
+        self.last_status = 0
+        self.dialogue = None
+
+    def start(self):
+        self.session.write('Oracle Corporation      SunOS 5.11      11.3' +
+                           '    June 2016\n')
+        self.prompt()
+
+    def feed(self, character):
+        if self.dialogue is not None:
+            self.echo = self.dialogue[0][0][1]
+        else:
+            self.echo = True
+        super(Solaris, self).feed(character)
+
+    def line(self, line):
+        if self.dialogue is not None:
+            prompts, function, answers = self.dialogue
+            if not self.echo:
+                self.session.write('\n')
+            answers.append(line)
+            prompts.pop(0)
+            if prompts:
+                self.session.respond(prompts[0][0])
+                return
+            self.dialogue = None
+            output = self.host.update(function, answers)
+            self.session.respond(output)
+            self.prompt()
+            return
+        if not self.console:
+            state = self.host.load()
+            if self.host.status(state) != 'Solaris running':
+                self.session.write('Connection to {0} closed by remote host.\n'
+                                   .format(self.host.hostname))
+                self.session.exit(255)
+                return
+        super(Solaris, self).line(line)
+
+    def ask(self, prompts, function):
+        """Starts a dialogue. The prompts are answered one line at a time and
+        then the function is applied to the state with the list of answers.
+
+        :param list prompts: The list of (prompt, echo) tuples.
+        :param function function: The function that returns the output.
+        """
+        self.dialogue = (list(prompts), function, [])
+        self.session.respond(prompts[0][0])
+
+    def command_uname(self, arguments, line):
+        return 'SunOS {0} 5.11 11.3 sun4v sparc sun4v\n'.format(
+               self.host.hostname)
+
+    def command_echo(self, arguments, line):
+        if arguments == ['$?']:
+            return '{0}\n'.format(self.last_status)
+        return ' '.join(arguments) + '\n'
+
+    def command_svcs(self, arguments, line):
+        state = self.host.load()
+        return ('STATE          STIME    FMRI\n' +
+                '{0:<14} {1} '.format(self.host.tcsd(state),
+                                      time.strftime('%H:%M:%S')) +
+                'svc:/application/security/tcsd:default\n')
+
+    def command_svcadm(self, arguments, line):
+        if len(arguments) != 2 or arguments[0] not in ['enable', 'disable']:
+            return 'svcadm: invalid arguments\n'
+        self.host.update(self._svcadm, arguments[0] == 'enable')
+        return ''
+
+    def _svcadm(self, state, enable):
+        state['tcsd'] = enable
+
+    def command_ls(self, arguments, line):
+        state = self.host.load()
+        output = ''
+        for name in [a for a in arguments if not a.startswith('-')]:
+            if name in state['files']:
+                output += ('   8 -rw-------   1 root     root        1024 ' +
+                           'Nov 21 18:21 {0}\n'.format(name))
+            else:
+                output += '{0}: No such file or directory\n'.format(name)
+        return output
+
+    def command_rm(self, arguments, line):
+        self.host.update(self._rm, [a for a in arguments
+                                    if not a.startswith('-')])
+        return ''
+
+    def _rm(self, state, names):
+        for name in names:
+            state['files'].discard(name)
+
+    def command_reboot(self, arguments, line):
+        self.host.update(self.host.power_on, False)
+        if self.console:
+            consoles = [mode for mode in self.session.modes
+                        if isinstance(mode, HostConsole)]
+            self.session.pop_to(consoles[-1])
+        else:
+            self.session.exit(255)
+
+    def command_exit(self, arguments, line):
+        if self.console:
+            self.session.pop()
+        else:
+            self.session.exit()
+
+    command_logout = command_exit
+
+    def command_tpmadm(self, arguments, line):
+        state = self.host.load()
+        if self.host.tcsd(state) != 'online':
+            self.last_status = 1
+            return 'tpmadm: Communication failure with the TPM daemon\n'
+        self.last_status = 0
+        subcommand = ' '.join(arguments[:2])
+        if arguments[:1] == ['init']:
+            prompts = []
+            if [f for f in MIGRATION_FILES
+                if '/var/tpm/system/' + f in state['files']]:
+                prompts.append(('Migratable Root Key file(s) already exist. ' +
+                                'Overwrite? [y/N] ', True))
+            prompts.extend([('Enter TPM Owner PIN: ', False),
+                            ('Confirm TPM Owner PIN: ', False)])
+            self.ask(prompts, self._init)
+        elif arguments[:1] == ['status']:
+            return self._status(state)
+        elif arguments[:1] == ['keyinfo']:
+            return ''.join(['[{0}] {1}\n'.format(key_type, key)
+                            for key, key_type in sorted(state['keys'].items())])
+        elif arguments[:1] == ['deletekey'] and len(arguments) == 2:
+            self.ask([('Delete key {0}? [y/N]? '.format(arguments[1]), True)],
+                     lambda s, answers: self._deletekey(s, arguments[1],
+                                                        answers))
+        elif subcommand == 'migrate export' and len(arguments) == 3:
+            self.ask([('Enter TPM Owner PIN: ', False),
+                      ('Enter PIN for the migration key: ', False),
+                      ('Confirm PIN for the migration key: ', False)],
+                     lambda s, answers: self._export(s, arguments[2]))
+        elif subcommand == 'migrate import':
+            prompts = [('Enter TPM Owner PIN: ', False),
+                       ('Enter PIN for the migration key: ', False)]
+            if len(arguments) > 2:
+                prompts.append(('Enter PIN for the migrated key: ', False))
+            self.ask(prompts, lambda s, answers: self._import(s, arguments[2:]))
+        elif subcommand == 'clear owner':
+            self.ask([('Enter PIN: ', False)], self._clear_owner)
+        elif subcommand == 'clear lock':
+            self.ask([('Enter TPM Owner PIN: ', False)],
+                     lambda s, answers: 'TPM lock cleared\n')
+        elif arguments[:1] == ['auth']:
+            self.ask([('Enter PIN: ', False), ('Enter PIN: ', False),
+                      ('Verify PIN: ', False)], self._auth)
+        else:
+            self.last_status = 1
+            return 'tpmadm: invalid subcommand\n'
+
+    def _status(self, state):
+        output = ('TPM Version: 1.2 (ATML Rev 13.12)\n' +
+                  'Owner Installed: {0}\n'.format(state['owned'] and 'Yes' or
+                                                  'No'))
+        if state['owned']:
+            output += 'Platform Configuration Registers (24):\n'
+            output += ''.join(['\tPCR {0}:\t'.format(i) + '00 ' * 20 + '\n'
+                               for i in range(24)])
+        return output
+
+    def _init(self, state, answers):
+        if answers[0] in ['n', 'N']:
+            return ''
+        if state['owned']:
+            return 'tpmadm: TPM owner is already installed\n'
+        state['owned'] = True
+        state['owner_pin'] = answers[-1]
+        state['keys'] = {MRK_KEY:'SYSTEM'}
+        for name in MIGRATION_FILES:
+            state['files'].add('/var/tpm/system/' + name)
+        return 'TPM owner installed\n'
+
+    def _deletekey(self, state, key, answers):
+        if answers[0] not in ['y', 'Y']:
+            return ''
+        if key not in state['keys']:
+            return 'Key not found in persistent storage\n'
+        del state['keys'][key]
+        return ''
+
+    def _export(self, state, key):
+        if key not in state['keys']:
+            return 'Key not found in persistent storage\n'
+        for name in MIGRATION_FILES:
+            state['files'].add('/root/' + name)
+        return ''
+
+    def _import(self, state, arguments):
+        if not arguments:
+            if '/var/tpm/system/' + MIGRATION_FILES[0] not in state['files']:
+                return 'tpmadm: migration files not found\n'
+            state['keys'][MRK_KEY] = 'SYSTEM'
+            return ''
+        if len(arguments) != 4 or arguments[0] not in state['files']:
+            return 'tpmadm: migration files not found\n'
+        if arguments[2] not in state['keys']:
+            return 'Key not found in persistent storage\n'
+        state['keys'][arguments[3]] = 'USER'
+        return ''
+
+    def _clear_owner(self, state, answers):
+        state['owned'] = False
+        state['owner_pin'] = None
+        state['keys'] = {}
+        return 'TPM owner cleared\n'
+
+    def _auth(self, state, answers):
+        state['owner_pin'] = answers[-1]
+        return ''
+
+
+class OpenBoot(Shell):
+    """The OpenBoot prompt of the host console.
+    """
+    PROMPT = OK_PROMPT
+    UNKNOWN = '{0} ?\n'
+    PROBE = ('This command may hang the system if a Stop-A or halt command\n' +
+             'has been executed.  Please type reset-all to reset the system\n' +
+             'before executing this command.\n' +
+             'Do you wish to continue? (y/n) ')
+
+    def __init__(self, session):
+        super(OpenBoot, self).__init__(session)
+        self.probe = None
+
+    def line(self, line):
+        if self.probe is not None:
+            probe = self.probe
+            self.probe = None
+            if line.strip().lower() == 'y':
+                self.session.respond(probe)
+            self.prompt()
+            return
+        super(OpenBoot, self).line(line)
+
+    def command_boot(self, arguments, line):
+        self.host.update(self._boot)
+        self.session.pop()
+
+    def _boot(self, state):
+        state['stop_at_ok'] = False
+        state['output'] = time.time()
+        state['started'] = state['output'] - OK_OFFSET * self.host.boot
+
+    def command_reset_all(self, arguments, line):
+        self.host.update(self.host.power_on)
+        self.session.pop()
+
+    def command_probe_scsi_all(self, arguments, line):
+        self.probe = ('/pci@300/pci@1/scsi@0\n\n' +
+                      'Target 9\n' +
+                      '  Unit 0   Disk   HGST H101860SFSUN600G A990    ' +
+                      '1172123568 Blocks, 600 GB\n' +
+                      '  SASDeviceName 5000cca0565c5c2c  ' +
+                      'SASAddress 5000cca0565c5c2d  PhyNum 0\n')
+        return self.PROBE
+
+    def command_probe_nvme_all(self, arguments, line):
+        self.probe = ('/pci@301/pci@2/nvme@0\n' +
+                      '        Model Number: Oracle NVMe SSD\n')
+        return self.PROBE
+
+    def command_no_page(self, arguments, line):
+        return ''
+
+    def command_setenv(self, arguments, line):
+        return ''
+
+    def command_set_defaults(self, arguments, line):
+        return 'Setting NVRAM parameters to default values.\n'
+
+    def command_printenv(self, arguments, line):
+        return 'auto-boot?               false                true\n'
+
+
+class ConsoleLogin(Mode):
+    """The console login prompt of the host.
+    """
+
+    def prompt(self):
+        self.session.write(CONSOLE_LOGIN.format(self.host.hostname))
+
+    def line(self, line):
+        if not line:
+            self.prompt()
+            return
+        user = self.session.host_users.get(line)
+        if user is None:
+            self.session.write('Password: \nLogin incorrect\n')
+            self.prompt()
+            return
+        password = Password(self.session, user,
+                            Solaris(self.session, console=True), tries=1)
+        self.session.push(password)
+
+
+class HostConsole(Mode):
+    """The host console started from ILOM. The boot output of the host is
+    written as it happens and the input is handed to OpenBoot or to the
+    console login once the host is up. The escape sequence returns to ILOM.
+    """
+    REFRESH = 0.2
+
+    def __init__(self, session):
+        super(HostConsole, self).__init__(session)
+        self.written = time.time()
+        self.escape = ''
+        self.events = []
+        self.loaded = 0
+
+    def start(self):
+        self.refresh()
+        self.tick()
+
+    def resume(self):
+        # Returning from OpenBoot or Solaris after a boot or a reboot
+        self.written = 0
+        self.refresh()
+        self.tick()
+
+    def refresh(self):
+        state = self.host.load()
+        self.loaded = time.time()
+        self.status = self.host.status(state)
+        self.events = [event for event in self.host.events(state)
+                       if event[0] > self.written]
+
+    def timeout(self):
+        if not self.events:
+            return None
+        return max(self.events[0][0] - time.time(), 0)
+
+    def tick(self):
+        if time.time() - self.loaded > self.REFRESH:
+            self.refresh()
+        now = time.time()
+        while self.events and self.events[0][0] <= now:
+            event_time, status, text = self.events.pop(0)
+            self.session.write(text)
+            self.written = event_time
+            if status == 'OpenBoot Running':
+                self.session.push(OpenBoot(self.session))
+                break
+            elif status == 'Solaris running':
+                self.session.push(ConsoleLogin(self.session))
+                break
+
+    def escaped(self, character):
+        self.escape = (self.escape + character)[-len(ESCAPE):]
+        if self.escape != ESCAPE:
+            return False
+        self.escape = ''
+        while self.session.modes[-1] is not self:
+            self.session.modes.pop()
+        self.session.write('\n\nSerial console stopped.\n\n')
+        self.session.pop()
+        return True
+
+    def feed(self, character):
+        if character in '\r\n':
+            self.refresh()
+            if self.status == 'Solaris running':
+                self.session.push(ConsoleLogin(self.session))
+            elif self.status == 'OpenBoot Running':
+                self.session.push(OpenBoot(self.session))
+
+
+class SerialLogin(Mode):
+    """The serial console of the service processor as served by `ltconsole`.
+    """
+
+    def start(self):
+        self.session.write("[Enter `^Ec?' for help]\n")
+        self.control = ''
+
+    def feed(self, character):
+        self.control = (self.control + character)[-3:]
+        if self.control == CONTROL_E + 'cf':
+            self.session.write('[forced to `rw\' mode]\n')
+        elif self.control == CONTROL_E + 'c.':
+            self.session.write('[disconnect]\n')
+            self.session.exit()
+        elif character == CONTROL_E or self.control[-2:-1] == CONTROL_E:
+            return
+        elif character in '\r\n':
+            self.line(self.buffer)
+            self.buffer = ''
+        elif self.buffer.endswith('#') and character == '.':
+            self.buffer = ''
+        else:
+            self.buffer += character
+            self.session.write(character)
+
+    def line(self, line):
+        self.session.write('\n')
+        if not line:
+            self.session.write('{0}-SP login: '.format(self.host.name))
+            return
+        user = self.session.users.get(line)
+        if user is None:
+            self.session.write('Password: \nLogin incorrect\n')
+            return
+        self.session.push(Password(self.session, user, self.shell(user),
+                                   tries=1))
+
+    def shell(self, user):
+        if user.type == 'sunservice':
+            return SunService(self.session)
+        return ILOM(self.session)
+
+    def resume(self):
+        self.session.write('\n{0}-SP login: '.format(self.host.name))
+
+
+def find(address):
+    """Finds the subsystem with the address or name in the systems files.
+
+    :param str address: The address or name of the subsystem.
+    :returns: The (system, subsystem) tuple.
+    :rtype: tuple
+    :raises: SimulatorError
+    """
+    from pytest.setup import parse_system, resolve_systems
+    names = sorted(os.listdir(PYTEST_SYSTEMS_PATH))
+    resolve_systems([os.path.join(PYTEST_SYSTEMS_PATH, name)
+                     for name in names])
+    for name in names:
+        try:
+            system = parse_system(os.path.join(PYTEST_SYSTEMS_PATH, name),
+                                  log=False)
+        except Exception:
+            continue
+        for subsystem in system.subsystems.values():
+            if address in [subsystem.address, subsystem.name]:
+                return (system, subsystem)
+    raise SimulatorError('No subsystem with address ' + address)
+
+
+def main():
+    usage = ('Usage: %prog [OPTION]... ssh [-o OPTION]... -l USER ADDRESS\n' +
+             '       %prog [OPTION]... ltconsole NAME')
+    parser = OptionParser(usage=usage)
+    parser.disable_interspersed_args()
+    parser.add_option('--latency', type='float', dest='latency',
+                      default=LATENCY,
+                      help='seconds before the output of each command')
+    parser.add_option('--volume', type='int', dest='volume', default=VOLUME,
+                      help='extra lines of POST and boot output')
+    parser.add_option('--boot', type='float', dest='boot', default=BOOT,
+                      help='seconds from power on to the login prompt')
+    parser.add_option('--state', dest='state',
+                      help='state file shared by the simulator processes')
+    options, vargs = parser.parse_args()
+    if not vargs or vargs[0] not in ['ssh', 'ltconsole']:
+        parser.print_help()
+        sys.exit(FAILED)
+    command = vargs[0]
+    ssh_parser = OptionParser()
+    ssh_parser.add_option('-o', action='append')
+    ssh_parser.add_option('-l', dest='user')
+    ssh_options, ssh_vargs = ssh_parser.parse_args(vargs[1:])
+    if not ssh_vargs:
+        parser.print_help()
+        sys.exit(FAILED)
+    address = ssh_vargs[0]
+    try:
+        system, subsystem = find(address)
+    except SimulatorError as e:
+        sys.stdout.write('ssh: Could not resolve hostname {0}: '.format(address) +
+                         'Name or service not known\r\n')
+        sys.exit(255)
+    hostname = system.name
+    if 'HOST' in system.subsystems:
+        hostname = system.subsystems['HOST'].name
+    host = Host(system.name, hostname, boot=options.boot,
+                volume=options.volume, path=options.state)
+    session = Session(host, latency=options.latency)
+    session.users = subsystem.users
+    session.host_users = {}
+    if 'HOST' in system.subsystems:
+        session.host_users = system.subsystems['HOST'].users
+    if command == 'ltconsole':
+        session.push(SerialLogin(session))
+    else:
+        user = subsystem.users.get(ssh_options.user)
+        if user is None:
+            sys.stdout.write('Permission denied (publickey).\r\n')
+            sys.exit(255)
+        if user.type == 'solaris':
+            state = host.load()
+            if host.status(state) != 'Solaris running':
+                sys.stdout.write('ssh: connect to host {0} '.format(address) +
+                                 'port 22: Connection refused\r\n')
+                sys.exit(255)
+            shell = Solaris(session)
+        elif user.type == 'sunservice':
+            shell = SunService(session)
+        else:
+            shell = ILOM(session)
+        session.push(Password(session, user, shell))
+    sys.exit(session.run())
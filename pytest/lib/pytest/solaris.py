@@ -3,11 +3,10 @@ This module provides Solaris funcionality.
 """
 
 import re
-import time
 import logging
 from pexpect import TIMEOUT as TimeoutError
 from pytest.openboot import stop_console, OpenBootError, PROMPT
-from pytest.globals import log_empty, debug_logger, file_logger
+from pytest.globals import log_empty, debug_logger, file_logger, sleep
 
 
 REBOOT_TIMEOUT = 600
@@ -83,9 +82,11 @@ def reboot(self, login=True, log=True, timeout=REBOOT_TIMEOUT):
         raise SolarisError('Must be in console')
     if log:
         logging.info('Starting reboot')
+    self.start_timeline('reboot')
     self.sendline('reboot')
     login_list = ['(?i)Console Login:', PROMPT, TimeoutError]
     output = self.sync(login_list, timeout=timeout)
+    self.stop_timeline(log=log)
     log_empty(output, level=logging.INFO,
               logger=[debug_logger, file_logger])
     if self.match_index == 2:
@@ -185,4 +186,4 @@ def permit_root_ssh(self):
     self.sendline(PERMIT_SSH_CMD)
     self.sync(debug=False)
     self.sendcmd('svcadm restart ssh')
-    time.sleep(10)
+    sleep(10)
@@ -8,8 +8,9 @@ import signal
 import inspect
 import logging
 import traceback
-from Queue import Queue
-from pytest.globals import PASS, FAIL, ISSUE, ABORT, LockError
+from Queue import Queue, Empty
+from pytest import events
+from pytest.globals import PASS, FAIL, ISSUE, ABORT, STOP, LockError
 
 
 #: The list of class names that should be run by default. The tests are run in
@@ -97,6 +98,7 @@ class Test(object):
         self.critical = logging.critical
         self.log = logging.log
         self.info_lock = None
+        self.info_counters = None
         signal.signal(signal.SIGUSR1, self.__handle)
 
     def abort(self, message='', stop=False, clean=True, testcase_clean=True):
@@ -112,6 +114,8 @@ class Test(object):
         self.testcase_clean = testcase_clean
         self.aborted_count += 1
         self.__upload('abort')
+        STOP.set()
+        events.emit('abort', message=message)
         logging.log(ABORT, message)
         if message:
             raise TestError(message)
@@ -163,7 +167,9 @@ class Test(object):
 
     def handle(self, object):
         """Placeholder method. This is always called when a SIGUSR1 signal is
-        received.
+        received. If no signaler was queued, the object is `None` and the
+        waits of the testcase were stopped with
+        :data:`~pytest.globals.STOP`.
         """
 
     def __state(self, message='', stop=False, clean=True, testcase_clean=True):
@@ -193,21 +199,23 @@ class Test(object):
         if state == 'passed':
             self.passed_count += 1
             self.current_passed_count += 1
-            prefix = '[{0}] [No. {1}]'.format(caller, self.current_passed_count)
+            number = self.current_passed_count
             level = PASS
         elif state == 'failed':
             self.failed_count += 1
             self.current_failed_count += 1
-            prefix = '[{0}] [No. {1}]'.format(caller, self.current_failed_count)
+            number = self.current_failed_count
             level = FAIL
         elif state == 'issue':
             self.issue_count += 1
             self.current_issue_count += 1
-            prefix = '[{0}] [No. {1}]'.format(caller, self.current_issue_count)
+            number = self.current_issue_count
             level = ISSUE
         else:
             raise TestError('Invalid state')
+        prefix = '[{0}] [No. {1}]'.format(caller, number)
         self.__upload(state)
+        events.emit(state, caller=caller, number=number, message=message)
         if message:
             result = ' '.join([prefix, message])
             logging.log(level, result)
@@ -217,7 +225,9 @@ class Test(object):
             raise StopTestcase
 
     def __upload(self, state):
-        if self.info_lock is not None:
+        if self.info_counters is not None:
+            self.info_counters.increment(state)
+        elif self.info_lock is not None:
             try:
                 info_value = self.info_lock.download(exit=False)
             except LockError:
@@ -232,7 +242,12 @@ class Test(object):
 
     def __handle(self, signal, frame):
         try:
-            signaler = self.signalers.get()
+            signaler = self.signalers.get_nowait()
+        except Empty:
+            # A SIGUSR1 without a signaler comes from an operator
+            logging.info('Stopping the waits of the testcase')
+            STOP.set()
+            signaler = None
         except Exception as e:
             logging.critical('[handle] ' + str_error(e))
             signaler = None
@@ -0,0 +1,134 @@
+"""
+This module provides boot timelines of console output.
+"""
+
+import re
+from pytest.globals import monotonic, add_metric, str_table
+
+
+#: The boot milestones in the order they appear on the console. Each milestone
+#: is reached by the first line matching its pattern after the previous
+#: milestone. Milestones can be skipped, for example the `ok` prompt is not
+#: shown when the host boots with auto-boot.
+MILESTONES = [('POST', r'\d+:\d+:\d+>'),
+              ('Hypervisor', r'Hypervisor version'),
+              ('OpenBoot', r'OpenBoot \d'),
+              ('ok', r'\{\d+\} ok'),
+              ('Solaris', r'SunOS Release'),
+              ('login', r'(?i)console login:')]
+POWER_ON = 'power-on'
+
+
+class Timeline(object):
+    """Timestamps console output as it is read and marks the boot milestones
+    found in it. The output is timestamped when the connection reads it, so a
+    milestone is only as accurate as the connection is busy expecting. Only
+    the milestones and the line being read are kept, not the output.
+
+    :ivar float start: The monotonic time of the timeline start.
+    :ivar list milestones: The list of (name, time) tuples of the reached
+        milestones.
+    :param str name: The name of the milestone at the start of the timeline.
+    :param float start: The monotonic time of the start. If this is `None`,
+        the current time is used.
+    """
+
+    def __init__(self, name=POWER_ON, start=None):
+        if start is None:
+            start = monotonic()
+        self.start = start
+        self.milestones = [(name, start)]
+        self.partial = ''
+        self.partial_time = None
+        self.patterns = [(milestone, re.compile(pattern))
+                         for milestone, pattern in MILESTONES]
+        names = [milestone for milestone, pattern in MILESTONES]
+        if name in names:
+            self.patterns = self.patterns[names.index(name) + 1:]
+
+    def feed(self, data, now=None):
+        """Adds output to the timeline. Lines are timestamped with the time
+        their first character was read.
+
+        :param str data: The output.
+        :param float now: The monotonic time the output was read. If this is
+            `None`, the current time is used.
+        """
+        if now is None:
+            now = monotonic()
+        lines = data.replace('\r', '').split('\n')
+        for line in lines[:-1]:
+            if not self.partial:
+                self.partial_time = now
+            line = self.partial + line
+            self.partial = ''
+            self.search(line, self.partial_time)
+        if lines[-1]:
+            if not self.partial:
+                self.partial_time = now
+            self.partial += lines[-1]
+            self.search(self.partial, self.partial_time)
+
+    def search(self, line, line_time):
+        """Marks the first milestone whose pattern matches the line. Partial
+        lines are searched as well so that prompts are found without a
+        newline.
+
+        :param str line: The line.
+        :param float line_time: The monotonic time the line was read.
+        """
+        for i, (name, pattern) in enumerate(self.patterns):
+            if pattern.search(line):
+                self.milestones.append((name, line_time))
+                self.patterns = self.patterns[i + 1:]
+                return
+
+    def reached(self, name):
+        """Returns the time of a milestone relative to the start.
+
+        :param str name: The name of the milestone.
+        :returns: The seconds since the start or `None` if the milestone was
+            not reached.
+        :rtype: float
+        """
+        for milestone, milestone_time in self.milestones:
+            if milestone == name:
+                return milestone_time - self.start
+        return None
+
+    def phases(self, end=None):
+        """Returns the boot phases. A phase starts at a milestone and lasts
+        until the next milestone. The last phase lasts until the end.
+
+        :param float end: The monotonic time of the end. If this is `None`,
+            the last milestone ends the timeline.
+        :returns: The list of (name, start, duration) tuples where start is
+            relative to the timeline start.
+        :rtype: list
+        """
+        times = [milestone_time for milestone, milestone_time
+                 in self.milestones]
+        if end is not None:
+            times.append(end)
+        phases = []
+        for i in range(len(times) - 1):
+            phases.append((self.milestones[i][0], times[i] - self.start,
+                           times[i + 1] - times[i]))
+        return phases
+
+    def record(self, system=None, end=None):
+        """Records the duration of every phase in the run metrics under
+        `boot phase <name>`.
+
+        :param str system: The name of the system.
+        :param float end: The monotonic time of the end.
+        """
+        for name, start, duration in self.phases(end):
+            add_metric('boot phase ' + name, duration, system)
+
+    def __str__(self):
+        table = [('Phase', 'Start', 'Duration')]
+        for name, start, duration in self.phases():
+            table.append((name, '{0:.1f}'.format(start),
+                          '{0:.1f}'.format(duration)))
+        return str_table(table)
@@ -0,0 +1,450 @@
+"""
+This module provides the transcripts of connections, which record every byte
+sent and read with its time, the players that replay them in place of the
+systems, and the `transcript` command line that exports them.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import codecs
+import struct
+import itertools
+import logging
+import threading
+from optparse import OptionParser
+from pytest import events
+from pytest.globals import monotonic, check_make_dir
+
+
+MAGIC = 'PYTESTTS'
+VERSION = 1
+#: The magic, version, wall clock and monotonic times of the start and the
+#: length of the name of the connection, which follows the header.
+HEADER = struct.Struct('<8sIddH')
+#: The microseconds since the start, the direction and the length of the
+#: data, which follows the record.
+RECORD = struct.Struct('<QcI')
+READ = 'r'
+SEND = 's'
+#: The data recorded instead of a password sent to a connection.
+REDACTED = '<password>'
+SUFFIX = '.transcript'
+TIME = '%Y/%m/%d %H:%M:%S'
+#: The directory transcripts are written to or `None` if connections are not
+#: recorded.
+TRANSCRIPT_PATH = None
+#: The numbers that keep the files of connections with the same name apart.
+COUNT = itertools.count(1)
+#: The paths of the transcripts left to replay by connection name in the
+#: order they were recorded, or `None` if connections are not replayed.
+REPLAYS = None
+#: The keyword arguments of the players of replayed connections.
+REPLAY_OPTIONS = {}
+TEXT = 'text'
+ASCIICAST = 'asciicast'
+FORMATS = [TEXT, ASCIICAST]
+
+
+class TranscriptError(Exception):
+    pass
+
+
+class DivergenceError(TranscriptError):
+    """Raised when a replayed connection is sent something else than what the
+    transcript recorded.
+    """
+
+
+class Transcript(object):
+    """Bytes sent to and read from a connection appended to a binary file.
+    The file starts with a header of :data:`HEADER` and the name of the
+    connection. Every chunk is a record of :data:`RECORD`, with the time in
+    microseconds since the start, followed by the data. A record is written
+    with a single write to a file opened for appending, so the transcript of
+    a crashed run is complete up to the crash.
+
+    :param str path: The path of the file.
+    :param str name: The name of the connection.
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.start = monotonic()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        self.lock = threading.Lock()
+        os.write(self.fd, HEADER.pack(MAGIC, VERSION, time.time(), self.start,
+                                      len(name)) + name)
+
+    def write(self, direction, data):
+        """Appends a chunk.
+
+        :param str direction: :data:`READ` or :data:`SEND`.
+        :param str data: The bytes.
+        """
+        if not data:
+            return
+        offset = int((monotonic() - self.start) * 1000000)
+        record = RECORD.pack(offset, direction, len(data)) + data
+        with self.lock:
+            os.write(self.fd, record)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Player(object):
+    """Transcript served in place of a system. The data read is returned in
+    the order it was recorded, but only up to the next data sent: the output
+    that followed a command is not read before the command is sent again.
+    Every send is compared with the next data sent in the transcript, and a
+    difference is a divergence. Without delays, output is returned as fast as
+    it is read and a read with nothing left before the next send times out
+    at once, the way the recorded read timed out.
+
+    :ivar list divergences: The messages of the divergences.
+    :param str path: The path of the transcript.
+    :param bool delay: The flag for returning output no sooner after a send
+        than it was recorded, and for waiting out the timeouts.
+    :param bool strict: The flag for raising :class:`DivergenceError` at the
+        first divergence. Otherwise the divergence is kept and the replay
+        goes on as if the recorded data was sent.
+    """
+
+    def __init__(self, path, delay=False, strict=True):
+        header, self.records = read_transcript(path)
+        self.path = path
+        self.name = header['name']
+        self.delay = delay
+        self.strict = strict
+        self.divergences = []
+        self.index = 0
+        self.sent = 0
+        self.pending = ''
+        self.origin = monotonic()
+
+    def read(self, size, timeout=None):
+        """Reads the output.
+
+        :param int size: The most bytes to read.
+        :param float timeout: The seconds to wait for the output or `None`
+            to wait for as long as it takes.
+        :returns: The output or `None` if the read times out.
+        :rtype: str
+        """
+        if not self.pending:
+            records = self.records
+            while (self.index < len(records) and
+                   records[self.index][1] == SEND):
+                self.index += 1
+            if (self.index >= len(records) or
+                self.index > self.next_send()):
+                if self.delay and timeout:
+                    time.sleep(timeout)
+                return None
+            seconds, direction, data = records[self.index]
+            if self.delay:
+                wait = self.origin + seconds - monotonic()
+                if timeout is not None and wait > timeout:
+                    time.sleep(max(timeout, 0))
+                    return None
+                if wait > 0:
+                    time.sleep(wait)
+            self.index += 1
+            self.pending = data
+        data = self.pending[:size]
+        self.pending = self.pending[size:]
+        return data
+
+    def next_send(self):
+        """Gets the index of the next record of data sent that was not sent
+        again.
+
+        :rtype: int
+        """
+        for i in range(self.sent, len(self.records)):
+            if self.records[i][1] == SEND:
+                return i
+        return len(self.records)
+
+    def send(self, data):
+        """Compares data sent with the next data sent in the transcript.
+
+        :param str data: The data, with a password as :data:`REDACTED`.
+        :raises: :class:`DivergenceError` if the data differs and the player
+            is strict.
+        """
+        if not data:
+            # Empty data is not recorded
+            return
+        i = self.next_send()
+        if i < len(self.records):
+            seconds, direction, expected = self.records[i]
+            self.sent = i + 1
+            self.origin = monotonic() - seconds
+            if data == expected:
+                return
+            message = ('{0} sent {1!r} where {2!r} was recorded at {3:.6f} '
+                       'seconds'.format(self.name, data, expected, seconds))
+        else:
+            message = '{0} sent {1!r} after the transcript ended'.format(
+                      self.name, data)
+        self.diverge(message)
+
+    def finish(self):
+        """Checks that everything recorded was sent again. This is called
+        when the connection is closed, so the divergence is never raised.
+        """
+        i = self.next_send()
+        if i < len(self.records):
+            self.sent = len(self.records)
+            self.diverge('{0} closed before sending {1!r} recorded at {2:.6f} '
+                         'seconds'.format(self.name, self.records[i][2],
+                                          self.records[i][0]), strict=False)
+
+    def diverge(self, message, strict=None):
+        """Logs a divergence and raises it if the player is strict.
+
+        :param str message: The message of the divergence.
+        :param bool strict: The flag for raising the divergence. If this is
+            `None`, the flag of the player is used.
+        """
+        self.divergences.append(message)
+        logging.error('Divergence from ' + self.path + ': ' + message)
+        events.emit('replay divergence', connection=self.name,
+                    transcript=self.path, message=message)
+        if strict is None:
+            strict = self.strict
+        if strict:
+            raise DivergenceError(message)
+
+
+def start_transcripts(path):
+    """Starts recording the connections opened from now on to a directory.
+
+    :param str path: The directory, which is made if it does not exist.
+    """
+    global TRANSCRIPT_PATH
+    check_make_dir(path, error=True)
+    TRANSCRIPT_PATH = path
+
+
+def stop_transcripts():
+    """Stops recording the connections opened from now on.
+    """
+    global TRANSCRIPT_PATH
+    TRANSCRIPT_PATH = None
+
+
+def open_transcript(name):
+    """Opens the transcript of a connection if transcripts are recorded. The
+    file is named after the connection, the time it was opened, the process
+    and a number.
+
+    :param str name: The name of the connection.
+    :returns: The transcript or `None`.
+    :rtype: Transcript
+    """
+    if TRANSCRIPT_PATH is None:
+        return None
+    file_name = '{0}_{1}_{2}_{3}{4}'.format(re.sub(r'[^\w.@-]', '_', name),
+                                           time.strftime('%Y-%m-%d_%H-%M-%S'),
+                                           os.getpid(), next(COUNT), SUFFIX)
+    path = os.path.join(TRANSCRIPT_PATH, file_name)
+    return Transcript(path, name)
+
+
+def start_replay(path, delay=False, strict=True):
+    """Starts replaying the transcripts of a directory in place of the
+    systems. The connections opened from now on are served the transcripts
+    recorded under their name in the order they were recorded.
+
+    :param str path: The directory of the transcripts.
+    :param bool delay: See :class:`Player`.
+    :param bool strict: See :class:`Player`.
+    """
+    global REPLAYS
+    transcripts = []
+    for file_name in os.listdir(path):
+        if not file_name.endswith(SUFFIX):
+            continue
+        file_path = os.path.join(path, file_name)
+        header = read_transcript(file_path)[0]
+        number = file_name[:-len(SUFFIX)].rsplit('_', 1)[-1]
+        number = int(number) if number.isdigit() else 0
+        transcripts.append((header['time'], number, header['name'],
+                            file_path))
+    REPLAYS = {}
+    for wall, number, name, file_path in sorted(transcripts):
+        REPLAYS.setdefault(name, []).append(file_path)
+    REPLAY_OPTIONS.clear()
+    REPLAY_OPTIONS.update(delay=delay, strict=strict)
+
+
+def stop_replay():
+    """Stops replaying transcripts.
+    """
+    global REPLAYS
+    REPLAYS = None
+    REPLAY_OPTIONS.clear()
+
+
+def open_player(name):
+    """Opens the player of the next transcript of a connection if transcripts
+    are replayed.
+
+    :param str name: The name of the connection.
+    :returns: The player or `None`.
+    :rtype: Player
+    :raises: :class:`TranscriptError` if no transcript of the connection is
+        left.
+    """
+    if REPLAYS is None:
+        return None
+    paths = REPLAYS.get(name)
+    if not paths:
+        raise TranscriptError('No transcript left to replay for ' + name)
+    return Player(paths.pop(0), **REPLAY_OPTIONS)
+
+
+def read_transcript(path):
+    """Reads a transcript. A record cut off by a crash is ignored.
+
+    :param str path: The path of the file.
+    :returns: The header as a dictionary with `name`, `time` and `monotonic`,
+        and the list of (seconds since the start, direction, data) records.
+    :rtype: tuple
+    :raises: :class:`TranscriptError` if the file is not a transcript of this
+        version.
+    """
+    with open(path, 'rb') as transcript_file:
+        data = transcript_file.read()
+    if len(data) < HEADER.size:
+        raise TranscriptError('Not a transcript: ' + path)
+    magic, version, wall, start, length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise TranscriptError('Not a version {0} transcript: {1}'.format(
+                              VERSION, path))
+    offset = HEADER.size + length
+    header = {'name': data[HEADER.size:offset], 'time': wall,
+              'monotonic': start}
+    records = []
+    while offset + RECORD.size <= len(data):
+        micros, direction, size = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + size > len(data):
+            break
+        records.append((micros / 1000000.0, direction,
+                        data[offset:offset + size]))
+        offset += size
+    return header, records
+
+
+def select_records(records, start=None, end=None, direction=None):
+    """Selects the records of a time range and direction.
+
+    :param list records: The records of :func:`read_transcript`.
+    :param float start: The earliest seconds since the start or `None`.
+    :param float end: The latest seconds since the start or `None`.
+    :param str direction: :data:`READ`, :data:`SEND` or `None` for both.
+    :returns: The selected records.
+    :rtype: list
+    """
+    return [record for record in records
+            if (start is None or record[0] >= start) and
+            (end is None or record[0] <= end) and
+            (direction is None or record[1] == direction)]
+
+
+def export_text(header, records, output):
+    """Writes records as lines of the seconds since the start, the seconds
+    since the previous record, the direction and the escaped data.
+
+    :param dict header: The header of :func:`read_transcript`.
+    :param list records: The records.
+    :param output: The file to write to.
+    """
+    started = time.strftime(TIME, time.localtime(header['time']))
+    output.write('# {0} started {1}\n'.format(header['name'], started))
+    previous = None
+    for seconds, direction, data in records:
+        delta = 0.0 if previous is None else seconds - previous
+        previous = seconds
+        output.write('{0:14.6f} {1:+12.6f} {2} {3}\n'.format(
+                     seconds, delta, direction, repr(data)))
+
+
+def export_asciicast(header, records, output, width=80, height=24):
+    """Writes records as an asciicast version 2 file, which terminal players
+    replay with the recorded timing. The times start at the first record and
+    the data read is the output of the terminal.
+
+    :param dict header: The header of :func:`read_transcript`.
+    :param list records: The records.
+    :param output: The file to write to.
+    """
+    first = records[0][0] if records else 0.0
+    output.write(json.dumps({'version': 2, 'width': width, 'height': height,
+                             'timestamp': int(header['time'] + first),
+                             'title': header['name']}) + '\n')
+    decoders = {}
+    for seconds, direction, data in records:
+        decoder = decoders.get(direction)
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            decoders[direction] = decoder
+        text = decoder.decode(data)
+        if not text:
+            continue
+        kind = 'o' if direction == READ else 'i'
+        output.write(json.dumps([round(seconds - first, 6), kind, text]) +
+                     '\n')
+
+
+def main():
+    usage = 'Usage: %prog [OPTION]... TRANSCRIPT'
+    parser = OptionParser(usage=usage,
+                          description='Exports the records of a connection ' +
+                          'transcript.')
+    parser.add_option('-f', '--format', action='store', dest='format',
+                      choices=FORMATS, type='choice', default=TEXT,
+                      help='exports as ' + ' or '.join(FORMATS) +
+                           ' [default: %default]')
+    parser.add_option('--start', action='store', type='float', dest='start',
+                      metavar='SECONDS',
+                      help='exports the records at or after this many ' +
+                           'seconds since the start of the transcript')
+    parser.add_option('--end', action='store', type='float', dest='end',
+                      metavar='SECONDS',
+                      help='exports the records at or before this many ' +
+                           'seconds since the start of the transcript')
+    parser.add_option('--read', action='store_const', const=READ,
+                      dest='direction', help='exports only the bytes read')
+    parser.add_option('--sent', action='store_const', const=SEND,
+                      dest='direction', help='exports only the bytes sent')
+    parser.add_option('-o', '--output', action='store', dest='output',
+                      metavar='FILE',
+                      help='writes to a file instead of standard output')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('one transcript required')
+    try:
+        header, records = read_transcript(args[0])
+    except (IOError, TranscriptError) as e:
+        parser.error(str(e))
+    records = select_records(records, options.start, options.end,
+                             options.direction)
+    output = sys.stdout
+    if options.output is not None:
+        output = open(options.output, 'w')
+    try:
+        if options.format == ASCIICAST:
+            export_asciicast(header, records, output)
+        else:
+            export_text(header, records, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
@@ -4,15 +4,16 @@
 """
 """
 
-import time
 import logging
 from pytest.test import Test
 from pytest.environment import get_system
-from pytest.globals import str_error
+from pytest.globals import str_error, sleep, wait_until
 from pytest.ilom import ILOMError
 from pexpect import TIMEOUT as TimeoutError
 
 CMD_TIMEOUT = 120
+TCSD_TIMEOUT = 20
+TCSD_POLL = 2
 OWNER_PIN = '87654321'
 ALT_OWNER_PIN = '12345678'
 MIGRATION_PIN = '12345678'
@@ -82,15 +83,14 @@ class FPGA(Test):
                 except:
                     self.issue('Failed to connect to Solaris')
             solaris.sendcmd('svcadm disable tcsd', log=True)
-            for i in range(10):
-                if 'disable' in self.ilom.sendcmd('svcs tcsd', log=True):
-                    break
-                time.sleep(2)
-            if i == 9:
+            if not wait_for_tcsd(self, self.ilom, 'disable'):
                 self.abort('tcsd not disable')
             post_status = True
             self.ilom.stop_system(force=True)
-            self.ilom.show('/HOST/', 'status')
+            state = self.ilom.wait_for_power_state('/HOST', 'Powered Off')
+            if state != 'Powered Off':
+                self.abort('Timed out in powering off /HOST, ' +
+                           'which is {0}'.format(state))
             cmd_str = 'fpga tpm {0}'.format(p[0])
             self.sunservice.sendcmd(cmd_str, log=True)
             status = self.sunservice.sendcmd('fpga tpm status',
@@ -109,7 +109,7 @@ class FPGA(Test):
             # get output from console
             (s_out, b_out, e) = self.ilom.start_system(console=True,
                                           user='root', verbose=False)
-            for line in s_out.splitlines():
+            for line in s_out.find('TPM'):
                 if 'TPMinitialized' in line.replace(' ', ''):
                     continue
                 if 'NOTICE:CurrentTPM' in line.replace(' ', '') or \
@@ -121,21 +121,13 @@ class FPGA(Test):
                         post_status = False
             if post_status == False:
                 self.ilom.sendcmd('svcadm disable tcsd', log=True)
-                for i in range(10):
-                    if 'disable' in self.ilom.sendcmd('svcs tcsd', log=True):
-                        break
-                    time.sleep(2)
-                if i == 9:
+                if not wait_for_tcsd(self, self.ilom, 'disable'):
                     self.issue('tcsd not disable')
                 self.ilom.logout()
                 self.ilom.stop_console()
                 continue
             self.ilom.sendcmd('svcadm disable tcsd', log=True)
-            for i in range(10):
-                if 'disable' in self.ilom.sendcmd('svcs tcsd', log=True):
-                    break
-                time.sleep(2)
-            if i == 9:
+            if not wait_for_tcsd(self, self.ilom, 'disable'):
                 self.issue('tcsd not disable')
             self.ilom.logout()
             self.ilom.stop_console()
@@ -158,7 +150,7 @@ class FPGA(Test):
         if ret:
             self.failed('TPM mode is {0}'.format(ret), stop=True)
         (s_out, b_out, e) = self.ilom.start_system(console=True, user='root')
-        for line in s_out.splitlines():
+        for line in s_out.find('TPM'):
             if 'TPMinitialized' in line.replace(' ', ''):
                 continue
             if 'NOTICE:CurrentTPM' in line.replace(' ', '') or \
@@ -169,12 +161,7 @@ class FPGA(Test):
                     break
         self.ilom.sendcmd('svcs tcsd', log=True)
         self.ilom.sendcmd('svcadm enable tcsd', log=True)
-        for i in range(10):
-            self.info("Polling tcsd status")
-            if 'online' in self.ilom.sendcmd('svcs tcsd', log=True):
-                break
-            time.sleep(2)
-        if i == 9:
+        if not wait_for_tcsd(self, self.ilom, 'online', "Polling tcsd status"):
             self.failed('tcsd not online', stop=True)
         else:
             self.passed("tcsd is online")
@@ -198,12 +185,7 @@ class FPGA(Test):
             except:
                 self.issue('Failed to connect to Solaris')
         solaris.sendcmd('svcadm disable tcsd', log=True)
-        for i in range(10):
-            self.info("Polling tcsd status")
-            if 'disable' in solaris.sendcmd('svcs tcsd', log=True):
-                break
-            time.sleep(2)
-        if i == 9:
+        if not wait_for_tcsd(self, solaris, 'disable', "Polling tcsd status"):
             self.issue('tcsd not disable', stop=True)
         else:
             self.info("tcsd is disable")
@@ -457,14 +439,9 @@ class TPMADM(Test):
         #solaris.sendcmd('rm -rf /var/tpm/system/tpm-migration.dat', log=True)
         #solaris.sendcmd('rm -rf /var/tpm/system/tpm-migration.key', log=True)
         solaris.sendcmd('svcadm disable tcsd', log=True)
-        for i in range(10):
-            self.info("Polling svcs tcsd")
-            if 'disable' in solaris.sendcmd('svcs tcsd', log=True):
-                break
-            time.sleep(2)
-        if i == 9:
+        if not wait_for_tcsd(self, solaris, 'disable', "Polling svcs tcsd"):
             self.abort('tcsd not disabled')
-        time.sleep(5)   
+        sleep(5)   
         solaris.close()
 
         # Oats says to check if forceclear is at default of false.
@@ -481,7 +458,7 @@ class TPMADM(Test):
 
         # Bring system up and look for forceclear message
         (s_out, b_out, e) = self.ilom.start_system(console=True, user='root')
-        for line in s_out.splitlines():
+        for line in s_out.find('TPM'):
             if 'TPM ForceClear issued.Resetting TPM ForceClear' \
                                                     in line.replace(' ', ''):
                 found = True
@@ -657,11 +634,20 @@ def tpm_auth(self, primary_pin, alt_pin):
         elif ('fail' in string.lower() or 'error' in string.lower()):
             self.issue('tpmadm auth failed:' + string)
 
+def wait_for_tcsd(self, conn, state, message=None, timeout=TCSD_TIMEOUT):
+    # polls svcs tcsd until it shows the state, the timeout passes or the
+    # waits of the testcase are stopped
+    def check():
+        if message:
+            self.info(message)
+        return state in conn.sendcmd('svcs tcsd', log=True)
+    return wait_until(check, timeout, TCSD_POLL)
+
+
 def set_and_verify(self, target, **values):
-    self.ilom.set(target, **values)
-    prop_dict = self.ilom.show(target, log=True).properties
+    results = self.ilom.set_many({target: values})[target]
     for key, val in values.iteritems():
-        if prop_dict[key].lower() != val.lower():
+        if not results[key]:
             return val
     return 0
 
@@ -683,12 +669,7 @@ def tpm_enable(self):
         except:
             self.issue('Failed to connect to Solaris', stop=True)
     solaris.sendcmd("svcadm disable tcsd", log=True)
-    for i in range(10):
-        self.info("Polling tcsd status")
-        if 'disable' in solaris.sendcmd('svcs tcsd', log=True):
-            break
-        time.sleep(2)
-    if i == 9:
+    if not wait_for_tcsd(self, solaris, 'disable', "Polling tcsd status"):
         self.issue('tcsd not disable')
     else:
         self.info("tcsd is disable")
@@ -706,7 +687,7 @@ def tpm_enable(self):
     if ret:
         self.issue('TPM mode is {0}'.format(ret), stop=True)
     (s_out, b_out, e) = self.ilom.start_system(console=True, user='root')
-    for line in s_out.splitlines():
+    for line in s_out.find('TPM'):
         if 'TPMinitialized' in line.replace(' ', ''):
             continue
         if 'NOTICE:CurrentTPM' in line.replace(' ', '') or \
@@ -717,13 +698,8 @@ def tpm_enable(self):
                 break
     self.ilom.sendcmd('svcs tcsd', log=True)
     self.ilom.sendcmd('svcadm enable tcsd', log=True)
-    for i in range(10):
-        self.info("Polling tcsd status")
-        if 'online' in self.ilom.sendcmd('svcs tcsd', log=True):
-            online = True
-            break
-        time.sleep(2)
-    if i == 9:
+    online = wait_for_tcsd(self, self.ilom, 'online', "Polling tcsd status")
+    if not online:
         self.issue('tcsd not online', stop=True)
     else:
         self.info("tcsd is online")
@@ -742,7 +718,10 @@ def tpm_disable(self):
     # failures abort the testcase.
 
     self.ilom.stop_system(force=True)
-    self.ilom.show('/HOST/', 'status')
+    state = self.ilom.wait_for_power_state('/HOST', 'Powered Off')
+    if state != 'Powered Off':
+        self.abort('Timed out in powering off /HOST, ' +
+                   'which is {0}'.format(state))
     cmd_str = 'fpga tpm disable'
     self.sunservice.sendcmd(cmd_str, log=True)
     status = self.sunservice.sendcmd('fpga tpm status', log=True).strip()
@@ -755,7 +734,7 @@ def tpm_disable(self):
     if ret:
        self.issue('TPM forceclear is {0}'.format(ret))
     (s_out, b_out, e) = self.ilom.start_system(console=True, user='root')
-    for line in s_out.splitlines():
+    for line in s_out.find('TPM'):
         if 'NOTICE:CurrentTPM' in line.replace(' ', '') or \
            'WARNING:TPM' in line.replace(' ', ''):
             if 'disabled' not in line.lower():
@@ -763,12 +742,7 @@ def tpm_disable(self):
                 self.abort('POST output incorrect\n' +
                            line[line.index('>')+2:])
                 break
-    for i in range(10):
-        self.info("Polling tcsd status")
-        if 'disable' in self.ilom.sendcmd('svcs tcsd', log=True):
-            break
-        time.sleep(2)
-    if i == 9:
+    if not wait_for_tcsd(self, self.ilom, 'disable', "Polling tcsd status"):
         self.issue('tcsd not disable')
     else:
         self.info("tcsd is disable")
@@ -812,8 +786,7 @@ def factory_defaults(self, force=False):
         except:
             self.issue('Failed to connect to Solaris')
     solaris.sendcmd('svcadm enable tcsd', log=True)
-    time.sleep(20) 
-    if 'online' not in solaris.sendcmd('svcs tcsd', log=True):
+    if not wait_for_tcsd(self, solaris, 'online'):
         online = tpm_enable(self)
         if not online:
             self.abort('can not get tcsd online')
@@ -841,13 +814,8 @@ def factory_defaults(self, force=False):
 
     #added because the after the next reboot the system came up disabled
     solaris.sendcmd('svcadm disable tcsd', log=True)
-    time.sleep(20)
-    for i in range(10):
-        self.info("Polling tcsd status")
-        if 'disable' in solaris.sendcmd('svcs tcsd', log=True):
-            break
-        time.sleep(2)
-    if i == 9:
+    if not wait_for_tcsd(self, solaris, 'disable', "Polling tcsd status",
+                         timeout=2 * TCSD_TIMEOUT):
         self.info('tcsd not set to disable')
     solaris.close()
     if reset_flag or force:
@@ -874,11 +842,7 @@ def tpm_init(self):
     self.info("Initialize tpm with tpmadm init")
     solaris.sendcmd('svcadm enable tcsd', log=True)
     self.info("Polling svcs tcsd")
-    for i in range(10):
-        if 'online' in solaris.sendcmd('svcs tcsd', log=True):
-            break
-        time.sleep(2)
-    if i == 9:
+    if not wait_for_tcsd(self, solaris, 'online'):
         self.issue('tcsd not online')
         solaris.close()
         return 1